@@ -0,0 +1,177 @@
+#
+# T.I.M.E Stories card generator
+# Copyright (C) Randall Frank
+# See LICENSE for details
+#
+# End to end build timings on synthetic decks: Deck.save, Deck.load,
+# Renderer.render_deck, generate_pdf and generate_tts, for a set of deck shapes
+# (scenarios).  The results are written as JSON and can be compared with the
+# results of an earlier run.
+#
+#   python benchmarks/bench_build.py --cards 50 --output after.json --compare before.json
+#
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6 import QtCore, QtWidgets  # noqa: E402
+
+import heresycardbuilder  # noqa: E402
+
+sys.path.append(os.path.dirname(heresycardbuilder.__file__))
+from build_pdf import generate_pdf  # noqa: E402
+from build_tts import TTS_OBJECT_FILE, generate_tts  # noqa: E402
+from card_objects import Deck  # noqa: E402
+from card_render import Renderer  # noqa: E402
+from synthetic_deck import build_synthetic_deck  # noqa: E402
+
+# the build_synthetic_deck() arguments of each scenario, on top of the defaults
+SCENARIOS: Dict[str, dict] = {
+    "baseline": dict(),
+    "dense-text": dict(renderables_per_face=12, text_density=12, macro_density=1.0),
+    "plain-text": dict(renderables_per_face=12, text_density=12, macro_density=0.0),
+    "icons": dict(icon_density=4),
+    "halo": dict(halo_styles=8),
+    "large-art": dict(num_files=8, file_size=1024),
+    "external-art": dict(num_files=8, file_size=1024, external=True),
+}
+STAGES = ("Deck.save", "Deck.load", "Renderer.render_deck", "generate_pdf", "generate_tts")
+
+
+def timings(func: Callable[[], None], repeat: int) -> dict:
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return dict(best=min(times), median=statistics.median(times), times=times)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+        )
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def run_scenario(params: dict, cards: int, repeat: int) -> dict:
+    params = dict(params)
+    external = params.pop("external", False)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        media = os.path.join(tmpdir, "media")
+        os.mkdir(media)
+        # the synthetic deck adds the reference card
+        deck = build_synthetic_deck(
+            num_cards=cards - 1, external_dir=media if external else None, **params
+        )
+        filename = os.path.join(tmpdir, "synthetic.deck")
+        outdir = os.path.join(tmpdir, "generated_cards")
+        os.mkdir(outdir)
+        results = dict()
+        results["Deck.save"] = timings(lambda: deck.save(filename), repeat)
+        loaded = list()
+
+        def load():
+            tmp = Deck()
+            if not tmp.load(filename):
+                raise RuntimeError("Unable to load the synthetic deck")
+            loaded.append(tmp)
+
+        results["Deck.load"] = timings(load, repeat)
+        render = Renderer(loaded[-1], outdir)
+        try:
+            results["Renderer.render_deck"] = timings(lambda: render.render_deck(), repeat)
+            results["generate_pdf"] = timings(lambda: generate_pdf(render), repeat)
+
+            def tts():
+                # without the recorded sheet hashes, every sheet is rebuilt
+                if os.path.exists(os.path.join(outdir, TTS_OBJECT_FILE)):
+                    os.remove(os.path.join(outdir, TTS_OBJECT_FILE))
+                generate_tts(render)
+
+            results["generate_tts"] = timings(tts, repeat)
+        finally:
+            render.close()
+        return dict(
+            params=dict(params, external=external, num_cards=cards - 1),
+            deck_bytes=os.path.getsize(filename),
+            results=results,
+        )
+
+
+def compare(current: dict, previous: dict) -> None:
+    print(f"compared with {previous.get('commit') or 'the previous run'}:")
+    for name, scenario in current["scenarios"].items():
+        before = previous.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        for stage in STAGES:
+            if stage not in before["results"]:
+                continue
+            old = before["results"][stage]["best"]
+            new = scenario["results"][stage]["best"]
+            print(f"  {name:14} {stage:22} {old:8.3f}s -> {new:8.3f}s  x{old / new:.2f}")
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description="Time the build stages on synthetic decks.")
+    parser.add_argument("--cards", type=int, default=50, help="Number of cards per deck")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs per stage")
+    parser.add_argument(
+        "--scenario",
+        choices=sorted(SCENARIOS),
+        action="append",
+        help="Scenario to run, can be repeated (default: all of them)",
+    )
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--compare", default=None, help="JSON results of an earlier run")
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv)  # noqa F841
+    logging.disable(logging.INFO)
+
+    report = dict(
+        version=heresycardbuilder.__version__,
+        commit=git_commit(),
+        python=platform.python_version(),
+        qt=QtCore.qVersion(),
+        platform=platform.platform(),
+        cpus=os.cpu_count(),
+        cards=args.cards,
+        repeat=args.repeat,
+        scenarios=dict(),
+    )
+    names: List[str] = args.scenario if args.scenario else list(SCENARIOS)
+    for name in names:
+        scenario = run_scenario(SCENARIOS[name], args.cards, args.repeat)
+        report["scenarios"][name] = scenario
+        stages = "  ".join(f"{s} {scenario['results'][s]['best']:.3f}s" for s in STAGES)
+        print(f"{name:14} {stages}")
+
+    if args.output is not None:
+        with open(args.output, "w") as fp:
+            json.dump(report, fp, indent=2)
+    if args.compare is not None:
+        with open(args.compare, "r") as fp:
+            compare(report, json.load(fp))
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,69 @@
+#
+# T.I.M.E Stories card generator
+# Copyright (C) Randall Frank
+# See LICENSE for details
+#
+# Deck.load timing on a synthetic deck, plus a micro benchmark of the
+# rectangle/color decoding that used to go through eval().
+#
+#   python benchmarks/bench_deck_load.py --cards 2000
+#
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import timeit
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6 import QtWidgets  # noqa: E402
+
+import heresycardbuilder  # noqa: E402
+
+sys.path.append(os.path.dirname(heresycardbuilder.__file__))
+from card_objects import Deck, IntListField  # noqa: E402
+from synthetic_deck import build_synthetic_deck  # noqa: E402
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description="Time Deck.load on a synthetic deck.")
+    parser.add_argument("--cards", type=int, default=1000, help="Number of cards")
+    parser.add_argument("--renderables", type=int, default=6, help="Renderables per face")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed loads")
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv)  # noqa F841
+
+    deck = build_synthetic_deck(num_cards=args.cards, renderables_per_face=args.renderables)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filename = os.path.join(tmpdir, "synthetic.deck")
+        deck.save(filename)
+        size = os.path.getsize(filename)
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            tmp = Deck()
+            if not tmp.load(filename):
+                print("Unable to load the synthetic deck")
+                sys.exit(1)
+            times.append(time.perf_counter() - start)
+    best = min(times)
+    faces = args.cards * 2
+    print(f"deck: {args.cards} cards, {faces * args.renderables} renderables, {size} bytes")
+    print(f"Deck.load: best {best * 1000.0:.1f}ms  ({best * 1e6 / faces:.1f}us per face)")
+
+    # the rectangle decode on its own
+    field = IntListField("rectangle", 4)
+    text = "[120, 45, -1, 300]"
+    n = 100000
+    t_eval = timeit.timeit(lambda: eval(text), number=n)
+    t_field = timeit.timeit(lambda: field.parse(text), number=n)
+    print(
+        f"rectangle decode: eval {t_eval * 1e6 / n:.2f}us  IntListField {t_field * 1e6 / n:.2f}us"
+    )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,68 @@
+#
+# T.I.M.E Stories card generator
+# Copyright (C) Randall Frank
+# See LICENSE for details
+#
+# Python heap used by the deck object model and the cost of copying it, measured
+# on a synthetic deck (5000 cards by default).
+#
+#   python benchmarks/bench_deck_memory.py --cards 5000
+#
+
+import argparse
+import copy
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6 import QtWidgets  # noqa: E402
+
+import heresycardbuilder  # noqa: E402
+
+sys.path.append(os.path.dirname(heresycardbuilder.__file__))
+from synthetic_deck import build_synthetic_deck  # noqa: E402
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description="Measure the memory used by a synthetic deck.")
+    parser.add_argument("--cards", type=int, default=5000, help="Number of cards")
+    parser.add_argument("--renderables", type=int, default=6, help="Renderables per face")
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv)  # noqa F841
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    deck = build_synthetic_deck(num_cards=args.cards, renderables_per_face=args.renderables)
+    build_time = time.perf_counter() - start
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    renderables = args.cards * 2 * args.renderables
+    print(f"deck: {args.cards} cards, {renderables} renderables, built in {build_time:.2f}s")
+    print(f"model heap: {current / 1e6:.1f}MB ({current / renderables:.0f} bytes per renderable)")
+    print(f"peak while building: {peak / 1e6:.1f}MB")
+
+    # card copies (the editor clipboard) and the halo style copy
+    start = time.perf_counter()
+    for card in deck.base:
+        copy.deepcopy(card)
+    elapsed = time.perf_counter() - start
+    print(f"deepcopy of every card: {elapsed:.2f}s ({elapsed * 1e6 / args.cards:.0f}us per card)")
+    style = deck.styles[-1]
+    n = 100000
+    start = time.perf_counter()
+    for _ in range(n):
+        copy.copy(style)
+    elapsed = time.perf_counter() - start
+    print(f"style copy: {elapsed * 1e6 / n:.2f}us")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,157 @@
+#
+# T.I.M.E Stories card generator
+# Copyright (C) Randall Frank
+# See LICENSE for details
+#
+# Time per card face of the Renderer backends on synthetic decks: the items of a
+# QGraphicsScene (scene) against the operations of the plan painted directly
+# (painter), with the largest difference between the images of the two.  With
+# --threads, the card files of the painter backend are rendered with each number of
+# threads instead, with the speedup over one thread and the peak memory.
+#
+#   python benchmarks/bench_render.py --cards 50
+#   python benchmarks/bench_render.py --cards 100 --threads 1 2 4 8
+#
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+import numpy
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6 import QtGui, QtWidgets  # noqa: E402
+
+import heresycardbuilder  # noqa: E402
+
+sys.path.append(os.path.dirname(heresycardbuilder.__file__))
+from build_report import peak_rss  # noqa: E402
+from card_render import BACKENDS, Renderer  # noqa: E402
+from render_plan import compile_deck  # noqa: E402
+from synthetic_deck import build_synthetic_deck  # noqa: E402
+
+# the build_synthetic_deck() arguments of each scenario, on top of the defaults
+SCENARIOS = {
+    "baseline": dict(),
+    "dense-text": dict(renderables_per_face=12, text_density=12),
+    "icons": dict(icon_density=4),
+    "halo": dict(halo_styles=8),
+    "large-art": dict(num_files=8, file_size=1024),
+}
+
+
+def pixels(img: QtGui.QImage) -> numpy.ndarray:
+    img = img.convertToFormat(QtGui.QImage.Format_RGBA8888)
+    data = numpy.frombuffer(img.constBits(), numpy.uint8, img.sizeInBytes())
+    return data.reshape(img.height(), img.bytesPerLine())[:, : img.width() * 4].astype(int)
+
+
+def run_scenario(params: dict, cards: int, repeat: int) -> dict:
+    deck = build_synthetic_deck(num_cards=cards - 1, **params)
+    plan = compile_deck(deck)
+    render = Renderer(deck)
+    result = dict(max_diff=0)
+    images = dict()
+    try:
+        for backend in BACKENDS:
+            render.backend = backend
+            # the first faces load the fonts and glyphs
+            for face in plan.faces:
+                render.render_face_image(face, copy=False)
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                for face in plan.faces:
+                    render.render_face_image(face, copy=False)
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            result[backend] = best * 1000.0 / len(plan.faces)
+            images[backend] = [pixels(render.render_face_image(face)) for face in plan.faces]
+    finally:
+        render.close()
+    for scene, painter in zip(images["scene"], images["painter"]):
+        result["max_diff"] = max(result["max_diff"], int(numpy.abs(scene - painter).max()))
+    return result
+
+
+def thread_scaling(params: dict, cards: int, repeat: int, threads: List[int]) -> List[dict]:
+    deck = build_synthetic_deck(num_cards=cards - 1, **params)
+    plan = compile_deck(deck)
+    results = list()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        render = Renderer(deck, tmpdir)
+        # every face is painted
+        render.share_faces = False
+        try:
+            # the first faces load the fonts and glyphs
+            render.render_plan(plan)
+            for count in threads:
+                render.max_workers = count
+                best = None
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    render.render_plan(plan)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                results.append(
+                    dict(
+                        threads=count,
+                        face_ms=best * 1000.0 / len(plan.faces),
+                        speedup=(
+                            results[0]["face_ms"] * len(plan.faces) / (best * 1000.0)
+                            if results
+                            else 1.0
+                        ),
+                        peak_rss=peak_rss(),
+                    )
+                )
+        finally:
+            render.close()
+    return results
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description="Time the Renderer backends per card face.")
+    parser.add_argument("--cards", type=int, default=50, help="Number of cards per deck")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs")
+    parser.add_argument(
+        "--scenario",
+        choices=sorted(SCENARIOS),
+        action="append",
+        help="Scenario to run, can be repeated (default: all of them)",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        nargs="+",
+        default=None,
+        help="Time the painter backend with these numbers of threads instead",
+    )
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv)  # noqa F841
+    logging.disable(logging.INFO)
+
+    for name in args.scenario if args.scenario else list(SCENARIOS):
+        if args.threads is not None:
+            for result in thread_scaling(SCENARIOS[name], args.cards, args.repeat, args.threads):
+                print(
+                    f"{name:12} {result['threads']:3} threads {result['face_ms']:6.2f}ms per face  "
+                    f"x{result['speedup']:.2f}  peak memory {(result['peak_rss'] or 0) >> 20}MB"
+                )
+            continue
+        result = run_scenario(SCENARIOS[name], args.cards, args.repeat)
+        print(
+            f"{name:12} scene {result['scene']:6.2f}ms  painter {result['painter']:6.2f}ms  "
+            f"x{result['scene'] / result['painter']:.2f}  max pixel difference "
+            f"{result['max_diff']}"
+        )
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,73 @@
+#
+# T.I.M.E Stories card generator
+# Copyright (C) Randall Frank
+# See LICENSE for details
+#
+# Import time of the entry points, from python -X importtime: build_deck --version
+# and the modules the card editor imports before it opens its window.
+#
+#   python benchmarks/bench_startup.py --top 10
+#
+
+import argparse
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+BUILD_DECK_VERSION = """
+import sys
+sys.argv = ["build_deck", "--version"]
+from heresycardbuilder.build_deck import run
+try:
+    run()
+except SystemExit:
+    pass
+"""
+
+EDITOR_IMPORT = """
+import os, sys
+import heresycardbuilder
+sys.path.append(os.path.dirname(heresycardbuilder.__file__))
+import card_editor
+"""
+
+
+def import_times(code: str) -> Tuple[float, List[Tuple[int, int, str]]]:
+    # the wall time of running code and its (self us, cumulative us, module) imports
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    imports = list()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:") :].split("|")
+        if (len(fields) != 3) or not fields[0].strip().isdigit():
+            continue
+        imports.append((int(fields[0]), int(fields[1]), fields[2].strip()))
+    return elapsed, imports
+
+
+def report(name: str, code: str, repeat: int, top: int) -> None:
+    runs = [import_times(code) for _ in range(repeat)]
+    elapsed, imports = min(runs, key=lambda run: sum(i[0] for i in run[1]))
+    total = sum(i[0] for i in imports)
+    print(f"{name}: {elapsed * 1000:.0f}ms wall, {total / 1000:.1f}ms of imports")
+    for self_us, cumulative, module in sorted(imports, key=lambda i: -i[0])[:top]:
+        print(f"  {self_us / 1000:7.1f}ms self {cumulative / 1000:7.1f}ms cumulative  {module}")
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description="Time the imports of the entry points.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs, the best is kept")
+    parser.add_argument("--top", type=int, default=10, help="Number of modules listed")
+    args = parser.parse_args()
+    report("build_deck --version", BUILD_DECK_VERSION, args.repeat, args.top)
+    report("card_editor imports", EDITOR_IMPORT, args.repeat, args.top)
+
+
+if __name__ == "__main__":
+    run()
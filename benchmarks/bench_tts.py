@@ -0,0 +1,127 @@
+#
+# T.I.M.E Stories card generator
+# Copyright (C) Randall Frank
+# See LICENSE for details
+#
+# generate_tts timing on the rendered cards of a synthetic deck, against the
+# previous implementation (a QPainter per sheet, Qt smooth scaling of each card,
+# one sheet at a time), plus a micro benchmark of the 2:1 card reduction.
+#
+#   python benchmarks/bench_tts.py --cards 140
+#
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+import timeit
+import types
+
+import numpy
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6 import QtCore, QtGui, QtWidgets  # noqa: E402
+
+import heresycardbuilder  # noqa: E402
+
+sys.path.append(os.path.dirname(heresycardbuilder.__file__))
+from build_tts import TTS_OBJECT_FILE, TtsSettings, generate_tts, place_card  # noqa: E402
+from card_render import Renderer  # noqa: E402
+from synthetic_deck import build_synthetic_deck  # noqa: E402
+
+
+def legacy_generate_tts(render):
+    num = 0
+    while os.path.exists(os.path.join(render.outdir, "card_bot_{:03}.png".format(num))):
+        num += 1
+    w = render.card_size[0] * 0.5
+    h = render.card_size[1] * 0.5
+    nx = min(int(5000 / w), 10)
+    ny = min(int(5000 / h), 7)
+    for pp in ["top", "bot"]:
+        tile = 0
+        done = 0
+        while done < num:
+            img = QtGui.QImage(w * nx, h * ny, QtGui.QImage.Format_RGBA8888)
+            p = QtGui.QPainter()
+            p.begin(img)
+            for y in range(ny):
+                for x in range(nx):
+                    if done < num:
+                        s = "card_{}_{:03}.png".format(pp, done)
+                        face = QtGui.QImage(os.path.join(render.outdir, s), "png")
+                        tmp = face.scaled(
+                            w, h, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation
+                        )
+                        src = QtCore.QRectF(0, 0, w, h)
+                        tgt = QtCore.QRectF(x * w, y * h, w, h)
+                        p.drawImage(tgt, tmp, src)
+                        done += 1
+            p.end()
+            img.save(os.path.join(render.outdir, "deck_{}_{}.png".format(pp, tile)), "png")
+            tile += 1
+
+
+def best_time(func, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run() -> None:
+    parser = argparse.ArgumentParser(description="Time generate_tts on a synthetic deck.")
+    parser.add_argument("--cards", type=int, default=140, help="Number of cards")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of timed runs")
+    parser.add_argument("--workers", type=int, default=None, help="generate_tts threads")
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv)  # noqa F841
+    logging.disable(logging.INFO)
+
+    # the synthetic deck adds the reference card
+    deck = build_synthetic_deck(num_cards=args.cards - 1)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        renderer = Renderer(deck, tmpdir)
+        renderer.render_deck()
+        renderer.close()
+        render = types.SimpleNamespace(outdir=tmpdir, card_size=deck.card_size)
+
+        t_legacy = best_time(lambda: legacy_generate_tts(render), args.repeat)
+        settings = TtsSettings()
+        settings.max_workers = args.workers
+
+        def full_run():
+            # without the recorded sheet hashes, every sheet is rebuilt
+            if os.path.exists(os.path.join(tmpdir, TTS_OBJECT_FILE)):
+                os.remove(os.path.join(tmpdir, TTS_OBJECT_FILE))
+            generate_tts(render, settings)
+
+        t_new = best_time(full_run, args.repeat)
+
+        face = QtGui.QImage(os.path.join(tmpdir, "card_top_000.png"), "png")
+    w = deck.card_size[0] // 2
+    h = deck.card_size[1] // 2
+    n = 50
+    t_qt = timeit.timeit(
+        lambda: face.scaled(w, h, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation),
+        number=n,
+    )
+    out = numpy.empty((h, w, 4), numpy.uint8)
+    t_box = timeit.timeit(lambda: place_card(face, out), number=n)
+
+    print(f"deck: {args.cards} cards of {deck.card_size[0]}x{deck.card_size[1]}")
+    print(f"generate_tts: previous {t_legacy:.2f}s  current {t_new:.2f}s")
+    print(
+        f"card reduction: Qt smooth scale {t_qt * 1000 / n:.2f}ms  "
+        f"box filter {t_box * 1000 / n:.2f}ms"
+    )
+
+
+if __name__ == "__main__":
+    run()
@@ -215,7 +215,7 @@ class AssetGui(QtWidgets.QMainWindow, Ui_card_editor_main):
             self.lblFileName.setText("File: " + self._current_asset.name)
             self.lblFileFilename.setText("Pathname: " + self._current_asset.filename)
             self.lblFileSize.setText(self._current_asset.get_column_info(1))
-            img = self.resize_image(self._current_asset.get_image(), 200)
+            img = self.resize_image(self._current_asset.get_image(full_resolution=True), 200)
             self.lblFileImage.setPixmap(QtGui.QPixmap.fromImage(img))
             self.pbSelectFile.setEnabled(not self._current_asset.filename.startswith(":"))
         elif tag == "image":
@@ -6,24 +6,48 @@
 
 import argparse
 import glob
-import io
+import json
 import logging
 import os.path
 import shutil
+import signal
 import sys
-
-from PySide6 import QtCore, QtWidgets
-from dulwich import porcelain
+from typing import TYPE_CHECKING
 
 import heresycardbuilder
 
 __version__ = heresycardbuilder.__version__
 sys.path.append(os.path.dirname(heresycardbuilder.__file__))
-from build_pdf import generate_pdf  # noqa: E402
-from build_tts import generate_tts  # noqa: E402
-import card_objects  # noqa: E402
-from card_render import Renderer  # noqa: E402
-from utilities import is_directory, qt_message_handler  # noqa: E402
+from imposition import DUPLEX_MODES  # noqa: E402
+
+if TYPE_CHECKING:
+    from card_objects import Deck
+
+# Qt, the renderer and the git, numpy and http modules are imported when they are
+# used, so --help and --version (and the modes that need few of them) start quickly.
+
+SERVE_PORT = 8765
+# git source decks are urls ending in .git
+GIT_SCHEMES = ("http://", "https://", "file://")
+GIT_DEPTH = 1
+# the image resolution of --pdf-screen without a value
+SCREEN_DPI = 100
+
+
+def report_assets(deck: "Deck") -> None:
+    # list the file assets with identical content and what sharing them saves
+    duplicates = deck.duplicate_files()
+    memory = 0
+    for group in duplicates:
+        size = len(group[0].encoded_data())
+        w, h = group[0].size()
+        names = ", ".join(f"'{f.name}'" for f in group)
+        logging.info(f"Identical files ({w}x{h}, {size} bytes): {names}")
+        # one decoded image is shared
+        memory += group[0].image.sizeInBytes() * (len(group) - 1)
+    count = sum(len(group) - 1 for group in duplicates)
+    logging.info(f"{count} duplicate file assets in {len(deck.files)} files")
+    logging.info(f"Bytes saved: {memory} of decoded images")
 
 
 def run() -> None:
@@ -46,6 +70,26 @@ def run() -> None:
         help="Directory where the 'generated_cards' directory will be created. \
         By default, it is the directory containing the cardfile.",
     )
+    parser.add_argument(
+        "--git-ref",
+        default=None,
+        metavar="ref",
+        help="Branch, tag or commit of a git source deck to build (default: the remote HEAD)",
+    )
+    parser.add_argument(
+        "--git-depth",
+        default=GIT_DEPTH,
+        type=int,
+        metavar="commits",
+        help=f"History fetched for a git source deck, 0 for all of it (default: {GIT_DEPTH})",
+    )
+    parser.add_argument(
+        "--git-cache",
+        default=None,
+        metavar="dirname",
+        help="Directory of the clones of git source decks, which are updated by later builds "
+        "(default: in the user cache directory)",
+    )
     parser.add_argument(
         "--pad_width", default=0, nargs="?", help="Extra border padding for printing."
     )
@@ -71,12 +115,195 @@ def run() -> None:
         default=False,
         help="Generate pdf files from the generated cards",
     )
+    parser.add_argument(
+        "--pdf-vector",
+        action="store_true",
+        default=False,
+        help="Generate pdf files with vector text and shapes, drawn from the deck (implies --pdf)",
+    )
+    parser.add_argument(
+        "--pdf-pages",
+        default=["Letter", "A4"],
+        metavar="page_size",
+        nargs="+",
+        help="Page sizes of the pdf files, e.g. Letter A4 A3 Legal Tabloid (default: Letter A4)",
+    )
+    parser.add_argument(
+        "--pdf-layout",
+        default="2x2",
+        metavar="COLUMNSxROWS",
+        help="Cards per pdf page, e.g. 3x3, or 'auto' to fit as many as possible (default: 2x2)",
+    )
+    parser.add_argument(
+        "--pdf-gutter",
+        default=None,
+        type=int,
+        metavar="pixels",
+        help="Space between the cards on a pdf page (default: spread over the page)",
+    )
+    parser.add_argument(
+        "--pdf-bleed",
+        default=0,
+        type=int,
+        metavar="pixels",
+        help="Pixels around the card images outside of the cut lines (default: 0)",
+    )
+    parser.add_argument(
+        "--pdf-cut-marks",
+        action="store_true",
+        default=False,
+        help="Draw cut marks around the cards on the pdf pages",
+    )
+    parser.add_argument(
+        "--pdf-duplex",
+        default="long",
+        choices=DUPLEX_MODES,
+        help="Edge the pdf pages flip around when printed on both sides (default: long)",
+    )
+    parser.add_argument(
+        "--pdf-dpi",
+        default=None,
+        type=int,
+        metavar="dpi",
+        help="Downsample the images in the pdf files to at most this resolution",
+    )
+    parser.add_argument(
+        "--pdf-lossless",
+        action="store_true",
+        default=False,
+        help="Embed the images in the pdf files with lossless instead of JPEG compression",
+    )
+    parser.add_argument(
+        "--pdf-screen",
+        default=None,
+        type=int,
+        const=SCREEN_DPI,
+        metavar="dpi",
+        nargs="?",
+        help="Also write small deck_<page size>_screen.pdf files with JPEG images at this "
+        f"resolution (default: {SCREEN_DPI})",
+    )
     parser.add_argument(
         "--tabletop",
         action="store_true",
         default=False,
         help="Generate Tabletop Simulator deck images from generated cards",
     )
+    parser.add_argument(
+        "--tabletop-max-texture",
+        default=5000,
+        type=int,
+        metavar="pixels",
+        help="Largest width and height of the Tabletop Simulator images (default: 5000)",
+    )
+    parser.add_argument(
+        "--tabletop-power-of-two",
+        action="store_true",
+        default=False,
+        help="Make the sizes of the Tabletop Simulator images powers of two",
+    )
+    parser.add_argument(
+        "--tabletop-min-scale",
+        default=None,
+        type=float,
+        metavar="scale",
+        help="Reduce the cards down to this scale (from the 0.5 default) to fit more of them "
+        "on a Tabletop Simulator image",
+    )
+    parser.add_argument(
+        "--tabletop-unique-backs",
+        action="store_true",
+        default=False,
+        help="Give every card its own back image in Tabletop Simulator, instead of one back "
+        "image for the cards with identical backs",
+    )
+    parser.add_argument(
+        "--full-resolution",
+        action="store_true",
+        default=False,
+        help="Decode art files at full resolution instead of the largest size used on a card",
+    )
+    parser.add_argument(
+        "--render-backend",
+        choices=("painter", "scene"),
+        default="painter",
+        help="Paint the card faces directly (painter) or through a QGraphicsScene (scene), "
+        "the default is painter",
+    )
+    parser.add_argument(
+        "--render-threads",
+        default=1,
+        type=int,
+        metavar="count",
+        help="Paint the card faces on this many threads with the painter backend (default: 1)",
+    )
+    parser.add_argument(
+        "--asset-report",
+        action="store_true",
+        default=False,
+        help="List the file assets with identical content and the bytes saved by sharing them",
+    )
+    parser.add_argument(
+        "--dump-plan",
+        default=None,
+        metavar="filename",
+        help="Write the compiled render plan of the deck (or --card) as JSON and exit",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        default=False,
+        help="Keep the deck loaded and render single cards for local HTTP requests, "
+        "GET /render?deck=path&card=number&face=top|bot&format=png|jpg&scale=scale",
+    )
+    parser.add_argument(
+        "--serve-port",
+        default=SERVE_PORT,
+        type=int,
+        metavar="port",
+        help=f"Port of --serve, on localhost (default: {SERVE_PORT})",
+    )
+    parser.add_argument(
+        "--serve-max-decks",
+        default=4,
+        type=int,
+        metavar="count",
+        help="Number of decks --serve keeps loaded (default: 4)",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        default=False,
+        help="Keep running and render the cards again when the deck or its media files change",
+    )
+    parser.add_argument(
+        "--profile",
+        default=None,
+        metavar="filename",
+        help="Write the wall and CPU time of the build stages, card faces and renderables as a "
+        "Chrome trace (JSON) and log the slowest card faces",
+    )
+    parser.add_argument(
+        "--profile-top",
+        default=10,
+        type=int,
+        metavar="count",
+        help="Number of card faces in the --profile summary (default: 10)",
+    )
+    parser.add_argument(
+        "--report",
+        default=None,
+        metavar="filename",
+        help="Write a JSON report of the build: faces rendered, output sizes, stage times, "
+        "cache hit rates, peak memory and the largest decoded assets",
+    )
+    parser.add_argument(
+        "--max-memory",
+        default=None,
+        metavar="size",
+        help="Memory budget of the build, e.g. 2G or 512M.  The pdf and Tabletop Simulator "
+        "stages use fewer threads and keep fewer card images to stay within it",
+    )
     parser.add_argument("--verbose", action="store_true", default=False, help="Enable verbose mode")
     parser.add_argument("--logfile", default=None, help="Save console output to the specified file")
     args = parser.parse_args()
@@ -86,9 +313,85 @@ def run() -> None:
         log_level = logging.DEBUG
     logging.basicConfig(filename=args.logfile, level=log_level, format="%(levelname)s: %(message)s")
 
-    # bootstrap Qt
+    from PySide6 import QtCore, QtGui, QtWidgets
+    from build_pdf import (
+        PRINT_IMAGES,
+        SCREEN_IMAGES,
+        PdfSettings,
+        generate_pdf,
+        page_size_id,
+        parse_layout,
+    )
+    from build_report import build_report, cache_stats, parse_memory, peak_rss, write_report
+    import card_objects
+    from card_render import Renderer
+    from profiling import Profiler, profile_span
+    from render_plan import compile_deck, plan_to_json
+    from utilities import is_directory, qt_message_handler
+
+    max_memory = None
+    if args.max_memory is not None:
+        try:
+            max_memory = parse_memory(args.max_memory)
+        except ValueError as e:
+            logging.error(str(e))
+            sys.exit(1)
+    profiler = None
+    if (args.profile is not None) or (args.report is not None):
+        # the deck directory becomes the current directory
+        if args.profile is not None:
+            args.profile = os.path.abspath(args.profile)
+        if args.report is not None:
+            args.report = os.path.abspath(args.report)
+        profiler = Profiler()
+
+    # bootstrap Qt, the renderer scene needs a widgets application but reading and
+    # writing decks only needs images
     QtCore.qInstallMessageHandler(qt_message_handler)
-    app = QtWidgets.QApplication(sys.argv)  # noqa F841
+    if (args.default_deck is not None) or args.asset_report or (args.dump_plan is not None):
+        app = QtGui.QGuiApplication(sys.argv)
+    else:
+        app = QtWidgets.QApplication(sys.argv)
+
+    pdf_settings = PdfSettings()
+    try:
+        for name in args.pdf_pages:
+            page_size_id(name)
+        pdf_settings.page_sizes = args.pdf_pages
+        pdf_settings.columns, pdf_settings.rows = parse_layout(args.pdf_layout)
+    except ValueError as e:
+        logging.error(str(e))
+        sys.exit(1)
+    pdf_settings.gutter = args.pdf_gutter
+    pdf_settings.bleed = args.pdf_bleed
+    pdf_settings.cut_marks = args.pdf_cut_marks
+    pdf_settings.duplex = args.pdf_duplex
+    pdf_settings.vector = args.pdf_vector
+    pdf_settings.max_memory = max_memory
+    for dpi in (args.pdf_dpi, args.pdf_screen):
+        if (dpi is not None) and (dpi < 1):
+            logging.error(f"Invalid pdf image resolution: {dpi}")
+            sys.exit(1)
+    pdf_settings.images = [PRINT_IMAGES._replace(max_dpi=args.pdf_dpi, lossless=args.pdf_lossless)]
+    if args.pdf_screen is not None:
+        pdf_settings.images.append(SCREEN_IMAGES._replace(max_dpi=args.pdf_screen))
+
+    if args.render_threads < 1:
+        logging.error(f"Invalid number of render threads: {args.render_threads}")
+        sys.exit(1)
+    if args.tabletop_max_texture < 1:
+        logging.error(f"Invalid Tabletop Simulator image size: {args.tabletop_max_texture}")
+        sys.exit(1)
+    tts_settings = None
+    if args.tabletop:
+        from build_tts import TtsSettings, generate_tts
+
+        tts_settings = TtsSettings()
+        tts_settings.max_texture = args.tabletop_max_texture
+        tts_settings.power_of_two = args.tabletop_power_of_two
+        tts_settings.min_scale = args.tabletop_min_scale
+        tts_settings.shared_backs = not args.tabletop_unique_backs
+        tts_settings.max_memory = max_memory
 
     cardfile = args.cardfile[0]
     if args.default_deck is not None:
@@ -97,25 +400,34 @@ def run() -> None:
         deck.save(args.cardfile[0])
         sys.exit(0)
 
-    # if cardfile is a git URL, clone repo into a tempdir and use .deck file in tempdir root.
-    if cardfile.startswith("http") and cardfile.endswith(".git"):
+    # if cardfile is a git URL, check out the repo in the clone cache and use the .deck
+    # file in its root.  The cache is updated in place, only new commits are fetched.
+    if cardfile.startswith(GIT_SCHEMES) and cardfile.endswith(".git"):
         if args.outdir is None:
             logging.error("--outdir must be specified for git source decks")
             sys.exit(1)
-        destination = args.outdir
-        if not is_directory(destination):
-            logging.error("--outdir must be an empty directory")
+        if not is_directory(args.outdir):
+            logging.error("--outdir must be a directory")
             sys.exit(1)
-        # do the download...
-        logging.info(f"Cloning the git repo: {cardfile} to {destination}")
-        buffer = io.BytesIO()
+        # the outputs do not go into the clone cache
+        args.outdir = os.path.abspath(args.outdir)
+        from git_clone import CloneProgress, cached_clone
+
+        logging.info(f"Fetching the git repo: {cardfile}")
+        stream = CloneProgress(lambda percent, text: logging.debug(text))
         try:
-            porcelain.clone(cardfile, destination, errstream=buffer)
+            with profile_span(profiler, "git fetch", "stage"):
+                destination, commit = cached_clone(
+                    cardfile,
+                    args.git_cache,
+                    ref=args.git_ref,
+                    depth=args.git_depth if args.git_depth > 0 else None,
+                    stream=stream,
+                )
         except Exception as e:
-            logging.error(f"Unable to clone source git repo: {str(e)}")
+            logging.error(f"Unable to fetch source git repo: {str(e)}")
             sys.exit(1)
-        for line in buffer.getvalue().decode("ascii").split("\n"):
-            logging.debug(line)
+        logging.info(f"Checked out {commit} in {destination}")
         # Look for the .deck file
         deckfiles = glob.glob(os.path.join(destination, "*.deck"))
         if len(deckfiles) < 1:
@@ -131,9 +443,58 @@ def run() -> None:
     if args.outdir is not None:
         outdir = args.outdir
     deck = card_objects.Deck()
-    if not deck.load(filename):
+    with profile_span(profiler, "Deck.load", "stage"):
+        loaded = deck.load(
+            filename,
+            reduce_resolution=not args.full_resolution,
+            stats=cache_stats("file decodes"),
+        )
+    if not loaded:
         logging.info("Unable to read the file: {}\n".format(filename))
         sys.exit(1)
+    if args.asset_report:
+        report_assets(deck)
+        sys.exit(0)
+
+    the_card = None
+    if args.card is not None:
+        the_card = int(args.card)
+
+    if args.dump_plan is not None:
+        plan = compile_deck(deck, the_card)
+        logging.info(f"Writing the render plan for {len(plan.faces)} card faces: {args.dump_plan}")
+        with open(args.dump_plan, "w") as fp:
+            json.dump(plan_to_json(plan), fp, indent=1)
+        sys.exit(0)
+
+    pad_size = 36 if args.mpc else int(args.pad_width)
+    if args.serve:
+        from render_server import DeckCache, RenderServer
+
+        if args.serve_max_decks < 1:
+            logging.error(f"Invalid number of decks: {args.serve_max_decks}")
+            sys.exit(1)
+        decks = DeckCache(
+            args.serve_max_decks,
+            reduce_resolution=not args.full_resolution,
+            pad_size=pad_size,
+            backend=args.render_backend,
+        )
+        decks.add(filename, deck)
+        try:
+            server = RenderServer(("127.0.0.1", args.serve_port), decks, default_deck=filename)
+        except OSError as e:
+            logging.error(f"Unable to listen on port {args.serve_port}: {str(e)}")
+            sys.exit(1)
+        logging.info(f"Serving cards on http://127.0.0.1:{server.server_port}/render")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        server.server_close()
+        decks.close()
+        sys.exit(0)
+
     outdir = os.path.join(outdir, "generated_cards")
     if args.card is None:
         # remove and set up the output directory
@@ -147,28 +508,70 @@ def run() -> None:
             logging.error("Unable to create output directory {} : {}".format(outdir, str(e)))
             sys.exit(1)
 
-    the_card = None
-    if args.card is not None:
-        the_card = int(args.card)
+    if the_card is not None:
         logging.info("Rendering card: {}".format(the_card))
 
     # set up the renderer
     render = Renderer(deck, outdir)
-    if args.mpc:
-        render.pad_size = 36
-    render.pad_size = int(args.pad_width)
-    render.render_deck(the_card)
+    render.pad_size = pad_size
+    render.backend = args.render_backend
+    render.max_workers = args.render_threads
+    render.max_memory = max_memory
+    # the report only needs the stage times
+    render.profiler = profiler if args.profile is not None else None
+    with profile_span(profiler, "render_deck", "stage"):
+        render.render_deck(the_card)
 
-    # generate pdf file(s)
-    if args.pdf:
-        logging.info("Generating PDF files")
-        generate_pdf(render)
+    def generate_outputs(render: Renderer) -> bool:
+        # generate pdf file(s)
+        if args.pdf or args.pdf_vector:
+            logging.info("Generating PDF files")
+            try:
+                with profile_span(profiler, "generate_pdf", "stage"):
+                    generate_pdf(render, pdf_settings)
+            except ValueError as e:
+                logging.error(f"Unable to generate the PDF files: {str(e)}")
+                return False
 
-    # generate Tabletop Simulator images
-    if args.tabletop:
-        logging.info("Generating Tabletop Simulator files")
-        generate_tts(render)
+        # generate Tabletop Simulator images
+        if args.tabletop:
+            logging.info("Generating Tabletop Simulator files")
+            with profile_span(profiler, "generate_tts", "stage"):
+                generate_tts(render, tts_settings)
+        return True
+
+    if not generate_outputs(render):
+        sys.exit(1)
+
+    if args.profile is not None:
+        for line in profiler.summary(args.profile_top):
+            logging.info(line)
+        logging.info(f"Writing the profile: {args.profile}")
+        profiler.write(args.profile)
+        # the edits of --watch are not profiled
+        render.profiler = None
+    if args.report is not None:
+        logging.info(f"Writing the build report: {args.report}")
+        write_report(args.report, build_report(deck, render, profiler, max_memory))
+    if (max_memory is not None) and ((peak_rss() or 0) > max_memory):
+        logging.warning(f"The build used {peak_rss()} bytes, more than the memory budget")
+
+    if args.watch:
+        from deck_watcher import DeckWatcher
+
+        watcher = DeckWatcher(  # noqa F841
+            filename,
+            render,
+            reduce_resolution=not args.full_resolution,
+            target_card=the_card,
+            on_update=generate_outputs,
+        )
+        logging.info(f"Watching {filename} and its media files, press Ctrl+C to stop")
+        # Qt does not return to Python to handle Ctrl+C
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        sys.exit(app.exec())
 
+    render.close()
     sys.exit(0)
 
 
@@ -4,99 +4,311 @@
 # See LICENSE for details
 #
 
+import collections
+import concurrent.futures
+import functools
+import itertools
 import logging
 import os
 import os.path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
 
-from PySide6 import QtCore, QtGui
+from PySide6 import QtCore, QtGui, QtWidgets
+from build_report import budget_workers, cache_stats, current_rss
+from imposition import Imposition
+from render_plan import FacePlan, ImageOp, compile_deck
 
+# the resolution of the pdf pages, a card is drawn over card_size pixels
+PDF_DPI = 300
 
-def do_card(p, num, w, h, xoffset, yoffset, top, renderer):
-    pp = "top"
-    if not top:
-        pp = "bot"
-    s = "card_{}_{:03}.png".format(pp, num)
+
+class PdfImages(NamedTuple):
+    # how the images of a set of pdf files are embedded
+    suffix: str  # added to the pdf file names
+    max_dpi: Optional[int]  # None embeds the card images as they are
+    lossless: bool  # Flate instead of JPEG compression
+
+
+PRINT_IMAGES = PdfImages("", None, False)
+SCREEN_IMAGES = PdfImages("_screen", 100, False)
+
+
+class PdfSettings(object):
+    def __init__(self):
+        # the page sizes, by QPageSize name, one pdf file is written for each
+        self.page_sizes: List[str] = ["Letter", "A4"]
+        # cards per page, 0 fits as many as possible
+        self.columns: int = 2
+        self.rows: int = 2
+        # the space between cards in pixels, None spreads the cards over the page
+        self.gutter: Optional[int] = None
+        # the pixels around the card images that are outside of the cut lines
+        self.bleed: int = 0
+        self.cut_marks: bool = False
+        self.duplex: str = "long"
+        # the number of threads reading the card images, None for one per cpu
+        self.max_workers: Optional[int] = None
+        # the memory (bytes) of the process the card images should fit in, None for
+        # no limit
+        self.max_memory: Optional[int] = None
+        # draw the cards from the render plan (vector text and shapes) instead of
+        # the rendered card images
+        self.vector: bool = False
+        # one pdf file is written per page size for each of the image settings
+        self.images: List[PdfImages] = [PRINT_IMAGES]
+
+
+class PdfFile(NamedTuple):
+    writer: QtGui.QPdfWriter
+    painter: QtGui.QPainter
+    imposition: Imposition
+    images: PdfImages
+
+
+def page_size_id(name: str) -> QtGui.QPageSize.PageSizeId:
+    for key, value in QtGui.QPageSize.PageSizeId.__members__.items():
+        if key.lower() == name.lower():
+            return value
+    raise ValueError(f"Unknown page size: {name}")
+
+
+def parse_layout(text: str) -> Tuple[int, int]:
+    # "COLUMNSxROWS", e.g. 2x2, or "auto" to fit as many cards as possible
+    if text == "auto":
+        return 0, 0
+    try:
+        columns, rows = [int(v) for v in text.lower().split("x")]
+    except ValueError:
+        raise ValueError(f"Invalid page layout '{text}', use COLUMNSxROWS or auto")
+    return columns, rows
+
+
+def card_name(num, top) -> str:
+    return "card_{}_{:03}.png".format("top" if top else "bot", num)
+
+
+def read_card(num, top, renderer) -> QtGui.QImage:
+    s = card_name(num, top)
     tmp = os.path.join(renderer.outdir, s)
     face = QtGui.QImage(tmp, "png")
     logging.info("Reading: {}".format(s))
+    return face
+
+
+def read_cards(
+    renderer,
+    faces: List[Tuple[int, bool]],
+    max_workers: Optional[int] = None,
+    max_shared: Optional[int] = None,
+) -> Iterator[QtGui.QImage]:
+    # Read the (number, top) card faces on a thread pool and return them in order.
+    # Only a few images per worker are read ahead of the pdf writer.  Faces rendered
+    # from identical plans are read once and kept until their last use, up to
+    # max_shared of them (None for no limit).
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    digests = [renderer.face_digests.get(card_name(num, top)) for num, top in faces]
+    uses = collections.Counter(digest for digest in digests if digest is not None)
+    shared = dict()
+    pending = collections.deque()
+    stats = cache_stats("pdf card reads")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for (num, top), digest in zip(faces, digests):
+            future = shared.get(digest)
+            if future is None:
+                future = pool.submit(read_card, num, top, renderer)
+                stats.miss()
+                if (uses[digest] > 1) and ((max_shared is None) or (len(shared) < max_shared)):
+                    shared[digest] = future
+            else:
+                stats.hit()
+            uses[digest] -= 1
+            if uses[digest] <= 0:
+                shared.pop(digest, None)
+            pending.append(future)
+            if len(pending) > 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def downsample_card(face: QtGui.QImage, w: int, max_dpi: Optional[int]) -> QtGui.QImage:
+    # the card image with at most max_dpi pixels per inch when drawn w pixels wide
+    if max_dpi is None:
+        return face
+    width = max(round(w * max_dpi / PDF_DPI), 1)
+    if face.width() <= width:
+        return face
+    height = max(round(face.height() * width / face.width()), 1)
+    return face.scaled(width, height, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation)
+
+
+def plan_scene(
+    renderer, face: FacePlan, max_dpi: Optional[int]
+) -> Union[QtWidgets.QGraphicsScene, Tuple[FacePlan, Dict[ImageOp, QtGui.QImage]]]:
+    # the renderer scene for a card face, the art is kept at the page resolution or
+    # max_dpi.  The painter backend paints the face itself (see do_plan_card()) with
+    # the art reduced here, once for all of the pdf files of max_dpi.
+    renderer.max_image_scale = (PDF_DPI if max_dpi is None else max_dpi) / PDF_DPI
+    if renderer.backend == "painter":
+        return face, renderer.op_images(face)
+    renderer.build_plan_scene(face)
+    return renderer.scene
+
+
+def do_card(p, face, w, h, xoffset, yoffset):
     # paste
     src = QtCore.QRectF(0, 0, face.width(), face.height())
     tgt = QtCore.QRectF(xoffset, yoffset, w, h)
     p.drawImage(tgt, face, src)
 
 
-def generate_pdf(renderer):
-    # count the input files
-    num = 0
-    while True:
-        s = "card_bot_{:03}.png".format(num)
-        tmp = os.path.join(renderer.outdir, s)
-        if os.path.exists(tmp):
-            num += 1
-        else:
-            break
-    logging.info("Num files {}".format(num))
+def do_scene_card(p, scene: QtWidgets.QGraphicsScene, w, h, xoffset, yoffset):
+    # draw the scene items straight into the pdf, clipped to the card
+    tgt = QtCore.QRectF(xoffset, yoffset, w, h)
+    p.save()
+    p.setClipRect(tgt)
+    scene.render(p, tgt, scene.sceneRect(), QtCore.Qt.IgnoreAspectRatio)
+    p.restore()
+
+
+def do_plan_card(
+    renderer, p, card: Tuple[FacePlan, Dict[ImageOp, QtGui.QImage]], w, h, xoffset, yoffset
+):
+    # paint the face operations straight into the pdf, clipped to the card
+    face, images = card
+    tgt = QtCore.QRectF(xoffset, yoffset, w, h)
+    p.save()
+    p.setClipRect(tgt)
+    p.translate(xoffset, yoffset)
+    p.scale(w / renderer.card_size[0], h / renderer.card_size[1])
+    renderer.paint_face(p, face, images)
+    p.restore()
+
 
-    # Raw numbers
-    w = int(945)
-    h = int(1535)
+def do_cut_marks(p, imposition: Imposition, back: bool):
+    pen = QtGui.QPen(QtGui.QColor(0, 0, 0))
+    pen.setWidth(2)
+    p.setPen(pen)
+    for x0, y0, x1, y1 in imposition.cut_marks(back):
+        p.drawLine(QtCore.QLineF(x0, y0, x1, y1))
 
-    # MPC numbers
-    w = int(825)
-    h = int(1425)
+
+def generate_pdf(renderer, settings: Optional[PdfSettings] = None):
+    if settings is None:
+        settings = PdfSettings()
+    if settings.vector:
+        plan = compile_deck(renderer.deck, renderer.target_card)
+        num = len(plan.faces) // 2
+        logging.info("Num cards {}".format(num))
+        image_scale = renderer.max_image_scale
+    else:
+        # count the input files
+        num = 0
+        while True:
+            s = "card_bot_{:03}.png".format(num)
+            tmp = os.path.join(renderer.outdir, s)
+            if os.path.exists(tmp):
+                num += 1
+            else:
+                break
+        logging.info("Num files {}".format(num))
 
     w = renderer.card_size[0]
     h = renderer.card_size[1]
 
-    for pagesize, name in [(QtGui.QPageSize.Letter, "Letter"), (QtGui.QPageSize.A4, "A4")]:
-        s = "deck_{}.pdf".format(name)
+    # the card images read ahead (a few per worker) and kept for later pages fit in
+    # the memory budget
+    card_bytes = (825 + 2 * renderer.pad_size) * (1425 + 2 * renderer.pad_size) * 4
+    max_workers = budget_workers(
+        "pdf card reads", settings.max_workers, settings.max_memory, 3 * card_bytes
+    )
+    max_shared = None
+    if settings.max_memory is not None:
+        headroom = settings.max_memory - (current_rss() or 0)
+        max_shared = max(int(headroom // card_bytes) - 3 * max_workers, 0)
+
+    # Open all of the pdf files first.  Files with the same number of cards per page
+    # are written in one pass, so each card face is read (decoded) once for them.
+    groups = dict()
+    for images, name in itertools.product(settings.images, settings.page_sizes):
+        s = "deck_{}{}.pdf".format(name, images.suffix)
         tmp = os.path.join(renderer.outdir, s)
         writer = QtGui.QPdfWriter(tmp)
-        writer.setPageSize(pagesize)
-        writer.setResolution(300)
+        writer.setPageSize(QtGui.QPageSize(page_size_id(name)))
+        writer.setResolution(PDF_DPI)
         writer.setCreator("build_pdf tool")
 
         painter = QtGui.QPainter()
         painter.begin(writer)
+        painter.setRenderHint(QtGui.QPainter.LosslessImageRendering, images.lossless)
 
         r = painter.viewport()
         logging.info(
             "{} page rectangle: {} {} {} {}".format(name, r.left(), r.top(), r.width(), r.height())
         )
-        pw = r.width()
-        ph = r.height()
-        xspace = (pw - 2 * w) / 3
-        yspace = (ph - 2 * h) / 3
-
-        done = 0
-        pnum = 1
-        while done < num:
-            logging.info("Writing page: {}".format(pnum))
-
-            if done + 0 < num:
-                do_card(painter, done + 0, w, h, xspace, yspace, True, renderer)
-            if done + 1 < num:
-                do_card(painter, done + 1, w, h, 2 * xspace + w, yspace, True, renderer)
-            if done + 2 < num:
-                do_card(painter, done + 2, w, h, xspace, 2 * yspace + h, True, renderer)
-            if done + 3 < num:
-                do_card(painter, done + 3, w, h, 2 * xspace + w, 2 * yspace + h, True, renderer)
-            writer.newPage()
-
-            if done + 0 < num:
-                do_card(painter, done + 0, w, h, 2 * xspace + w, yspace, False, renderer)
-            if done + 1 < num:
-                do_card(painter, done + 1, w, h, xspace, yspace, False, renderer)
-            if done + 2 < num:
-                do_card(painter, done + 2, w, h, 2 * xspace + w, 2 * yspace + h, False, renderer)
-            if done + 3 < num:
-                do_card(painter, done + 3, w, h, xspace, 2 * yspace + h, False, renderer)
-
-            pnum += 1
-            done += 4
-            if done < num:
-                writer.newPage()
-
-        painter.end()
+        imposition = Imposition(
+            (r.width(), r.height()),
+            (w, h),
+            columns=settings.columns,
+            rows=settings.rows,
+            gutter=settings.gutter,
+            bleed=settings.bleed,
+            duplex=settings.duplex,
+        )
+        logging.info(
+            "{} layout: {}x{} cards per page".format(name, imposition.columns, imposition.rows)
+        )
+        groups.setdefault(imposition.cards_per_page, list()).append(
+            PdfFile(writer, painter, imposition, images)
+        )
+
+    for per_page, pdfs in groups.items():
+        # the files with the same image resolution next to each other, so each face is
+        # prepared (downsampled) once for them
+        pdfs.sort(key=lambda pdf: -1 if pdf.images.max_dpi is None else pdf.images.max_dpi)
+        # the faces in the order they are drawn: the fronts of a sheet, then the backs
+        sheets = [(start, min(per_page, num - start)) for start in range(0, num, per_page)]
+        order = list()
+        for start, count in sheets:
+            for top in (True, False):
+                order.extend((start + i, top) for i in range(count))
+        if settings.vector:
+            # the faces of the plan are in card order, the top followed by the bottom
+            faces = iter([plan.faces[2 * n + (0 if top else 1)] for n, top in order])
+            if renderer.backend == "painter":
+                draw = functools.partial(do_plan_card, renderer)
+            else:
+                draw = do_scene_card
+        else:
+            faces = read_cards(renderer, order, max_workers, max_shared)
+            draw = do_card
+
+        for pnum, (start, count) in enumerate(sheets):
+            logging.info("Writing page: {}".format(pnum + 1))
+            for back in (False, True):
+                if back or (pnum > 0):
+                    for pdf in pdfs:
+                        pdf.writer.newPage()
+                if settings.cut_marks:
+                    for pdf in pdfs:
+                        do_cut_marks(pdf.painter, pdf.imposition, back)
+                slots = [pdf.imposition.slots(back) for pdf in pdfs]
+                for i in range(count):
+                    face = next(faces)
+                    max_dpi = -1  # nothing prepared yet
+                    for pdf, pdf_slots in zip(pdfs, slots):
+                        if pdf.images.max_dpi != max_dpi:
+                            max_dpi = pdf.images.max_dpi
+                            if settings.vector:
+                                card = plan_scene(renderer, face, max_dpi)
+                            else:
+                                card = downsample_card(face, w, max_dpi)
+                        draw(pdf.painter, card, w, h, pdf_slots[i].x, pdf_slots[i].y)
+
+        for pdf in pdfs:
+            pdf.painter.end()
 
+    if settings.vector:
+        renderer.max_image_scale = image_scale
     return
@@ -0,0 +1,179 @@
+#
+# T.I.M.E Stories card generator
+# Copyright (C) Randall Frank
+# See LICENSE for details
+#
+
+import glob
+import json
+import logging
+import os
+import re
+import sys
+import threading
+from typing import Dict, List, Optional
+
+# The machine readable build report of build_deck --report and the memory accounting
+# of --max-memory.
+#
+# The caches of the render path count their hits and misses in the CacheStats of
+# cache_stats(name), which the report lists with their hit rates:
+#   file decodes      file assets sharing the decode of an identical file (the deck
+#                     object model does not count them, build_deck passes these
+#                     stats to Deck.load())
+#   card faces        faces linked to an identical face or unchanged since the last render
+#   pdf card reads    faces read once for several pdf pages
+#   tts sheets        Tabletop Simulator sheets unchanged since the last build
+#   tts card decodes  cards decoded once for several cells of a sheet
+#
+# The memory budget limits the workers of the pdf and Tabletop Simulator stages (and
+# the faces the pdf stage keeps for later pages) to what fits in the memory left by
+# the process at the start of the stage.
+
+MEMORY_UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30}
+
+
+class CacheStats(object):
+    def __init__(self, name: str):
+        self.name: str = name
+        self.hits: int = 0
+        self.misses: int = 0
+        self._lock = threading.Lock()
+
+    def hit(self, count: int = 1):
+        with self._lock:
+            self.hits += count
+
+    def miss(self, count: int = 1):
+        with self._lock:
+            self.misses += count
+
+    def hit_rate(self) -> Optional[float]:
+        total = self.hits + self.misses
+        return self.hits / total if total else None
+
+    def to_json(self) -> dict:
+        return dict(hits=self.hits, misses=self.misses, hit_rate=self.hit_rate())
+
+
+_caches: Dict[str, CacheStats] = dict()
+_caches_lock = threading.Lock()
+
+
+def cache_stats(name: str) -> CacheStats:
+    with _caches_lock:
+        if name not in _caches:
+            _caches[name] = CacheStats(name)
+        return _caches[name]
+
+
+def reset_cache_stats():
+    with _caches_lock:
+        _caches.clear()
+
+
+def parse_memory(text: str) -> int:
+    # a size in bytes, with an optional K, M or G suffix, e.g. 1.5G
+    match = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([KMG]?)B?\s*$", text, re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"Invalid memory size: {text}")
+    return int(float(match.group(1)) * MEMORY_UNITS[match.group(2).upper()])
+
+
+def peak_rss() -> Optional[int]:
+    # the largest resident set size of the process so far, in bytes
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes, except on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def current_rss() -> Optional[int]:
+    # the resident set size of the process, the peak where it is not known
+    try:
+        with open("/proc/self/statm", "r") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return peak_rss()
+
+
+def budget_workers(
+    name: str, max_workers: Optional[int], max_memory: Optional[int], per_worker: int
+) -> Optional[int]:
+    # the workers (None for one per cpu) that fit in the memory left by the process
+    if max_memory is None:
+        return max_workers
+    workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+    headroom = max_memory - (current_rss() or 0)
+    fits = max(int(headroom // max(per_worker, 1)), 1)
+    if fits < workers:
+        logging.info(f"{name}: {fits} workers instead of {workers} for the memory budget")
+        return fits
+    return workers
+
+
+def output_bytes(outdir: str) -> Dict[str, dict]:
+    # the files and bytes of each output format in outdir, card images that are links
+    # to the same file are counted once
+    formats = dict(
+        cards=glob.glob(os.path.join(outdir, "card_*.png")),
+        pdf=glob.glob(os.path.join(outdir, "deck_*.pdf")),
+        tts=glob.glob(os.path.join(outdir, "deck_*.png"))
+        + glob.glob(os.path.join(outdir, "deck_tts.json")),
+    )
+    result = dict()
+    for name, files in formats.items():
+        inodes = dict()
+        for filename in files:
+            st = os.stat(filename)
+            inodes[(st.st_dev, st.st_ino)] = st.st_size
+        result[name] = dict(files=len(files), bytes=sum(inodes.values()))
+    return result
+
+
+def largest_assets(deck, count: int = 10) -> List[dict]:
+    # the decoded file assets holding the most pixels, shared decodes are listed once
+    seen = set()
+    assets = list()
+    for f in deck.files:
+        if not f.is_decoded():
+            continue
+        image = f.image
+        key = image.cacheKey()
+        if image.isNull() or (key in seen):
+            continue
+        seen.add(key)
+        assets.append(
+            dict(
+                name=f.name,
+                width=image.width(),
+                height=image.height(),
+                bytes=image.sizeInBytes(),
+            )
+        )
+    assets.sort(key=lambda a: -a["bytes"])
+    return assets[:count]
+
+
+def build_report(deck, render, profiler, max_memory: Optional[int] = None) -> dict:
+    faces = dict(render.face_counts)
+    stages = dict()
+    for name, wall, cpu, _ in profiler.totals("stage"):
+        stages[name] = dict(wall_ms=round(wall, 1), cpu_ms=round(cpu, 1))
+    return dict(
+        cards=faces.get("total", 0) // 2,
+        faces=faces,
+        outputs=output_bytes(render.outdir),
+        stages=stages,
+        caches={name: stats.to_json() for name, stats in sorted(_caches.items())},
+        memory=dict(peak_rss=peak_rss(), max_memory=max_memory),
+        largest_assets=largest_assets(deck),
+    )
+
+
+def write_report(filename: str, report: dict):
+    with open(filename, "w") as fp:
+        json.dump(report, fp, indent=1)
@@ -4,13 +4,316 @@
 # See LICENSE for details
 #
 
+import concurrent.futures
+import hashlib
+import json
 import logging
+import os
 import os.path
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 from PySide6 import QtCore, QtGui
+from build_report import budget_workers, cache_stats
+import numpy
+from tts_packer import SheetLayout, pack_cards
 
+# The card images are packed into sheets ("deck" images), by default at 150dpi,
+# half of the resolution of the card images.  The (opaque) cards are handled as
+# arrays of the bytes of ARGB32 pixels, the format the png files are read in.
+PIXEL_FORMAT = QtGui.QImage.Format_ARGB32
 
-def generate_tts(render):
+# The Tabletop Simulator saved object for the sheets.  It also records the hash
+# of what went into each sheet, so unchanged sheets are not rebuilt.
+TTS_OBJECT_FILE = "deck_tts.json"
+# part of the sheet hashes, change it when the sheet pixels change
+SHEET_VERSION = 3
+# the card files are hashed in pieces of this many bytes
+HASH_CHUNK = 1 << 20
+
+
+class TtsSettings(object):
+    def __init__(self):
+        # the largest sheet width and height
+        self.max_texture: int = 5000
+        # sheets (textures) with power of two sizes, the cards are stretched to fit
+        self.power_of_two: bool = False
+        # the size of the cards on the sheets, relative to the card size
+        self.scale: float = 0.5
+        # cards can be reduced down to this scale to put more of them on a sheet,
+        # None for scale
+        self.min_scale: Optional[float] = None
+        # the cards with the same back share a single back image
+        self.shared_backs: bool = True
+        # the number of threads building sheets, None for one per cpu
+        self.max_workers: Optional[int] = None
+        # the memory (bytes) of the process the sheets being built should fit in, None
+        # for no limit
+        self.max_memory: Optional[int] = None
+
+
+class Sheet(NamedTuple):
+    pp: str  # "top" or "bot"
+    tile: int
+    cards: Tuple[int, ...]  # the card numbers, in the order of the cells
+    layout: SheetLayout
+
+
+class Tile(NamedTuple):
+    # the top sheet and the back image (a sheet or a single shared back) of a custom deck
+    top: Sheet
+    back: Sheet
+    shared_back: bool
+
+
+def image_array(img: QtGui.QImage) -> numpy.ndarray:
+    # a (height, width, 4) view of the pixels of an image in PIXEL_FORMAT
+    data = numpy.frombuffer(img.constBits(), numpy.uint8)
+    data = data.reshape(img.height(), img.bytesPerLine())[:, : img.width() * 4]
+    return data.reshape(img.height(), img.width(), 4)
+
+
+def half_size(pixels: numpy.ndarray, out: Optional[numpy.ndarray] = None) -> numpy.ndarray:
+    # 2:1 box filter, an odd last row or column is dropped
+    h = pixels.shape[0] // 2
+    w = pixels.shape[1] // 2
+    pixels = pixels[: 2 * h, : 2 * w]
+    rows = numpy.add(pixels[0::2], pixels[1::2], dtype=numpy.uint16)
+    total = rows[:, 0::2] + rows[:, 1::2]
+    total += 2
+    if out is None:
+        out = numpy.empty((h, w, 4), numpy.uint8)
+    return numpy.right_shift(total, 2, out=out, casting="unsafe")
+
+
+def place_card(face: QtGui.QImage, out: numpy.ndarray):
+    # the card image reduced to the size of out, into out
+    h, w = out.shape[:2]
+    face = face.convertToFormat(PIXEL_FORMAT)
+    hw = face.width() // 2
+    hh = face.height() // 2
+    if (hw <= w <= hw + 1) and (hh <= h <= hh + 1):
+        half_size(image_array(face), out[:hh, :hw])
+        # the cells rounded up a pixel repeat the last column or row
+        out[:, hw:] = out[:, hw - 1 : hw]
+        out[hh:, :] = out[hh - 1 : hh, :]
+    else:
+        tmp = face.scaled(w, h, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation)
+        out[...] = image_array(tmp)
+
+
+def sheet_name(pp: str, tile: int) -> str:
+    return "deck_{}_{}.png".format(pp, tile)
+
+
+def sheet_url(outdir: str, sheet: Sheet) -> str:
+    path = os.path.abspath(os.path.join(outdir, sheet_name(sheet.pp, sheet.tile)))
+    return QtCore.QUrl.fromLocalFile(path).toString()
+
+
+def card_file(pp: str, num: int) -> str:
+    return "card_{}_{:03}.png".format(pp, num)
+
+
+def hash_file(path: str, *digests):
+    # add the bytes of a file to the digests, without holding all of them in memory
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(HASH_CHUNK), b""):
+            for digest in digests:
+                digest.update(chunk)
+
+
+def build_sheet(outdir: str, sheet: Sheet, previous: Optional[str]) -> str:
+    # Place the cards of the sheet, reduced, on the sheet image and save it, unless the
+    # hash of the card files and the layout matches the previous one.  Returns the hash.
+    # The card files are only read for the hash here, a worker holds the sheet and
+    # one decoded card.
+    digest = hashlib.sha256(repr((SHEET_VERSION, sheet)).encode())
+    cards = list()
+    for num in sheet.cards:
+        s = card_file(sheet.pp, num)
+        card_digest = hashlib.sha256()
+        hash_file(os.path.join(outdir, s), digest, card_digest)
+        cards.append((s, card_digest.digest()))
+    name = sheet_name(sheet.pp, sheet.tile)
+    if (digest.hexdigest() == previous) and os.path.exists(os.path.join(outdir, name)):
+        logging.info("Unchanged {}".format(name))
+        cache_stats("tts sheets").hit()
+        return previous
+    cache_stats("tts sheets").miss()
+    stats = cache_stats("tts card decodes")
+    width, height = sheet.layout.size
+    pixels = numpy.zeros((height, width, 4), numpy.uint8)
+    # identical card files are decoded once for each cell size (the cells can differ
+    # by a pixel)
+    placed = dict()
+    for i, (s, card_digest) in enumerate(cards):
+        x, y, w, h = sheet.layout.slot(i)
+        if (card_digest, w, h) in placed:
+            x0, y0 = placed[(card_digest, w, h)]
+            pixels[y : y + h, x : x + w] = pixels[y0 : y0 + h, x0 : x0 + w]
+            stats.hit()
+            continue
+        stats.miss()
+        face = QtGui.QImage(os.path.join(outdir, s), "png")
+        logging.info("Reading: {}".format(s))
+        place_card(face, pixels[y : y + h, x : x + w])
+        placed[(card_digest, w, h)] = (x, y)
+    img = QtGui.QImage(pixels.data, width, height, width * 4, PIXEL_FORMAT)
+    img.save(os.path.join(outdir, name), "png")
+    logging.info("Saving {}".format(name))
+    return digest.hexdigest()
+
+
+def read_sheet_hashes(outdir: str) -> Dict[str, str]:
+    # the sheet hashes recorded by the last run, if any
+    try:
+        with open(os.path.join(outdir, TTS_OBJECT_FILE), "r") as fp:
+            hashes = json.load(fp).get("SheetHashes", dict())
+    except (OSError, ValueError, AttributeError):
+        return dict()
+    return hashes if isinstance(hashes, dict) else dict()
+
+
+def card_groups(render, num: int, shared_backs: bool) -> List[Tuple[List[int], bool]]:
+    # The cards packed together and if they share one back.  With shared_backs, the
+    # cards with identical back images (at least two) are grouped by back.  The backs
+    # are compared by their render plan digests when the renderer has them all.
+    if not shared_backs:
+        return [(list(range(num)), False)]
+    names = [card_file("bot", n) for n in range(num)]
+    digests = getattr(render, "face_digests", dict())
+    if not all(name in digests for name in names):
+        digests = dict()
+        for name in names:
+            digest = hashlib.sha256()
+            hash_file(os.path.join(render.outdir, name), digest)
+            digests[name] = digest.hexdigest()
+    backs = dict()
+    for n, name in enumerate(names):
+        backs.setdefault(digests[name], list()).append(n)
+    unique = sorted(n for cards in backs.values() if len(cards) == 1 for n in cards)
+    groups = [(unique, False)] if unique else list()
+    groups.extend((cards, True) for cards in backs.values() if len(cards) > 1)
+    return groups
+
+
+def plan_tiles(render, num: int, settings: TtsSettings) -> List[Tile]:
+    card_size = (render.card_size[0], render.card_size[1])
+    tiles = list()
+    for cards, shared in card_groups(render, num, settings.shared_backs):
+        layouts = pack_cards(
+            len(cards),
+            card_size,
+            max_texture=settings.max_texture,
+            scale=settings.scale,
+            min_scale=settings.min_scale,
+            power_of_two=settings.power_of_two,
+        )
+        if shared:
+            # the shared back is a single image, not a grid
+            single = pack_cards(
+                1,
+                card_size,
+                max_texture=settings.max_texture,
+                scale=settings.scale,
+                power_of_two=settings.power_of_two,
+                min_cells=1,
+            )[0]
+            back = Sheet("bot", len(tiles), (cards[0],), single)
+        start = 0
+        for layout in layouts:
+            tile = len(tiles)
+            chunk = tuple(cards[start : start + layout.capacity])
+            start += len(chunk)
+            top = Sheet("top", tile, chunk, layout)
+            if not shared:
+                back = Sheet("bot", tile, chunk, layout)
+            tiles.append(Tile(top, back, shared))
+    return tiles
+
+
+def report_tiles(tiles: List[Tile], card_size) -> None:
+    # log the layout of the sheets and the texels not covered by cards
+    texels = 0
+    wasted = 0
+    sheets = [tile.top for tile in tiles]
+    sheets.extend(tile.back for tile in tiles if tile.back.tile == tile.top.tile)
+    for sheet in sheets:
+        layout = sheet.layout
+        waste = layout.wasted_texels(len(sheet.cards))
+        logging.info(
+            "{}: {} cards, {}x{} grid, {}x{} texture, card scale {:.3f}, {:.1f}% wasted".format(
+                sheet_name(sheet.pp, sheet.tile),
+                len(sheet.cards),
+                layout.columns,
+                layout.rows,
+                layout.size[0],
+                layout.size[1],
+                layout.scale(card_size),
+                100.0 * waste / layout.texels,
+            )
+        )
+        texels += layout.texels
+        wasted += waste
+    if texels:
+        logging.info(
+            "Tabletop Simulator sheets: {} textures, {} texels, {} ({:.1f}%) wasted".format(
+                len(sheets), texels, wasted, 100.0 * wasted / texels
+            )
+        )
+
+
+def tts_object(outdir: str, tiles: List[Tile], hashes: Dict[str, str]) -> dict:
+    # A saved object with one custom deck.  Each tile is a "CustomDeck" and card i of
+    # tile t has the CardID 100 * (t + 1) + i.  The cards are in card number order.
+    transform = dict(
+        posX=0.0,
+        posY=1.0,
+        posZ=0.0,
+        rotX=0.0,
+        rotY=180.0,
+        rotZ=180.0,
+        scaleX=1.0,
+        scaleY=1.0,
+        scaleZ=1.0,
+    )
+    custom_decks = dict()
+    cards = list()
+    for tile in tiles:
+        key = str(tile.top.tile + 1)
+        custom_decks[key] = dict(
+            FaceURL=sheet_url(outdir, tile.top),
+            BackURL=sheet_url(outdir, tile.back),
+            NumWidth=tile.top.layout.columns,
+            NumHeight=tile.top.layout.rows,
+            BackIsHidden=True,
+            UniqueBack=not tile.shared_back,
+            Type=0,
+        )
+        for i, num in enumerate(tile.top.cards):
+            card = dict(
+                Name="Card",
+                Nickname="Card {}".format(num),
+                CardID=100 * (tile.top.tile + 1) + i,
+                CustomDeck={key: custom_decks[key]},
+                Transform=transform,
+            )
+            cards.append((num, card))
+    cards = [card for _, card in sorted(cards, key=lambda item: item[0])]
+    deck = dict(
+        Name="DeckCustom",
+        Nickname="T.I.M.E Stories deck",
+        Transform=transform,
+        DeckIDs=[card["CardID"] for card in cards],
+        CustomDeck=custom_decks,
+        ContainedObjects=cards,
+    )
+    return dict(SaveName="", ObjectStates=[deck], SheetHashes=hashes)
+
+
+def generate_tts(render, settings: Optional[TtsSettings] = None):
+    if settings is None:
+        settings = TtsSettings()
     num = 0
     while True:
         s = "card_bot_{:03}.png".format(num)
@@ -21,55 +324,34 @@ def generate_tts(render):
             break
     logging.info("Num files {}".format(num))
 
-    w = int(945 / 2)
-    h = int(1535 / 2)
-    w = int(825 / 2)
-    h = int(1425 / 2)
-
-    # 150dpi
-    w = render.card_size[0] * 0.5
-    h = render.card_size[1] * 0.5
-
-    # maximum texture size should be 5kx5k
-    nx = int(5000 / w)
-    ny = int(5000 / h)
-    # and no more than 10 cards by 7 cards
-    if nx > 10:
-        nx = 10
-    if ny > 7:
-        ny = 7
-    dx = w * nx
-    dy = h * ny
-
-    for pp in ["top", "bot"]:
-        tile = 0
-        done = 0
-        while done < num:
-            img = QtGui.QImage(dx, dy, QtGui.QImage.Format_RGBA8888)
-            p = QtGui.QPainter()
-            p.begin(img)
-            for y in range(ny):
-                for x in range(nx):
-                    if done < num:
-                        s = "card_{}_{:03}.png".format(pp, done)
-                        tmp = os.path.join(render.outdir, s)
-                        face = QtGui.QImage(tmp, "png")
-                        logging.info("Reading: {}".format(s))
-                        # scale
-                        tmp = face.scaled(
-                            w, h, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation
-                        )
-                        # paste
-                        src = QtCore.QRectF(0, 0, w, h)
-                        tgt = QtCore.QRectF(x * w, y * h, w, h)
-                        p.drawImage(tgt, tmp, src)
-                        #
-                        done += 1
-            p.end()
-            s = "deck_{}_{}.png".format(pp, tile)
-            tmp = os.path.join(render.outdir, s)
-            img.save(tmp, "png")
-            logging.info("Saving {}".format(s))
-            tile += 1
+    tiles = plan_tiles(render, num, settings)
+    report_tiles(tiles, render.card_size)
+
+    # the sheets of the tops and the bottoms are built in parallel
+    sheets = [tile.top for tile in tiles]
+    sheets.extend(tile.back for tile in tiles if tile.back.tile == tile.top.tile)
+    previous = read_sheet_hashes(render.outdir)
+    # a worker holds a sheet and a decoded card
+    largest = max((sheet.layout.texels for sheet in sheets), default=0)
+    card_bytes = render.card_size[0] * render.card_size[1] * 4
+    max_workers = budget_workers(
+        "Tabletop Simulator sheets",
+        settings.max_workers,
+        settings.max_memory,
+        largest * 4 + card_bytes,
+    )
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+        names = [sheet_name(sheet.pp, sheet.tile) for sheet in sheets]
+        futures = [
+            pool.submit(build_sheet, render.outdir, sheet, previous.get(name))
+            for name, sheet in zip(names, sheets)
+        ]
+        hashes = {name: future.result() for name, future in zip(names, futures)}
 
+    s = TTS_OBJECT_FILE
+    with open(os.path.join(render.outdir, s), "w") as fp:
+        json.dump(tts_object(render.outdir, tiles, hashes), fp, indent=1)
+    logging.info("Saving {}".format(s))
     return
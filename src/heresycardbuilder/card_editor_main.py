@@ -4,17 +4,23 @@
 # See LICENSE for details
 #
 from datetime import date
-import io
-import json
-import threading
 from typing import Optional
 
 from PySide6 import QtCore, QtGui, QtWidgets
 from asset_gui import AssetGui
-from card_objects import Card, Deck, Face, Renderable, build_empty_deck
-from card_render import ImageRender, RectRender, Renderer, TextRender
-from dulwich import porcelain
-import requests
+from card_objects import (
+    Card,
+    Deck,
+    Face,
+    ImageRender,
+    RectRender,
+    Renderable,
+    TextRender,
+    build_empty_deck,
+)
+from card_render import Renderer
+from git_clone import CloneWorker
+from github_repos import GithubRepoQuery
 from utilities import is_directory
 from view_widgets import CERenderableItem, CETreeWidgetItem
 
@@ -39,6 +45,8 @@ class CardEditorMain(AssetGui):
         self._changing_selection: bool = False
         self._renderer: Optional[Renderer] = None
         self._zoom: float = 1.0
+        self._repo_query: Optional[GithubRepoQuery] = None
+        self._clone_worker: Optional[CloneWorker] = None
         self.do_new()
         self.lwGfxItems.setContextMenuPolicy(QtCore.Qt.CustomContextMenu)
         self.lwGfxItems.customContextMenuRequested.connect(self.do_renderlist_context_menu)
@@ -525,18 +533,17 @@ class CardEditorMain(AssetGui):
         self.actionFrontFace.setText(tmp)
 
     def update_github_repo_list(self):
-        # Query for repos that have the "heresycarddeck" topic set
-        url = "https://api.github.com/search/repositories?q=topic:heresycarddeck"
-        r = requests.get(url)
-        if r.status_code == 200:
-            info = json.loads(r.text)
-            for item in info.get("items", []):
-                target = item.get("clone_url", "")
-                if target:
-                    action = QtGui.QAction(item.get("full_name", "Unknown name"), self)
-                    action.setProperty("github", target)
-                    action.triggered.connect(self.handle_github_download)
-                    self.menuDownload.addAction(action)
+        # Query for repos that have the "heresycarddeck" topic set, in the background
+        self._repo_query = GithubRepoQuery(self)
+        self._repo_query.finished.connect(self.add_github_repos)
+        self._repo_query.start()
+
+    def add_github_repos(self, repos: list):
+        for name, target in repos:
+            action = QtGui.QAction(name, self)
+            action.setProperty("github", target)
+            action.triggered.connect(self.handle_github_download)
+            self.menuDownload.addAction(action)
 
     def handle_github_download(self, _) -> None:
         action = self.sender()
@@ -552,33 +559,49 @@ class CardEditorMain(AssetGui):
                     "The selected path is not a directory or is not empty.",
                 )
                 return
-            output = dict()
-            thread = threading.Thread(target=self.download, args=(url, destination, output))
-            dlg = QtWidgets.QProgressDialog(
-                "Downloading content via git clone.", "", 0, 0, parent=self
+            self.start_clone(url, destination)
+
+    def start_clone(self, url: str, destination: str) -> None:
+        # the clone runs on a worker thread and reports through signals, the modal
+        # dialog keeps the rest of the editor out of the way until it finishes
+        worker = CloneWorker(url, destination, self)
+        dlg = QtWidgets.QProgressDialog(
+            "Downloading content via git clone.", "Cancel", 0, 100, parent=self
+        )
+        dlg.setWindowTitle("Downloading")
+        dlg.setModal(True)
+        dlg.setMinimumDuration(0)
+        dlg.setAutoClose(False)
+        dlg.setAutoReset(False)
+        worker.progress.connect(lambda percent, text: self.clone_progress(dlg, percent, text))
+        worker.finished.connect(lambda error: self.clone_finished(worker, dlg, error))
+        dlg.canceled.connect(worker.cancel)
+        self._clone_worker = worker
+        dlg.show()
+        worker.start()
+
+    def clone_progress(self, dlg: QtWidgets.QProgressDialog, percent: int, text: str) -> None:
+        dlg.setValue(percent)
+        dlg.setLabelText(f"Downloading content via git clone.\n{text}")
+
+    def clone_finished(
+        self, worker: CloneWorker, dlg: QtWidgets.QProgressDialog, error: str
+    ) -> None:
+        self._clone_worker = None
+        # the clone may have been cancelled after the worker finished
+        error = worker.result(error)
+        # closing the dialog emits canceled
+        cancelled = worker.is_cancelled()
+        dlg.canceled.disconnect(worker.cancel)
+        dlg.close()
+        worker.deleteLater()
+        if cancelled:
+            return
+        if error:
+            QtWidgets.QMessageBox.critical(
+                self, "Clone error", f"The selected repo could not be cloned ({error})."
+            )
+        else:
+            QtWidgets.QMessageBox.information(
+                self, "Success", "The selected repo has been successfully cloned."
             )
-            dlg.setWindowTitle("Downloading")
-            dlg.setModal(True)
-            dlg.show()
-            thread.start()
-            while thread.is_alive():
-                QtWidgets.QApplication.instance().processEvents()
-            thread.join()
-            dlg.close()
-            error_txt = output.get("error", "")
-            if error_txt:
-                QtWidgets.QMessageBox.critical(
-                    self, "Clone error", f"The selected repo could not be cloned ({error_txt})."
-                )
-            else:
-                QtWidgets.QMessageBox.information(
-                    self, "Success", "The selected repo has been successfully cloned."
-                )
-
-    def download(self, url: str, destination: str, result: dict) -> None:
-        buffer = io.BytesIO()
-        try:
-            porcelain.clone(url, destination, errstream=buffer)
-        except Exception as e:
-            result["error"] = str(e)
-        result["stderr"] = buffer.getvalue().decode("ascii")
@@ -5,16 +5,189 @@
 #
 
 import base64
+import concurrent.futures
+import copy
+import hashlib
+import math
 import os
 import os.path
-from typing import List, Optional
+import re
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple, Union
 
 from PySide6 import QtCore, QtGui, QtWidgets, QtXml
 
 # these are the core objects that represent a deck of cards to the editor
 
 
+class DeckFormatError(ValueError):
+    """A deck element holds a value that does not match the declared field type."""
+
+    def __init__(self, message: str, line: int = -1):
+        if line > 0:
+            message = f"line {line}: {message}"
+        super(DeckFormatError, self).__init__(message)
+        self.line = line
+
+
+# Field descriptors declare the child elements of a deck object, so the load and save
+# routines can be generated from them instead of being written out by hand per class.
+
+
+class Field(object):
+    def __init__(self, name: str):
+        self.name = name
+
+    def parse(self, text: str, line: int = -1):
+        return text
+
+    def format(self, value) -> str:
+        return str(value)
+
+
+class StringField(Field):
+    pass
+
+
+class IntField(Field):
+    def parse(self, text: str, line: int = -1) -> int:
+        try:
+            return int(text)
+        except ValueError:
+            raise DeckFormatError(f"<{self.name}> expects an integer, not '{text}'", line)
+
+
+class FloatField(Field):
+    def parse(self, text: str, line: int = -1) -> float:
+        try:
+            return float(text)
+        except ValueError:
+            raise DeckFormatError(f"<{self.name}> expects a number, not '{text}'", line)
+
+
+class IntListField(Field):
+    """A fixed length list of integers stored in Python list syntax, e.g. [0, 0, -1, -1]."""
+
+    def __init__(self, name: str, arity: int):
+        super(IntListField, self).__init__(name)
+        self.arity = arity
+
+    def parse(self, text: str, line: int = -1) -> List[int]:
+        body = text.strip()
+        if len(body) < 2 or body[0] not in "[(" or body[-1] not in "])":
+            raise DeckFormatError(f"<{self.name}> expects a list of integers, not '{text}'", line)
+        items = body[1:-1].split(",")
+        if len(items) and not items[-1].strip():
+            items.pop()  # allow a trailing comma
+        if len(items) != self.arity:
+            raise DeckFormatError(
+                f"<{self.name}> expects {self.arity} values, found {len(items)} in '{text}'", line
+            )
+        values = []
+        for item in items:
+            try:
+                values.append(int(item))
+            except ValueError:
+                try:
+                    values.append(int(float(item)))
+                except ValueError:
+                    raise DeckFormatError(f"<{self.name}> has a non-integer value '{item}'", line)
+        return values
+
+    def format(self, value) -> str:
+        return "[" + ", ".join(str(v) for v in value) + "]"
+
+
+class IntTuple(object):
+    """Attribute holding a fixed list of ints, stored as a tuple in a private slot.
+
+    Lists may be assigned, but the value read back is always an immutable tuple, so
+    copies of the owning object can share it.
+    """
+
+    def __set_name__(self, owner, name: str):
+        self.slot = "_" + name
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        return getattr(obj, self.slot)
+
+    def __set__(self, obj, value):
+        setattr(obj, self.slot, tuple(value))
+
+
+def scaled_size(w: float, h: float, width: float, height: float) -> Tuple[float, float]:
+    # Resolve a renderable size against the natural (width, height) of an image.
+    # -1 selects the natural size, -2 preserves the aspect ratio set by the other value.
+    if w == -1:
+        w = width
+    if h == -1:
+        h = height
+    if w == -2:
+        w = width
+        if h > 0:
+            w = float(h) / float(height) * float(w)
+    if h == -2:
+        h = height
+        if w > 0:
+            h = float(w) / float(width) * float(h)
+    return w, h
+
+
+def inline_image_tokens(text: str) -> Iterator[Tuple[str, Optional[int], Optional[int]]]:
+    # The {I:image_name:dx:dy} tokens in renderable text. dx, dy are None if invalid.
+    for match in _INLINE_IMAGE.finditer(text):
+        info = match.group(1).split(":")
+        if len(info) != 3:
+            continue
+        try:
+            yield info[0], int(info[1]), int(info[2])
+        except ValueError:
+            yield info[0], None, None
+
+
+_INLINE_IMAGE = re.compile(r"\{I:([^}]*)\}")
+_UNSET = object()
+_IMMUTABLE_TYPES = (str, int, float, bool, tuple, type(None))
+
+
 class Base(object):
+    __slots__ = ("name", "xml_tag")
+
+    # the child element fields of this object, in the order they are saved
+    fields: Tuple[Field, ...] = ()
+    _field_map: Dict[str, Field] = {}
+    _all_slots: Tuple[str, ...] = __slots__
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_map = {f.name: f for f in cls.fields}
+        cls._all_slots = tuple(
+            s for c in reversed(cls.__mro__) for s in c.__dict__.get("__slots__", ())
+        )
+
+    def __copy__(self):
+        dup = self.__class__.__new__(self.__class__)
+        for slot in self._all_slots:
+            value = getattr(self, slot, _UNSET)
+            if value is not _UNSET:
+                setattr(dup, slot, value)
+        return dup
+
+    def __deepcopy__(self, memo):
+        # The generic slot copy goes through __reduce_ex__, walk the slots directly
+        # instead.  Strings, numbers and the int tuples are immutable and are shared.
+        dup = self.__class__.__new__(self.__class__)
+        memo[id(self)] = dup
+        for slot in self._all_slots:
+            value = getattr(self, slot, _UNSET)
+            if value is _UNSET:
+                continue
+            if type(value) not in _IMMUTABLE_TYPES:
+                value = copy.deepcopy(value, memo)
+            setattr(dup, slot, value)
+        return dup
+
     def __init__(self, name: str, xml_tag: str):
         self.name = name
         self.xml_tag = xml_tag
@@ -31,64 +204,29 @@ class Base(object):
     def get_xml_name(self) -> str:
         return self.xml_tag
 
-    def load_attrib_string(self, elem, name: str, default: Optional[str] = None):
+    def load_fields(self, elem) -> Set[str]:
+        # Single pass over the child elements, decoding the ones that match a declared
+        # field.  As with firstChildElement(), the first instance of a tag wins.
+        # Returns the names of the fields that were present.
         QtWidgets.QApplication.processEvents()
-        tmp = elem.firstChildElement(name)
-        v = default
-        if not tmp.isNull():
-            v = str(tmp.text())
-        if v is not None:
-            self.__setattr__(name, v)
-
-    def save_attrib_string(self, doc, parent, name: str):
-        tmp = doc.createElement(name)
-        parent.appendChild(tmp)
-        s = self.__getattribute__(name)
-        text = doc.createTextNode(str(s))
-        tmp.appendChild(text)
-
-    def load_attrib_int(self, elem, name, default: Optional[int] = None):
-        tmp = elem.firstChildElement(name)
-        v = default
-        if not tmp.isNull():
-            try:
-                v = int(str(tmp.text()))
-            except ValueError:
-                v = default
-        if v is not None:
-            self.__setattr__(name, v)
-
-    def save_attrib_int(self, doc, parent, name: str):
-        self.save_attrib_string(doc, parent, name)
-
-    def load_attrib_float(self, elem, name: str, default=None):
-        tmp = elem.firstChildElement(name)
-        v = default
-        if not tmp.isNull():
-            try:
-                v = float(str(tmp.text()))
-            except ValueError:
-                v = default
-        if v is not None:
-            self.__setattr__(name, v)
-
-    def save_attrib_float(self, doc, parent, name: str):
-        self.save_attrib_string(doc, parent, name)
-
-    def load_attrib_obj(self, elem, name: str, default=None):
-        tmp = elem.firstChildElement(name)
-        obj = default
-        if not tmp.isNull():
-            obj = eval(str(tmp.text()))
-        if obj is not None:
-            self.__setattr__(name, obj)
+        field_map = self._field_map
+        found = set()
+        tmp = elem.firstChildElement()
+        while not tmp.isNull():
+            tag = tmp.tagName()
+            field = field_map.get(tag)
+            if (field is not None) and (tag not in found):
+                self.__setattr__(tag, field.parse(tmp.text(), tmp.lineNumber()))
+                found.add(tag)
+            tmp = tmp.nextSiblingElement()
+        return found
 
-    def save_attrib_obj(self, doc, parent, name: str):
-        tmp = doc.createElement(name)
-        parent.appendChild(tmp)
-        obj = self.__getattribute__(name)
-        text = doc.createTextNode(obj.__repr__())
-        tmp.appendChild(text)
+    def save_fields(self, doc, parent):
+        for field in self.fields:
+            tmp = doc.createElement(field.name)
+            parent.appendChild(tmp)
+            text = doc.createTextNode(field.format(self.__getattribute__(field.name)))
+            tmp.appendChild(text)
 
     def to_xml(self, doc, parent):
         QtWidgets.QApplication.processEvents()
@@ -98,16 +236,21 @@ class Base(object):
         return self.to_element(doc, tmp)
 
     def to_element(self, doc, elem):
+        self.save_fields(doc, elem)
         return True
 
 
 class Renderable(Base):
+    __slots__ = ("order", "underlay", "rotation", "_rectangle", "gfx_list")
+
+    rectangle = IntTuple()
+
     def __init__(self, name: str, xml_tag: str = "renderable"):
         super(Renderable, self).__init__(name, xml_tag)
         self.order: float = 0.0  # Z depth...  higher values on top of lower values
         self.underlay: int = 0  # Z below 0
         self.rotation: int = 0
-        self.rectangle: List[int, int, int, int] = [0, 0, -1, -1]
+        self.rectangle: Tuple[int, int, int, int] = (0, 0, -1, -1)
         # the list of QGraphicsItem objects that make up this instance
         self.gfx_list: List[QtWidgets.QGraphicsItem] = list()
         self.name: str = "unknown"
@@ -115,6 +258,17 @@ class Renderable(Base):
     def render_object(self):
         return
 
+    @classmethod
+    def from_element(cls, elem, deck):
+        obj = cls()
+        found = obj.load_fields(elem)
+        if "underlay" not in found:
+            underlay = 0
+            if obj.order < 0:
+                underlay = 1
+            obj.underlay = underlay
+        return obj
+
     def set_gfx_depths(self):
         # Within a renderable there may be multiple graphics items.
         # The z value will be in the physical order in the gfx_list,
@@ -126,6 +280,16 @@ class Renderable(Base):
 
 
 class ImageRender(Renderable):
+    __slots__ = ("image",)
+
+    fields = (
+        StringField("image"),
+        IntField("rotation"),
+        IntListField("rectangle", 4),
+        FloatField("order"),
+        IntField("underlay"),
+    )
+
     def __init__(self, name: str = "image"):
         super(ImageRender, self).__init__(name, "render_image")
         self.image = ""
@@ -136,29 +300,19 @@ class ImageRender(Renderable):
             return super(ImageRender, self).get_column_info(col)
         return "%d,%d - %d,%d" % tuple(self.rectangle)
 
-    @classmethod
-    def from_element(cls, elem, deck):
-        obj = ImageRender()
-        obj.load_attrib_string(elem, "image")
-        obj.load_attrib_obj(elem, "rectangle")
-        obj.load_attrib_int(elem, "rotation")
-        obj.load_attrib_float(elem, "order")
-        underlay = 0
-        if obj.order < 0:
-            underlay = 1
-        obj.load_attrib_int(elem, "underlay", default=underlay)
-        return obj
 
-    def to_element(self, doc, elem):
-        self.save_attrib_string(doc, elem, "image")
-        self.save_attrib_int(doc, elem, "rotation")
-        self.save_attrib_obj(doc, elem, "rectangle")
-        self.save_attrib_float(doc, elem, "order")
-        self.save_attrib_int(doc, elem, "underlay")
-        return True
+class TextRender(Renderable):
+    __slots__ = ("style", "text")
 
+    fields = (
+        StringField("text"),
+        StringField("style"),
+        IntField("rotation"),
+        IntListField("rectangle", 4),
+        FloatField("order"),
+        IntField("underlay"),
+    )
 
-class TextRender(Renderable):
     def __init__(self, name="text"):
         super(TextRender, self).__init__(name, "render_text")
         self.style = "default"
@@ -170,35 +324,22 @@ class TextRender(Renderable):
             return super(TextRender, self).get_column_info(col)
         return "%d,%d - %d,%d" % tuple(self.rectangle)
 
-    @classmethod
-    def from_element(cls, elem, deck):
-        obj = TextRender()
-        obj.load_attrib_string(elem, "text")
-        obj.load_attrib_string(elem, "style")
-        obj.load_attrib_int(elem, "rotation")
-        obj.load_attrib_obj(elem, "rectangle")
-        obj.load_attrib_float(elem, "order")
-        underlay = 0
-        if obj.order < 0:
-            underlay = 1
-        obj.load_attrib_int(elem, "underlay", default=underlay)
-        return obj
 
-    def to_element(self, doc, elem):
-        self.save_attrib_string(doc, elem, "text")
-        self.save_attrib_string(doc, elem, "style")
-        self.save_attrib_int(doc, elem, "rotation")
-        self.save_attrib_obj(doc, elem, "rectangle")
-        self.save_attrib_float(doc, elem, "order")
-        self.save_attrib_int(doc, elem, "underlay")
-        return True
+class RectRender(Renderable):
+    __slots__ = ("style",)
 
+    fields = (
+        StringField("style"),
+        IntField("rotation"),
+        IntListField("rectangle", 4),
+        FloatField("order"),
+        IntField("underlay"),
+    )
 
-class RectRender(Renderable):
     def __init__(self, name: str = "rect"):
         super(RectRender, self).__init__(name, "render_rect")
         self.style = "default"
-        self.rectangle = [10, 10, 110, 110]
+        self.rectangle = (10, 10, 110, 110)
         self.name = "Rectangle"
 
     def get_column_info(self, col: int) -> str:
@@ -206,31 +347,12 @@ class RectRender(Renderable):
             return super(RectRender, self).get_column_info(col)
         return "%d,%d - %d,%d" % tuple(self.rectangle)
 
-    @classmethod
-    def from_element(cls, elem, deck):
-        obj = RectRender()
-        obj.load_attrib_string(elem, "style")
-        obj.load_attrib_int(elem, "rotation")
-        obj.load_attrib_obj(elem, "rectangle")
-        obj.load_attrib_float(elem, "order")
-        underlay = 0
-        if obj.order < 0:
-            underlay = 1
-        obj.load_attrib_int(elem, "underlay", default=underlay)
-        return obj
-
-    def to_element(self, doc, elem):
-        self.save_attrib_string(doc, elem, "style")
-        self.save_attrib_int(doc, elem, "rotation")
-        self.save_attrib_obj(doc, elem, "rectangle")
-        self.save_attrib_float(doc, elem, "order")
-        self.save_attrib_int(doc, elem, "underlay")
-        return True
-
 
 # Essentially, a Face is a list of renderable items.  Right now, text or image items
 # that reference styles and images, along with content.
 class Face(Base):
+    __slots__ = ("renderables",)
+
     def __init__(self, name: str):
         super(Face, self).__init__(name, name)
         self.renderables: List[Renderable] = list()  # a face is an array of Renderable instances
@@ -244,6 +366,20 @@ class Face(Base):
         # For basic storage, all order values are from [0+]
         # if background is True, renumber using rules 0 and 2
         # if background is False, renumber using rule 1
+        ordered = self.render_order(background)
+        self.renderables = list()
+        for order, r in ordered:
+            r.order = order
+            self.renderables.append(r)
+
+        # Now that the renderable order numbers have been set, we
+        # can update the (Z) depth numbers within any renderables
+        # that have been realized
+        self.set_gfx_item_depths()
+
+    def render_order(self, background: bool = False) -> List[Tuple[float, Renderable]]:
+        # The (order, renderable) pairs, bottom to top, that recompute_renderable_order()
+        # would assign.  The face itself is not changed.
         underlay = list()
         core = list()
         overlay = list()
@@ -255,29 +391,12 @@ class Face(Base):
                     overlay.append(r)
             else:
                 core.append(r)
-
-        # renumber and rebuild
-        self.renderables = list()
-        order = -100.0
-        for r in underlay:
-            r.order = order
-            self.renderables.append(r)
-            order += 0.1
-        order = 0.0
-        for r in core:
-            r.order = order
-            self.renderables.append(r)
-            order += 0.1
-        order = 100.0
-        for r in overlay:
-            r.order = order
-            self.renderables.append(r)
-            order += 0.1
-
-        # Now that the renderable order numbers have been set, we
-        # can update the (Z) depth numbers within any renderables
-        # that have been realized
-        self.set_gfx_item_depths()
+        result = list()
+        for order, group in ((-100.0, underlay), (0.0, core), (100.0, overlay)):
+            for r in group:
+                result.append((order, r))
+                order += 0.1
+        return result
 
     def set_gfx_item_depths(self):
         # Actually set the QGraphicsItem depth values for the individual items
@@ -335,6 +454,16 @@ class Face(Base):
 
 
 class Card(Base):
+    __slots__ = (
+        "top_face",
+        "bot_face",
+        "card_number",
+        "local_card_number",
+        "background",
+        "location",
+        "background_card",
+    )
+
     def __init__(self, name: str, xml_tag: str = "card", background: bool = False):
         super(Card, self).__init__(name, xml_tag)
         self.top_face: Face = Face("top")
@@ -367,11 +496,14 @@ class Card(Base):
 
 
 class Location(Base):
+    __slots__ = ("cards", "card_number", "local_card_number", "background")
+
     def __init__(self, name: str):
         super(Location, self).__init__(name, "location")
         self.cards: List[Card] = list()
         self.card_number: int = 0
         self.local_card_number: int = 0
+        self.background: bool = False
 
     @classmethod
     def from_element(cls, elem, deck):
@@ -396,14 +528,42 @@ class Location(Base):
 
 
 class Style(Base):
+    __slots__ = (
+        "typeface",
+        "typesize",
+        "_fillcolor",
+        "borderthickness",
+        "_bordercolor",
+        "_textcolor",
+        "linestyle",
+        "justification",
+        "boundary_offset",
+    )
+
+    fields = (
+        StringField("typeface"),
+        StringField("linestyle"),
+        StringField("justification"),
+        IntListField("fillcolor", 4),
+        IntListField("bordercolor", 4),
+        IntListField("textcolor", 4),
+        IntField("typesize"),
+        IntField("borderthickness"),
+        IntField("boundary_offset"),
+    )
+
+    fillcolor = IntTuple()
+    bordercolor = IntTuple()
+    textcolor = IntTuple()
+
     def __init__(self, name):
         super(Style, self).__init__(name, "style")
         self.typeface = "Arial"
         self.typesize = 12
-        self.fillcolor = [255, 255, 255, 255]
+        self.fillcolor = (255, 255, 255, 255)
         self.borderthickness = 0
-        self.bordercolor = [0, 0, 0, 255]
-        self.textcolor = [0, 0, 0, 255]
+        self.bordercolor = (0, 0, 0, 255)
+        self.textcolor = (0, 0, 0, 255)
         self.linestyle = "solid"
         self.justification = "full"
         self.boundary_offset = 0
@@ -412,35 +572,21 @@ class Style(Base):
     def from_element(cls, elem, deck):
         name = elem.attribute("name", "Unnamed Image")
         obj = Style(str(name))
-        obj.load_attrib_string(elem, "typeface", "Arial")
-        obj.load_attrib_string(elem, "linestyle")
-        obj.load_attrib_string(elem, "justification")
-        obj.load_attrib_obj(elem, "fillcolor")
-        obj.load_attrib_obj(elem, "bordercolor")
-        obj.load_attrib_obj(elem, "textcolor")
-        obj.load_attrib_int(elem, "typesize")
-        obj.load_attrib_int(elem, "borderthickness")
-        obj.load_attrib_int(elem, "boundary_offset")
+        obj.load_fields(elem)
         return obj
 
-    def to_element(self, doc, elem):
-        self.save_attrib_string(doc, elem, "typeface")
-        self.save_attrib_string(doc, elem, "linestyle")
-        self.save_attrib_string(doc, elem, "justification")
-        self.save_attrib_obj(doc, elem, "fillcolor")
-        self.save_attrib_obj(doc, elem, "bordercolor")
-        self.save_attrib_obj(doc, elem, "textcolor")
-        self.save_attrib_int(doc, elem, "typesize")
-        self.save_attrib_int(doc, elem, "borderthickness")
-        self.save_attrib_int(doc, elem, "boundary_offset")
-        return True
-
 
 class Image(Base):
+    __slots__ = ("file", "_rectangle", "usage")
+
+    fields = (StringField("file"), IntListField("rectangle", 4), StringField("usage"))
+
+    rectangle = IntTuple()
+
     def __init__(self, name: str):
         super(Image, self).__init__(name, "image")
         self.file = ""
-        self.rectangle = [0, 0, -1, -1]  # x,y,dx,dy
+        self.rectangle = (0, 0, -1, -1)  # x,y,dx,dy
         self.usage = "any"
 
     def get_file(self, deck: "Deck") -> "File":
@@ -452,10 +598,11 @@ class Image(Base):
             image = QtGui.QImage()
             image.load(":/default_files/Default")
             return image
-        img = f.get_image()
+        # the crop UI always works on the full resolution source
+        img = f.get_image(full_resolution=True)
         if not mask:
             return img
-        r = self.rectangle
+        r = list(self.rectangle)
         s = f.size()
         if r[2] == -1:
             r[2] = s[0]
@@ -475,14 +622,29 @@ class Image(Base):
             image = QtGui.QImage()
             image.load(":/default_files/Default")
             return image
-        w = self.rectangle[2]
-        if w < 0:
-            w = f.image.width()
-        h = self.rectangle[3]
-        if h < 0:
-            h = f.image.height()
-        img = f.image.copy(self.rectangle[0], self.rectangle[1], w, h)  # QImage
-        return img
+        # note: the file may have been decoded at a reduced resolution, in which
+        # case the returned image is smaller than get_size()
+        return f.get_region(self.get_source_rect(f))
+
+    def get_source_rect(self, f: "File") -> Tuple[int, int, int, int]:
+        # the rectangle in source file pixels, with the -1 sizes resolved
+        x, y, w, h = self.rectangle
+        if (w < 0) or (h < 0):
+            size = f.size()
+            if w < 0:
+                w = size[0]
+            if h < 0:
+                h = size[1]
+        return x, y, w, h
+
+    def get_size(self, deck: "Deck") -> Tuple[int, int]:
+        # the size of the image in source pixels, independent of the decode resolution
+        f = self.get_file(deck)
+        if f is None:
+            img = self.get_image(deck)
+            return img.width(), img.height()
+        rect = self.get_source_rect(f)
+        return rect[2], rect[3]
 
     def get_pixmap(self, deck) -> QtGui.QPixmap:
         image = self.get_image(deck)
@@ -497,25 +659,62 @@ class Image(Base):
     def from_element(cls, elem, deck):
         name = elem.attribute("name", "Unnamed Image")
         obj = Image(str(name))
-        obj.load_attrib_string(elem, "file")
-        obj.load_attrib_obj(elem, "rectangle")
-        obj.load_attrib_string(elem, "usage")
+        obj.load_fields(elem)
         return obj
 
-    def to_element(self, doc, elem):
-        self.save_attrib_string(doc, elem, "file")
-        self.save_attrib_obj(doc, elem, "rectangle")
-        self.save_attrib_string(doc, elem, "usage")
-        return True
-
 
 class File(Base):
+    __slots__ = (
+        "_image",
+        "filename",
+        "store_inline",
+        "_source",
+        "_source_size",
+        "_origin",
+        "_decode_clip",
+        "_decode_scale",
+        "_digest",
+    )
+
     def __init__(self, name):
         super(File, self).__init__(name, "file")
-        self.image = QtGui.QImage()
-        self.image.load(":Default")
+        self._image = QtGui.QImage()
+        self._image.load(":Default")
         self.filename = ""
         self.store_inline = False
+        # encoded image waiting to be decoded: a pathname or inline bytes
+        self._source: Union[str, bytes, None] = None
+        self._source_size: Optional[List[int]] = None
+        # the source the image was decoded from, kept for hashing, saving inline and
+        # a later full resolution decode
+        self._origin: Union[str, bytes, None] = None
+        # A reduced resolution decode of the source.  _decode_clip is the decoded
+        # region in source pixels and _decode_scale the decoded/source pixel ratio.
+        self._decode_clip: Optional[Tuple[int, int, int, int]] = None
+        self._decode_scale: Optional[Tuple[float, float]] = None
+        # sha256 of the encoded image, see content_hash()
+        self._digest: Optional[str] = None
+
+    @property
+    def image(self) -> QtGui.QImage:
+        if self._source is not None:
+            self.decode()
+        return self._image
+
+    @image.setter
+    def image(self, image: QtGui.QImage):
+        self._image = image
+        self._source = None
+        self._source_size = None
+        self._origin = None
+        self._digest = None
+        self.clear_decode_hint()
+
+    def is_decoded(self) -> bool:
+        return self._source is None
+
+    def is_inline_source(self) -> bool:
+        return isinstance(self._source, bytes)
 
     def get_full_pathname(self, deck: "Deck") -> str:
         if self.filename.startswith(":"):
@@ -526,42 +725,218 @@ class File(Base):
             pathname = os.path.join(deck.deck_dirname, self.filename)
         return pathname
 
-    def load_file(self, deck: "Deck", filename: str):
+    def load_file(self, deck: "Deck", filename: str, decode: bool = True):
+        # With decode=False, only the image header is read (for the size) and the
+        # pixels are decoded on first use or by Deck.decode_files()
         try:
             if filename.startswith(":"):
-                self.image.load(filename)
+                pathname = filename
                 self.filename = filename
             else:
                 pathname = filename
                 tmp = QtCore.QFileInfo(pathname)
-                if tmp.isRelative():
+                if tmp.isRelative() and deck.deck_dirname:
                     pathname = os.path.join(deck.deck_dirname, filename)
                 tmp = QtCore.QFileInfo(pathname)
-                pathname = tmp.canonicalFilePath()
-                self.image.load(pathname)
+                pathname = tmp.canonicalFilePath() or pathname
                 # try to remove desk.deck_dirname from the pathname
-                tmp = QtCore.QFileInfo(deck.deck_dirname)
-                deck_dirname = tmp.canonicalFilePath()
-                if pathname.startswith(deck_dirname):
-                    pathname = pathname[len(deck_dirname) + 1 :]
-                self.filename = pathname
+                filename = pathname
+                if deck.deck_dirname:
+                    tmp = QtCore.QFileInfo(deck.deck_dirname)
+                    deck_dirname = tmp.canonicalFilePath()
+                    if deck_dirname and pathname.startswith(deck_dirname):
+                        filename = pathname[len(deck_dirname) + 1 :]
+                self.filename = filename
+            self._source = pathname
+            self._source_size = None
+            self._origin = None
+            self._digest = None
+            self.clear_decode_hint()
+            if decode:
+                self.decode()
         except Exception:
             return False
         return True
 
-    def get_image(self):
+    def set_decode_hint(self, scale: float, clip: Optional[Tuple[int, int, int, int]] = None):
+        # Request that the pending source be decoded at a reduced resolution.  scale
+        # is the largest decoded/source pixel ratio needed and clip is the part of the
+        # source (in source pixels) that is referenced.
+        if self._source is None:
+            return
+        size = self.header_size()
+        if size is None:
+            return
+        full = (0, 0, size[0], size[1])
+        if clip is not None:
+            left = max(clip[0], 0)
+            top = max(clip[1], 0)
+            right = min(clip[0] + clip[2], size[0])
+            bottom = min(clip[1] + clip[3], size[1])
+            clip = (left, top, right - left, bottom - top)
+            if (clip[2] <= 0) or (clip[3] <= 0) or (clip == full):
+                clip = None
+        if (scale >= 1.0) and (clip is None):
+            self.clear_decode_hint()
+            return
+        self._decode_clip = clip if clip is not None else full
+        self._decode_scale = (min(scale, 1.0), min(scale, 1.0))
+
+    def clear_decode_hint(self):
+        self._decode_clip = None
+        self._decode_scale = None
+
+    def is_reduced(self) -> bool:
+        return self._decode_clip is not None
+
+    @staticmethod
+    def _open_reader(source: Union[str, bytes]) -> Tuple[QtGui.QImageReader, QtCore.QBuffer]:
+        # the buffer (if any) must outlive the reader
+        if isinstance(source, bytes):
+            buffer = QtCore.QBuffer()
+            buffer.setData(source)
+            buffer.open(QtCore.QIODevice.ReadOnly)
+            return QtGui.QImageReader(buffer), buffer
+        return QtGui.QImageReader(source), None
+
+    def decode(self) -> bool:
+        # Decode the pending source into the image.  This only touches this File
+        # and QImageReader is reentrant, so files may be decoded on worker threads.
+        source = self._source
+        if source is None:
+            return True
+        reader, buffer = self._open_reader(source)
+        clip = self._decode_clip
+        if clip is not None:
+            # the clip rect is applied before the scaling
+            scale = self._decode_scale[0]
+            width = max(1, math.ceil(clip[2] * scale))
+            height = max(1, math.ceil(clip[3] * scale))
+            if clip != (0, 0, *self.header_size()):
+                reader.setClipRect(QtCore.QRect(*clip))
+            reader.setScaledSize(QtCore.QSize(width, height))
+        image = reader.read()
+        del reader, buffer
+        if image.isNull() and isinstance(source, bytes) and self.filename:
+            # the inline data is unreadable, fall back to the filename
+            self.clear_decode_hint()
+            source = self.filename
+            self._digest = None
+            image = QtGui.QImageReader(source).read()
+        if image.isNull():
+            self._source = None
+            self.clear_decode_hint()
+            return False
+        if self._decode_clip is not None:
+            # the actual ratios, after rounding to whole pixels
+            self._decode_scale = (image.width() / clip[2], image.height() / clip[3])
+        else:
+            self._source_size = None
+        self._origin = source
+        self._source = None
+        self._image = image
+        return True
+
+    def share_decode(self, other: "File"):
+        # Take the decoded image of a file with the same content and decode hint.
+        # QImage copies are implicitly shared, so the pixels are held once.
+        if self._source is not None:
+            self._origin = self._source
+        self._source = None
+        self._source_size = other._source_size
+        self._decode_clip = other._decode_clip
+        self._decode_scale = other._decode_scale
+        self._image = QtGui.QImage(other._image)
+
+    def load_full_resolution(self):
+        # Replace a reduced resolution decode with the full source image
+        if self._source is not None:
+            self.clear_decode_hint()
+            self.decode()
+        elif self.is_reduced() and (self._origin is not None):
+            self._source = self._origin
+            self.clear_decode_hint()
+            self.decode()
+
+    def header_size(self) -> Optional[List[int]]:
+        # the size of the source, read from the image header only
+        if self._source_size is None:
+            source = self._source if self._source is not None else self._origin
+            if source is None:
+                return None
+            reader, buffer = self._open_reader(source)
+            size = reader.size()
+            if not size.isValid():
+                return None
+            self._source_size = [size.width(), size.height()]
+        return self._source_size
+
+    def encoded_data(self) -> Optional[bytes]:
+        # The encoded image: the inline bytes or the file contents.  An image that was
+        # assigned directly is encoded as png.
+        source = self._source if self._source is not None else self._origin
+        if isinstance(source, bytes):
+            return source
+        if source:
+            fp = QtCore.QFile(source)
+            if not fp.open(QtCore.QIODevice.ReadOnly):
+                return None
+            data = bytes(fp.readAll())
+            fp.close()
+            return data
+        if self._image.isNull():
+            return None
+        buffer = QtCore.QBuffer()
+        buffer.open(QtCore.QIODevice.ReadWrite)
+        self._image.save(buffer, "png")
+        return bytes(buffer.data())
+
+    def content_hash(self) -> Optional[str]:
+        # Files with the same hash hold identical encoded images
+        if self._digest is None:
+            data = self.encoded_data()
+            if data is not None:
+                self._digest = hashlib.sha256(data).hexdigest()
+        return self._digest
+
+    def get_image(self, full_resolution: bool = False):
+        if full_resolution:
+            self.load_full_resolution()
         return self.image
 
+    def get_region(self, rect: Tuple[int, int, int, int]) -> QtGui.QImage:
+        # Copy a rectangle given in source pixels out of the decoded image
+        return self.image.copy(self.region_rect(rect))
+
+    def region_rect(self, rect: Tuple[int, int, int, int]) -> QtCore.QRect:
+        # The decoded pixels of a rectangle given in source pixels
+        x, y, w, h = rect
+        if self._decode_clip is None:
+            return QtCore.QRect(x, y, w, h)
+        sx, sy = self._decode_scale
+        x0 = (x - self._decode_clip[0]) * sx
+        y0 = (y - self._decode_clip[1]) * sy
+        x1 = (x + w - self._decode_clip[0]) * sx
+        y1 = (y + h - self._decode_clip[1]) * sy
+        left, top = round(x0), round(y0)
+        return QtCore.QRect(left, top, max(1, round(x1) - left), max(1, round(y1) - top))
+
     def get_column_info(self, col):
         if col != 1:
             return super(File, self).get_column_info(col)
         return "%dx%d" % tuple(self.size())
 
     def size(self):
+        # the size of the source in pixels, even if decoded at a reduced resolution
+        if (self._source is not None) or (self._decode_clip is not None):
+            size = self.header_size()
+            if size is not None:
+                return size
         return [self.image.width(), self.image.height()]
 
     @classmethod
     def from_element(cls, elem, deck):
+        # The image is not decoded here, see Deck.decode_files()
         QtWidgets.QApplication.processEvents()
         name = elem.attribute("name", "Unnamed File")
         filename = elem.attribute("filename", None)
@@ -569,37 +944,41 @@ class File(Base):
         if filename:
             obj.filename = filename
         # two cases: text is the file content or text is empty
-        # in the latter case, try to read the 'name' as a file
+        # in the latter case, the content may be stored with an earlier file with the
+        # same 'sha256' (decks saved by development builds) or try to read the 'name'
+        # as a file
         try:
             tmp = elem.text()  # get unicode string
+            digest = elem.attribute("sha256", "")
             if len(tmp) == 0:
-                if not obj.load_file(deck, filename):
+                shared = deck.find_inline_file(digest) if digest else None
+                if shared is not None:
+                    obj._source = shared.encoded_data()
+                    obj._digest = shared.content_hash()
+                    obj.store_inline = True
+                elif not obj.load_file(deck, filename, decode=False):
                     print(f"Warning, failed to load file: {filename}")
                     return None
             else:
                 tmp = bytes(tmp, "UTF-8")  # convert to ASCII 8bit bytes
-                s = base64.b64decode(tmp)  # decode to binary
-                buffer = QtCore.QBuffer()  # do the I/O
-                buffer.setData(s)
-                buffer.open(QtCore.QIODevice.ReadWrite)
-                if not obj.image.load(buffer, "png"):
-                    if not obj.image.load(filename, name):
-                        return None
+                obj._source = base64.b64decode(tmp)  # decode to binary
+                obj.store_inline = True
         except Exception as e:
             print("File from_element Error", str(e))
             return None
         return obj
 
     def to_element(self, doc, elem):
+        # The inline data is written in full for every file, even when files share it:
+        # earlier versions read a file element without data from the filename.
         try:
             if self.store_inline:
-                buffer = QtCore.QBuffer()
-                buffer.open(QtCore.QIODevice.ReadWrite)
-                self.image.save(buffer, "png")  # Do the I/O
-                s = base64.b64encode(buffer.data())  # encode binary data as ASCII 8bit bytes
-                tmp = s.decode(encoding="UTF-8")  # convert the ASCII 8bit sequence to Unicode
-                text = doc.createTextNode(tmp)  # Add it to the DOM
-                elem.appendChild(text)
+                data = self.encoded_data()
+                if data:
+                    s = base64.b64encode(data)  # encode binary data as ASCII 8bit bytes
+                    tmp = s.decode(encoding="UTF-8")  # convert the ASCII 8bit sequence to Unicode
+                    text = doc.createTextNode(tmp)  # Add it to the DOM
+                    elem.appendChild(text)
             elem.setAttribute("filename", self.filename)
         except Exception as e:
             print("File to_element Error", str(e))
@@ -608,6 +987,28 @@ class File(Base):
 
 
 class Deck(Base):
+    __slots__ = (
+        "files",
+        "images",
+        "styles",
+        "default_card",
+        "default_item_card",
+        "default_location_card",
+        "deckcards",
+        "base",
+        "items",
+        "plan",
+        "misc",
+        "characters",
+        "icon_reference",
+        "locations",
+        "card_size",
+        "deck_filename",
+        "deck_dirname",
+    )
+
+    decksize_field = IntListField("decksize", 2)
+
     def __init__(self, name="") -> None:
         super(Deck, self).__init__(name, "deck")
         self.files: list = list()  # of Files
@@ -639,12 +1040,38 @@ class Deck(Base):
     def get_card_size(self) -> List[int]:
         return self.card_size
 
+    def all_cards(self) -> Iterator[Card]:
+        # every card in the deck, including the default (background) cards
+        yield self.default_card
+        yield self.default_item_card
+        yield self.default_location_card
+        for chunk in [self.deckcards, self.base, self.items, self.plan, self.misc, self.characters]:
+            yield from chunk
+        yield self.icon_reference
+        for location in self.locations:
+            yield from location.cards
+
     def find_file(self, name: str, default=None) -> File:
         for filename in self.files:
             if filename.name == name:
                 return filename
         return default
 
+    def find_inline_file(self, digest: str, default=None) -> File:
+        for f in self.files:
+            if f.is_inline_source() and (f.content_hash() == digest):
+                return f
+        return default
+
+    def duplicate_files(self) -> List[List[File]]:
+        # groups of files with identical content, in file order
+        groups = dict()
+        for f in self.files:
+            digest = f.content_hash()
+            if digest is not None:
+                groups.setdefault(digest, list()).append(f)
+        return [group for group in groups.values() if len(group) > 1]
+
     def find_image(self, name: str, default=None) -> Image:
         for img in self.images:
             if img.name == name:
@@ -744,7 +1171,17 @@ class Deck(Base):
         QtWidgets.QApplication.restoreOverrideCursor()
         return success
 
-    def load(self, filename: str) -> bool:
+    def load(
+        self,
+        filename: str,
+        reduce_resolution: bool = False,
+        previous: Optional["Deck"] = None,
+        stats=None,
+    ) -> bool:
+        # With reduce_resolution, file assets are only decoded at the resolution (and
+        # over the region) that the cards actually use.  See set_file_decode_hints().
+        # The decoded files of a previous load of the deck are reused where they match.
+        # The decodes are counted in stats, see decode_files().
         QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
         try:
             fp = open(filename, "rb")
@@ -756,29 +1193,63 @@ class Deck(Base):
         self.deck_filename = filename
         self.deck_dirname = os.path.dirname(filename)
         doc = QtXml.QDomDocument()
-        ok, msg, line, col = doc.setContent(xml)
+        if hasattr(QtXml.QDomDocument, "ParseResult"):
+            # Qt 6.5+, the overloads returning a tuple are deprecated.  The result is
+            # a success if there is no error message.
+            buffer = QtCore.QBuffer()
+            buffer.setData(xml)
+            buffer.open(QtCore.QIODevice.ReadOnly)
+            result = doc.setContent(buffer, QtXml.QDomDocument.ParseOption.Default)
+            msg, line, col = result.errorMessage, result.errorLine, result.errorColumn
+            ok = not msg
+        else:
+            ok, msg, line, col = doc.setContent(xml)
         if not ok:
             print("Parsing error on line {}, column {}: {}".format(line, col, msg))
             QtWidgets.QApplication.restoreOverrideCursor()
             return False
         deck = doc.firstChildElement("deck")
         if not deck.isNull():
-            decksize = deck.firstChildElement("decksize")  # the <decksize> block
-            if not decksize.isNull():
-                self.card_size = eval(str(decksize.text()))
-            assets = deck.firstChildElement("assets")  # the <assets> block
-            if not assets.isNull():
-                if not self.parse_assets(assets):
-                    QtWidgets.QApplication.restoreOverrideCursor()
-                    return False
-            cards = deck.firstChildElement("cards")  # the <cards> block
-            if not cards.isNull():
-                if not self.parse_cards(cards):
-                    QtWidgets.QApplication.restoreOverrideCursor()
-                    return False
+            try:
+                ok = self.parse_deck(
+                    deck, reduce_resolution=reduce_resolution, previous=previous, stats=stats
+                )
+            except DeckFormatError as e:
+                print("Invalid deck contents, {}".format(str(e)))
+                ok = False
+            if not ok:
+                QtWidgets.QApplication.restoreOverrideCursor()
+                return False
         QtWidgets.QApplication.restoreOverrideCursor()
         return True
 
+    def parse_deck(
+        self,
+        deck,
+        reduce_resolution: bool = False,
+        previous: Optional["Deck"] = None,
+        stats=None,
+    ) -> bool:
+        decksize = deck.firstChildElement("decksize")  # the <decksize> block
+        if not decksize.isNull():
+            self.card_size = self.decksize_field.parse(decksize.text(), decksize.lineNumber())
+        assets = deck.firstChildElement("assets")  # the <assets> block
+        if not assets.isNull():
+            if not self.parse_assets(assets):
+                return False
+        cards = deck.firstChildElement("cards")  # the <cards> block
+        if not cards.isNull():
+            if not self.parse_cards(cards):
+                return False
+        # the cards are needed to know how the files are used, decode them last
+        reuse = None if previous is None else previous.files
+        if reduce_resolution:
+            # unused files are left to be decoded (at full resolution) on demand
+            self.decode_files(self.set_file_decode_hints(), reuse=reuse, stats=stats)
+        else:
+            self.decode_files(reuse=reuse, stats=stats)
+        return True
+
     def parse_cards(self, root):
         # single cards
         # default cards (layering) and the reference card
@@ -833,11 +1304,139 @@ class Deck(Base):
                 tmp = tmp.nextSiblingElement(tag)
         return True
 
+    def set_file_decode_hints(self) -> List[File]:
+        # Find the largest scale each pending file is drawn at and the part of it that
+        # the Image assets reference, so oversized source art can be decoded at a
+        # reduced resolution.  Returns the files that are used by some card.  Files with
+        # the same content share one decode, so their usage is merged.
+        self.hash_files()
+        usage = dict()  # content hash (or file name): [scale, left, top, right, bottom]
+
+        def use(image_name: str, w: Optional[int], h: Optional[int]):
+            image = self.find_image(image_name)
+            if image is None:
+                return
+            f = image.get_file(self)
+            if (f is None) or f.is_decoded():
+                return
+            x, y, cw, ch = image.get_source_rect(f)
+            if (cw <= 0) or (ch <= 0):
+                return
+            if (w is None) or (h is None):
+                scale = 1.0
+            else:
+                tw, th = scaled_size(w, h, cw, ch)
+                scale = max(tw / cw, th / ch)
+            key = f.content_hash() or f.name
+            info = usage.get(key)
+            if info is None:
+                usage[key] = [scale, x, y, x + cw, y + ch]
+            else:
+                info[0] = max(info[0], scale)
+                info[1] = min(info[1], x)
+                info[2] = min(info[2], y)
+                info[3] = max(info[3], x + cw)
+                info[4] = max(info[4], y + ch)
+
+        for card in self.all_cards():
+            for face in (card.top_face, card.bot_face):
+                for r in face.renderables:
+                    if isinstance(r, ImageRender):
+                        use(r.image, r.rectangle[2], r.rectangle[3])
+                    elif isinstance(r, TextRender):
+                        for name, dx, dy in inline_image_tokens(r.text):
+                            use(name, dx, dy)
+        used = list()
+        for f in self.files:
+            if f.is_decoded():
+                continue
+            info = usage.get(f.content_hash() or f.name)
+            if info is not None:
+                clip = (info[1], info[2], info[3] - info[1], info[4] - info[2])
+                f.set_decode_hint(info[0], clip)
+                used.append(f)
+        return used
+
+    @staticmethod
+    def map_files(func: Callable, files: List[File], max_workers: Optional[int] = None) -> list:
+        # Call func on each file on a thread pool.  Results are collected in list order,
+        # so the asset order does not depend on the timing.
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        max_workers = min(max_workers, len(files))
+        if max_workers > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+                return list(pool.map(func, files))
+        return [func(f) for f in files]
+
+    def hash_files(self, files: Optional[List[File]] = None, max_workers: Optional[int] = None):
+        # compute the content hashes of the pending File images (all of them by default)
+        if files is None:
+            files = self.files
+        pending = [f for f in files if not f.is_decoded()]
+        self.map_files(File.content_hash, pending, max_workers)
+
+    def decode_files(
+        self,
+        files: Optional[List[File]] = None,
+        max_workers: Optional[int] = None,
+        reuse: Optional[List[File]] = None,
+        stats=None,
+    ):
+        # Decode the pending File images (all of them by default) on a thread pool.
+        # Files with the same content and decode hint are decoded once and share the
+        # image.  The images of the (decoded) reuse files are shared the same way.
+        # The shared decodes are counted as hits and the others as misses of stats
+        # (with hit() and miss() methods, e.g. a build_report.CacheStats) if given.
+        if files is None:
+            files = self.files
+        pending = [f for f in files if not f.is_decoded()]
+        if len(pending) == 0:
+            return
+        inline = [f.is_inline_source() for f in pending]
+        hashes = self.map_files(File.content_hash, pending, max_workers)
+        first = dict()  # (hash, clip, scale): the file that is decoded
+        results = dict()
+        for f in reuse or list():
+            if f.is_decoded() and (f._digest is not None) and not f.image.isNull():
+                first.setdefault((f._digest, f._decode_clip, f._decode_scale), f)
+                results[f] = True
+        unique = list()
+        for f, digest in zip(pending, hashes):
+            key = (digest, f._decode_clip, f._decode_scale)
+            if digest is None:
+                unique.append(f)
+            elif key not in first:
+                first[key] = f
+                unique.append(f)
+        results.update(zip(unique, self.map_files(File.decode, unique, max_workers)))
+        if stats is not None:
+            stats.miss(len(unique))
+        for f, digest in zip(pending, hashes):
+            decoded = f if digest is None else first[(digest, f._decode_clip, f._decode_scale)]
+            if decoded is f:
+                continue
+            if results[decoded]:
+                f.share_decode(decoded)
+                results[f] = True
+                if stats is not None:
+                    stats.hit()
+            else:
+                results[f] = f.decode()
+                if stats is not None:
+                    stats.miss()
+        for f, is_inline in zip(pending, inline):
+            if not results[f]:
+                print(f"Warning, failed to load file: {f.filename}")
+                # unreadable inline data is dropped, missing files can be fixed in the editor
+                if is_inline:
+                    self.files.remove(f)
+
     def to_element(self, doc, elem):  # the deck element
         # decksize
         tmp = doc.createElement("decksize")
         elem.appendChild(tmp)
-        text = doc.createTextNode(self.card_size.__repr__())
+        text = doc.createTextNode(self.decksize_field.format(self.card_size))
         tmp.appendChild(text)
         # assets
         tmp = doc.createElement("assets")
@@ -882,18 +1481,22 @@ def build_empty_deck(media_dirs=None):
         d = QtCore.QDir(":/default_files")
         for name in d.entryList():
             f = File(name)
-            f.load_file(deck, ":/default_files/" + name)
+            f.load_file(deck, ":/default_files/" + name, decode=False)
             deck.files.append(f)
     else:
         for d in media_dirs:
             for root, dirs, files in os.walk(d):
-                for name in files:
+                # walk in a stable order, so the deck does not depend on the filesystem
+                dirs.sort()
+                for name in sorted(files):
                     filename = os.path.join(root, name)
                     basename, ext = os.path.splitext(os.path.basename(filename))
                     if ext.lower() in [".jpg", ".png"]:
-                        print("Adding image: {} ({})".format(filename, basename))
                         f = File(basename)
-                        f.load_file(deck, filename)
+                        # only the header is needed to list the file
+                        f.load_file(deck, filename, decode=False)
+                        size = f.size()
+                        print("Adding image: {} ({}) {}x{}".format(filename, basename, *size))
                         deck.files.append(f)
     # a default style
     deck.styles.append(Style("default"))
@@ -4,45 +4,69 @@
 # See LICENSE for details
 #
 
-import copy
+import concurrent.futures
 import logging
 import os
-from typing import List, Optional
+import shutil
+from typing import Dict, List, Optional, Union
 
 from PySide6 import QtCore, QtGui, QtWidgets
-from card_objects import (
-    Card,
-    Deck,
-    ImageRender,
-    Location,
-    RectRender,
-    Renderable,
-    Style,
-    TextRender,
-)
+from build_report import budget_workers, cache_stats
+from card_objects import Card, Deck, Location, RectRender, Renderable
 from graphics_item_handles import GraphicsPixmapItem, GraphicsRectItem, GraphicsTextItem
+from plan_painter import HALO_DISTANCE, HALO_OFFSETS, PlanPainter, qcolor, rect_geometry, rect_pen
+from profiling import Profiler, profile_span
+from render_plan import (
+    DeckPlan,
+    FacePlan,
+    ImageOp,
+    Op,
+    RectOp,
+    TextOp,
+    card_base_op,
+    compile_deck,
+    compile_renderable,
+    face_digest,
+    replace_macros,
+)
 
 # http://www.makeplayingcards.com
 # 897x1497=min size with 36pixel safe zone
 # Tarrot card is 70mmx120mm
 
 
-class Renderer(object):
+def card_filename(face: str, number: int) -> str:
+    return "card_{}_{:03}.png".format(face, number)
+
+
+def link_file(source: str, target: str) -> None:
+    # target as a hard link to source, or a copy of it where links are not supported
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+# the ways of rendering a card face: the items of a QGraphicsScene, or the
+# operations of its plan painted directly (see PlanPainter)
+BACKENDS = ("scene", "painter")
+
+
+class Renderer(PlanPainter):
     def __init__(self, the_deck: Deck, output_dir: str = "", parent: QtWidgets.QWidget = None):
-        self.deck: Deck = the_deck
+        super(Renderer, self).__init__(the_deck)
         self.outdir: str = output_dir
-        self.scene: QtWidgets.QGraphicsScene = QtWidgets.QGraphicsScene()
-        self.view: QtWidgets.QGraphicsView = QtWidgets.QGraphicsView(parent)
-        self.view.setScene(self.scene)
-        self.card_size: List[int] = the_deck.get_card_size()
         self.pad_size: int = 0
-        self.view.setSceneRect(0, 0, self.card_size[0], self.card_size[1])
-        self.scene.setSceneRect(self.view.sceneRect())
+        self._scene: Optional[QtWidgets.QGraphicsScene] = None
+        self._view: Optional[QtWidgets.QGraphicsView] = None
         self.image: Optional[QtGui.QImage] = None
         self.painter: Optional[QtGui.QPainter] = None
         if parent is None:
+            # the scene is only made for the scene backend (or a caller using it)
             self.image = QtGui.QImage(
-                self.scene.sceneRect().size().toSize(), QtGui.QImage.Format_RGBA8888
+                self.card_size[0], self.card_size[1], QtGui.QImage.Format_RGBA8888
             )
             self.painter = QtGui.QPainter(self.image)
         else:
@@ -59,10 +83,50 @@ class Renderer(object):
             else:
                 layout = QtWidgets.QVBoxLayout()
                 parent.setLayout(layout)
+            self.make_scene(parent)
             layout.addWidget(self.view)
             self.view.show()
+        # how render_plan() renders the faces, one of BACKENDS
+        self.backend: str = "painter" if parent is None else "scene"
         self.output_card_number = 0
         self.target_card = None
+        # faces with identical plans are rendered once, the others are links to it
+        self.share_faces: bool = True
+        # the plan digests of the card files written by render_plan()
+        self.face_digests: Dict[str, str] = dict()
+        # the faces of the last render_plan(): total, rendered, linked and unchanged
+        self.face_counts: Dict[str, int] = dict()
+        # records the time of the faces and of the steps of rendering them
+        self.profiler: Optional[Profiler] = None
+        # the threads painting the faces of render_plan() with the painter backend, each
+        # into its own image, None for one per cpu
+        self.max_workers: Optional[int] = 1
+        # the memory budget of the process in bytes, limits the threads
+        self.max_memory: Optional[int] = None
+
+    def make_scene(self, parent: QtWidgets.QWidget = None):
+        self._scene = QtWidgets.QGraphicsScene()
+        self._view = QtWidgets.QGraphicsView(parent)
+        self._view.setScene(self._scene)
+        self._view.setSceneRect(0, 0, self.card_size[0], self.card_size[1])
+        self._scene.setSceneRect(self._view.sceneRect())
+
+    @property
+    def scene(self) -> QtWidgets.QGraphicsScene:
+        if self._scene is None:
+            self.make_scene()
+        return self._scene
+
+    @property
+    def view(self) -> QtWidgets.QGraphicsView:
+        if self._view is None:
+            self.make_scene()
+        return self._view
+
+    def close(self):
+        # the painter must be done with the image before either is destroyed
+        if (self.painter is not None) and self.painter.isActive():
+            self.painter.end()
 
     def pad_image(self, img: QtGui.QImage) -> QtGui.QImage:
         if self.pad_size == 0:
@@ -109,218 +173,138 @@ class Renderer(object):
         p.end()
         return out
 
-    def render(self, face: str, number: int):
+    def render_image(self, face: Optional[FacePlan] = None, copy: bool = True) -> QtGui.QImage:
+        # the card image of face (painted directly) or of the scene, 825x1425 plus the
+        # padding.  Without copy, it may be self.image, which the next render reuses.
         self.image.fill(0)
-        self.scene.render(self.painter)
-        pathname = os.path.join(self.outdir, "card_{}_{:03}.png".format(face, number))
-        # print("Output file: {}".format(pathname))
+        if face is None:
+            with profile_span(self.profiler, "scene.render", "step"):
+                self.scene.render(self.painter)
+        else:
+            self.draw_face(self.painter, face)
+        return self.card_image(self.image, copy)
+
+    def draw_face(self, painter: QtGui.QPainter, face: FacePlan):
+        with profile_span(self.profiler, "paint_face", "step"):
+            for i, op in enumerate(face.ops):
+                with profile_span(self.profiler, type(op).__name__, "renderable", index=i):
+                    self.paint_op(painter, op)
+
+    def card_image(self, image: QtGui.QImage, copy: bool = True) -> QtGui.QImage:
+        # image resized to 825x1425 and padded, a copy of it if it already is the card
         if (self.card_size[0] != 825) or (self.card_size[1] != 1425):
             # resize to 825x1425
-            tmp = self.image.scaled(
-                825, 1425, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation
-            )
-            img = self.pad_image(tmp)
-        else:
-            img = self.pad_image(self.image)
-        img.save(pathname)
+            with profile_span(self.profiler, "scale", "step"):
+                image = image.scaled(
+                    825, 1425, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation
+                )
+        elif self.pad_size == 0:
+            # the painter keeps drawing into the image
+            return image.copy() if copy else image
+        with profile_span(self.profiler, "pad_image", "step"):
+            return self.pad_image(image)
 
-    def replace_macros(self, cur_card: Card, text: str):
-        # {XY:name} - ':name' is optional and defaults to 'current'
-        # X - c=card, i=item, l=location
-        # Y - N=global number, n=local number, s=string name,  A=global letter, a=local letter
-        # {n} - new line
-        for key in "ciln":
-            while True:
-                start = text.find("{" + key)
-                if start == -1:
-                    break
-                end = text[start:].find("}")
-                if end == -1:
-                    break
-                macro = text[start : start + end + 1]
-                replacement = "{err}"
-                if key == "n":
-                    replacement = "\n"
-                else:
-                    current = cur_card
-                    opt = macro[2]
-                    if opt in "NnsAa":
-                        # get the referenced object
-                        offset = macro.find(":")
-                        # the "current" object
-                        if offset == -1:
-                            current = cur_card
-                            if key == "l":
-                                try:
-                                    current = cur_card.location
-                                except AttributeError:
-                                    current = None
-                        # by name lookup
-                        else:
-                            name = macro[offset + 1 : -1]
-                            if len(name):
-                                if key == "l":
-                                    current = self.deck.find_location(name, default=cur_card)
-                                elif key == "i":
-                                    current = self.deck.find_item(name, default=cur_card)
-                                else:
-                                    current = self.deck.find_card(name, default=cur_card)
-                        if current is not None:
-                            # we have a target card
-                            if opt == "N":
-                                replacement = str(current.card_number)
-                            elif opt == "n":
-                                replacement = str(current.local_card_number)
-                            elif opt == "s":
-                                replacement = current.name
-                            elif opt == "A":
-                                replacement = chr(ord("A") + current.card_number - 1)
-                            elif opt == "a":
-                                replacement = chr(ord("A") + current.local_card_number - 1)
-                text = text[:start] + replacement + text[start + end + 1 :]
-        return text
-
-    def build_text_document(self, the_card: Card, text: str, base_style: Style, width: int):
-        doc = QtGui.QTextDocument()
-        font = self.build_font(base_style)
-        doc.setDefaultFont(font)
-        text_option = QtGui.QTextOption()
-        if base_style.justification == "center":
-            text_option.setAlignment(QtCore.Qt.AlignCenter)
-        elif base_style.justification == "left":
-            text_option.setAlignment(QtCore.Qt.AlignLeft)
-        elif base_style.justification == "right":
-            text_option.setAlignment(QtCore.Qt.AlignRight)
+    def render_face_image(self, face: FacePlan, copy: bool = True) -> QtGui.QImage:
+        # the card image of a compiled face, with the backend
+        if self.backend == "painter":
+            return self.render_image(face, copy)
+        with profile_span(self.profiler, "build_plan_scene", "step"):
+            self.build_plan_scene(face)
+        return self.render_image(copy=copy)
+
+    def render(self, face: str, number: int, plan: Optional[FacePlan] = None):
+        # the card file of the scene, or of a compiled face with the backend
+        # the image is saved before the next render
+        if plan is None:
+            img = self.render_image(copy=False)
         else:
-            text_option.setAlignment(QtCore.Qt.AlignJustify)
-        text_option.setWrapMode(QtGui.QTextOption.WordWrap)
-        doc.setDefaultTextOption(text_option)
-        cursor = QtGui.QTextCursor(doc)
-        text = self.replace_macros(the_card, text)
-        # Break the text into blocks as styles change
-        # {s:style_name} - pick another style
-        text_format = self.build_text_format(base_style)
-        while True:
-            # find the next style change or image
-            start_style = text.find("{s:")
-            start_image = text.find("{I:")
-            # if no more, done looping...
-            if (start_style == -1) and (start_image == -1):
-                break
-            # a style or an image on the left?
-            if (start_style > -1) and (start_image > -1):
-                if start_style < start_image:
-                    start_image = -1
-                else:
-                    start_style = -1
-            # we should only have one or the other
-            if start_style > -1:
-                is_style = True
-                start = start_style
-            elif start_image > -1:
-                is_style = False
-                start = start_image
-            else:
-                is_style = False
-                start = 0
-            # terminator
-            end = text[start:].find("}")
-            if end == -1:
-                break
-            # send text up to the format
-            cursor.insertText(text[:start], text_format)
-            if is_style:
-                # update the style and the remaining text
-                style = self.deck.find_style(text[start + 3 : start + end], default=base_style)
-                text_format = self.build_text_format(style)
-            else:
-                # parse image:dx:dy
-                info = text[start + 3 : start + end].split(":")
-                if len(info) == 3:
-                    image = self.deck.find_image(info[0], default=None)
-                    if image is not None:
-                        image = image.get_image(self.deck)
-                        if image is None:
-                            logging.error(f"Unable to find pixels for image:{info[0]}")
-                        else:
-                            try:
-                                dx = int(info[1])
-                                dy = int(info[2])
-                            except ValueError:
-                                dx = image.width()
-                                dy = image.height()
-                            if dx == -1:
-                                dx = image.width()
-                            if dy == -1:
-                                dy = image.height()
-                            if dx == -2:
-                                dx = image.width()
-                                if dy > 0:
-                                    dx = int(float(dy) / float(image.height()) * float(dx))
-                            if dy == -2:
-                                dy = image.height()
-                                if dx > 0:
-                                    dy = int(float(dx) / float(image.width()) * float(dy))
-                            # resize the image
-                            final_image = image.scaled(
-                                dx, dy, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation
-                            )
-                            cursor.insertImage(final_image)
-                else:
-                    logging.error("Invalid image token: {}".format(text[start + 3 : start + end]))
-            # remove the {} clause
-            text = text[start + end + 1 :]
-        # send the remaining text in the last format
-        if len(text):
-            cursor.insertText(text, text_format)
-        return doc
-
-    def build_text_format(self, style: Style):
-        tf = QtGui.QTextCharFormat()
-        font = self.build_font(style)
-        tf.setFont(font)
-        color = QtGui.QColor(
-            style.textcolor[0], style.textcolor[1], style.textcolor[2], style.textcolor[3]
+            img = self.render_face_image(plan, copy=False)
+        self.save_image(img, face, number)
+
+    def save_image(self, img: QtGui.QImage, face: str, number: int):
+        pathname = os.path.join(self.outdir, card_filename(face, number))
+        # print("Output file: {}".format(pathname))
+        # a new file, the old one may be linked to other card files
+        if os.path.lexists(pathname):
+            os.remove(pathname)
+        with profile_span(self.profiler, "img.save", "step"):
+            img.save(pathname)
+
+    def paint_face_file(self, face: FacePlan):
+        # the card file of a face painted on a worker thread, into its own image
+        name = card_filename(face.face, face.number)
+        with profile_span(self.profiler, name, "face", card=face.card, number=face.number):
+            image = QtGui.QImage(self.card_size[0], self.card_size[1], QtGui.QImage.Format_RGBA8888)
+            image.fill(0)
+            painter = QtGui.QPainter(image)
+            try:
+                self.draw_face(painter, face)
+            finally:
+                painter.end()
+            self.save_image(self.card_image(image, copy=False), face.face, face.number)
+
+    def render_workers(self, count: int) -> int:
+        # the threads painting count faces, within the memory budget
+        if (self.backend != "painter") or (count < 2):
+            return 1
+        # the painted image, the card image and the png encoder
+        per_worker = (self.card_size[0] * self.card_size[1] * 4) + (
+            (825 + 2 * self.pad_size) * (1425 + 2 * self.pad_size) * 4 * 2
         )
-        tf.setForeground(QtGui.QBrush(color))
-        return tf
-
-    def build_font(self, style: Style):
-        name = style.typeface
-        modifiers = ""
-        pos = name.find(":")
-        if pos > 0:
-            modifiers = name[pos + 1 :]
-            name = name[:pos]
-        font = QtGui.QFont(name)
-        # typeface and size, convert points to pixels
-        dpi = self.card_size[0] / 2.75  # the card is 2.75 inches wide
-        # base points on 72dpi
-        pixel_size = style.typesize * (dpi / 72.0)
-        font.setPixelSize(pixel_size)
-        font.setBold("bold" in modifiers)
-        font.setItalic("italic" in modifiers)
-        return font
+        workers = budget_workers("render threads", self.max_workers, self.max_memory, per_worker)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        return max(min(workers, count), 1)
+
+    def render_faces(self, faces: List[FacePlan]):
+        # Render the faces to their card files.  With the painter backend, the faces
+        # are painted concurrently on a thread pool, sharing the decoded images of the
+        # deck (QPainter and QTextDocument can be used on any thread with a QImage).
+        workers = self.render_workers(len(faces))
+        if workers == 1:
+            for face in faces:
+                name = card_filename(face.face, face.number)
+                with profile_span(self.profiler, name, "face", card=face.card, number=face.number):
+                    self.render(face.face, face.number, face)  # render the face to a file
+            return
+        # the files are decoded on first use, decode those of the faces (with their
+        # decode hints) before the threads share them
+        files = self.plan_files(faces)
+        self.deck.decode_files(files, stats=cache_stats("file decodes"))
+        self.prepare_threads(files)
+        # the first face also prepares the scaling, padding and saving of the card images
+        self.paint_face_file(faces[0])
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            # raises the first error of a thread
+            for _ in pool.map(self.paint_face_file, faces[1:]):
+                pass
+
+    def replace_macros(self, cur_card: Card, text: str):
+        return replace_macros(self.deck, cur_card, text)
 
     def update_gfx_items(self, the_card: Card, r: Renderable):
-        height = r.rectangle[3]
-        if isinstance(r, TextRender) or isinstance(r, RectRender):
-            if isinstance(r, TextRender):
-                height = self.update_text_gfx_obj(the_card, r, r.gfx_list[0], r.gfx_list[1:-1])
-            obj = r.gfx_list[-1]
-            self.update_rect_gfx_obj(the_card, r, obj, height=height)
-        elif isinstance(r, ImageRender):
-            self.update_image_gfx_obj(the_card, r, r.gfx_list[0])
+        op = compile_renderable(self.deck, the_card, r, r.order)
+        height = op.rectangle[3] if isinstance(op, (TextOp, RectOp)) else 0
+        if isinstance(op, TextOp):
+            height = self.update_text_item(op, r.gfx_list[0], r.gfx_list[1:-1])
+        if isinstance(op, (TextOp, RectOp)):
+            self.update_rect_item(op, r.gfx_list[-1], height=height)
+        elif isinstance(op, ImageOp):
+            self.update_image_item(op, r.gfx_list[0])
         r.set_gfx_depths()
 
     def make_gfx_items(self, the_card: Card, r: Renderable, selectable: bool):
+        op = compile_renderable(self.deck, the_card, r, r.order)
+        objs = self.make_op_items(op, selectable)
+        objs[0].setData(0, r)
+        return objs
+
+    def make_op_items(self, op: Op, selectable: bool = False) -> list:
         objs = list()
         # return a list of QGraphicsItem objects in order top to bottom
-        if isinstance(r, TextRender) or isinstance(r, RectRender):
-            # width = r.rectangle[2]
-            height = r.rectangle[3]
-            # base_style = self.deck.find_style(r.style)
-            if isinstance(r, TextRender):
+        if isinstance(op, TextOp) or isinstance(op, RectOp):
+            height = op.rectangle[3]
+            if isinstance(op, TextOp):
                 # obj = GraphicsTextItem(selectable)
                 obj = QtWidgets.QGraphicsTextItem()
                 obj.setFlag(QtWidgets.QGraphicsItem.ItemIsSelectable, selectable)
@@ -331,7 +315,7 @@ class Renderer(object):
                     halo_obj = QtWidgets.QGraphicsTextItem()
                     halo.append(halo_obj)
                     objs.append(halo_obj)
-                height = self.update_text_gfx_obj(the_card, r, obj, halo)
+                height = self.update_text_item(op, obj, halo)
 
             # backdrop (or rectangle)
             # obj = GraphicsRectItem(selectable and isinstance(r, RectRender))
@@ -339,67 +323,48 @@ class Renderer(object):
             obj.setFlag(
                 QtWidgets.QGraphicsItem.ItemIsSelectable, selectable and isinstance(obj, RectRender)
             )
-            self.update_rect_gfx_obj(the_card, r, obj, height=height)
+            self.update_rect_item(op, obj, height=height)
             objs.append(obj)
 
-        elif isinstance(r, ImageRender):
+        elif isinstance(op, ImageOp):
             # obj = GraphicsPixmapItem(selectable)
             obj = QtWidgets.QGraphicsPixmapItem()
             obj.setFlag(QtWidgets.QGraphicsItem.ItemIsSelectable, selectable)
-            self.update_image_gfx_obj(the_card, r, obj)
+            self.update_image_item(op, obj)
             objs.append(obj)
-
-        objs[0].setData(0, r)
         return objs
 
-    def update_text_gfx_obj(
+    def update_text_item(
         self,
-        the_card: Card,
-        r: TextRender,
+        op: TextOp,
         obj: GraphicsTextItem,
         halo: List[QtWidgets.QGraphicsTextItem],
     ):
-        base_style = self.deck.find_style(r.style)
-        doc = self.build_text_document(the_card, r.text, base_style, r.rectangle[2])
+        base_style = op.style
+        doc = self.build_text_document(op.runs, base_style)
         # some defaults
-        obj.setDefaultTextColor(
-            QtGui.QColor(
-                base_style.textcolor[0],
-                base_style.textcolor[1],
-                base_style.textcolor[2],
-                base_style.textcolor[3],
-            )
-        )
+        obj.setDefaultTextColor(qcolor(base_style.textcolor))
         obj.setDocument(doc)
-        obj.setTextWidth(r.rectangle[2])
-        obj.setX(r.rectangle[0])  # x,y,dx,dy
-        obj.setY(r.rectangle[1])
+        obj.setTextWidth(op.rectangle[2])
+        obj.setX(op.rectangle[0])  # x,y,dx,dy
+        obj.setY(op.rectangle[1])
 
         # compute the bounding box and snag the height for the backdrop...
         height = int(obj.boundingRect().height())
         # width = int(obj.boundingRect().width())
-        obj.setRotation(r.rotation)
+        obj.setRotation(op.rotation)
         # handle the 'halo' effect
         if base_style.linestyle == "halo":
-            offsets = [[-1, -1], [-1, 1], [1, -1], [1, 1], [0, 1], [0, -1], [1, 0], [-1, 0]]
-            style = copy.deepcopy(base_style)
-            style.textcolor = style.bordercolor
-            halo_doc = self.build_text_document(the_card, r.text, style, r.rectangle[2])
-            for i, offset in enumerate(offsets):
+            style = base_style._replace(textcolor=base_style.bordercolor)
+            halo_doc = self.build_text_document(op.runs, style)
+            for i, offset in enumerate(HALO_OFFSETS):
                 halo[i].setVisible(True)
                 halo[i].setDocument(halo_doc)
-                halo[i].setDefaultTextColor(
-                    QtGui.QColor(
-                        style.textcolor[0],
-                        style.textcolor[1],
-                        style.textcolor[2],
-                        style.textcolor[3],
-                    )
-                )
-                halo[i].setTextWidth(r.rectangle[2])
-                halo[i].setX(r.rectangle[0] + offset[0] * 3)  # x,y,dx,dy
-                halo[i].setY(r.rectangle[1] + offset[1] * 3)
-                halo[i].setRotation(r.rotation)
+                halo[i].setDefaultTextColor(qcolor(style.textcolor))
+                halo[i].setTextWidth(op.rectangle[2])
+                halo[i].setX(op.rectangle[0] + offset[0] * HALO_DISTANCE)  # x,y,dx,dy
+                halo[i].setY(op.rectangle[1] + offset[1] * HALO_DISTANCE)
+                halo[i].setRotation(op.rotation)
         else:
             for item in halo:
                 item.setVisible(False)
@@ -407,86 +372,37 @@ class Renderer(object):
             obj.updateHandlesPos()
         return height
 
-    def update_rect_gfx_obj(
+    def update_rect_item(
         self,
-        the_card: Card,
-        r: RectRender,
+        op: Union[RectOp, TextOp],
         obj: QtWidgets.QGraphicsRectItem,
         height: Optional[int] = None,
     ):
-        base_style = self.deck.find_style(r.style)
         # backdrop
-        if r.rectangle[3] > 0:
-            height = r.rectangle[3]
-        # "outset" the rectangle by the boundary_offset
-        left = r.rectangle[0] - base_style.boundary_offset
-        top = r.rectangle[1] - base_style.boundary_offset
-        width = r.rectangle[2] + 2 * base_style.boundary_offset
-        height += 2 * base_style.boundary_offset
+        left, top, width, height = rect_geometry(op, height)
         obj.setRect(left, top, width, height)
         obj.setTransformOriginPoint(QtCore.QPointF(left, top))
-        color = QtGui.QColor(
-            base_style.fillcolor[0],
-            base_style.fillcolor[1],
-            base_style.fillcolor[2],
-            base_style.fillcolor[3],
-        )
-        obj.setBrush(QtGui.QBrush(color))
-        pen = QtGui.QPen()
-        tmp = copy.deepcopy(base_style.bordercolor)
-        if (base_style.borderthickness == 0) or (base_style.linestyle == "halo"):
-            tmp[3] = 0
-        color = QtGui.QColor(tmp[0], tmp[1], tmp[2], tmp[3])
-        pen.setColor(color)
-        pen.setWidth(base_style.borderthickness)
-        if base_style.linestyle == "dash":
-            pen.setStyle(QtCore.Qt.DashLine)
-        elif base_style.linestyle == "dot":
-            pen.setStyle(QtCore.Qt.DotLine)
-        elif base_style.linestyle == "dashdot":
-            pen.setStyle(QtCore.Qt.DashDotLine)
-        obj.setPen(pen)
-        obj.setRotation(r.rotation)
+        obj.setBrush(QtGui.QBrush(qcolor(op.style.fillcolor)))
+        obj.setPen(rect_pen(op.style))
+        obj.setRotation(op.rotation)
         if isinstance(obj, GraphicsRectItem):
             obj.updateHandlesPos()
 
-    def update_image_gfx_obj(
-        self, the_card: Card, r: ImageRender, obj: QtWidgets.QGraphicsPixmapItem
-    ):
-        image = self.deck.find_image(r.image)
-        if image is not None:
-            sub_image = image.get_image(self.deck)
-            if sub_image is None:
-                logging.error(
-                    "Unable to find the reference file {} for image {}".format(image.file, r.image)
-                )
-            else:
-                pixmap = QtGui.QPixmap.fromImage(sub_image)
-                obj.setPixmap(pixmap)
-                obj.setX(r.rectangle[0])  # x,y,dx,dy
-                obj.setY(r.rectangle[1])
-                transform = QtGui.QTransform()
-                transform.rotate(r.rotation)
-                w = r.rectangle[2]
-                h = r.rectangle[3]
-                if w == -1:
-                    w = sub_image.width()
-                if h == -1:
-                    h = sub_image.height()
-                if w == -2:
-                    w = sub_image.width()
-                    if h > 0:
-                        w = float(h) / float(sub_image.height()) * float(w)
-                if h == -2:
-                    h = sub_image.height()
-                    if w > 0:
-                        h = float(w) / float(sub_image.width()) * float(h)
-                sx = float(w) / float(sub_image.width())
-                sy = float(h) / float(sub_image.height())
-                transform.scale(sx, sy)
-                obj.setTransform(transform, False)
-        else:
-            logging.error("Unable to find the reference image {}".format(r.image))
+    def update_image_item(self, op: ImageOp, obj: QtWidgets.QGraphicsPixmapItem):
+        if op.file is not None:
+            sub_image = self.op_image(op)
+            pixmap = QtGui.QPixmap.fromImage(sub_image)
+            obj.setPixmap(pixmap)
+            obj.setX(op.position[0])  # x,y,dx,dy
+            obj.setY(op.position[1])
+            transform = QtGui.QTransform()
+            transform.rotate(op.rotation)
+            # the size is in source pixels, but the scale is relative to the (possibly
+            # reduced resolution) decoded pixels
+            sx = float(op.size[0]) / float(sub_image.width())
+            sy = float(op.size[1]) / float(sub_image.height())
+            transform.scale(sx, sy)
+            obj.setTransform(transform, False)
         if isinstance(obj, GraphicsPixmapItem):
             obj.updateHandlesPos()
 
@@ -510,8 +426,7 @@ class Renderer(object):
         if top_bottom == "top":
             face = the_card.top_face
         # light blue background
-        base = QtWidgets.QGraphicsRectItem(0, 0, self.card_size[0], self.card_size[1])
-        base.setBrush(QtGui.QBrush(QtGui.QColor("#E0E0FF")))
+        base = self.make_op_items(card_base_op(self.card_size))[0]
         base.setZValue(-1000.0)
         self.scene.addItem(base)
         # generate the QGraphicsItems from the face and the background
@@ -539,46 +454,73 @@ class Renderer(object):
         self.scene.update(self.scene.sceneRect())
         return render_list
 
-    def render_card_to_disk(self, the_card: Card):
-        if (self.target_card is None) or (self.target_card == self.output_card_number):
-            logging.info(
-                "Rendering card number {}: {}".format(self.output_card_number, the_card.name)
-            )
-            self.build_card_face_scene(the_card, "top")
-            self.render("top", self.output_card_number)  # render the scene to a file
-            self.build_card_face_scene(the_card, "bot")
-            self.render("bot", self.output_card_number)  # render the scene to a file
-        self.output_card_number += 1
+    def build_plan_scene(self, face: FacePlan):
+        # the scene for a compiled card face
+        self.scene.clear()
+        for i, op in enumerate(face.ops):
+            with profile_span(self.profiler, type(op).__name__, "renderable", index=i):
+                # within an operation, the first items are on top
+                z = op.z
+                for gfx_item in self.make_op_items(op):
+                    gfx_item.setZValue(z)
+                    z -= 0.001
+                    self.scene.addItem(gfx_item)
+        self.scene.update(self.scene.sceneRect())
 
-    def render_deck(self, target_card: int = None):
-        self.output_card_number = 0
+    def render_plan(self, plan: DeckPlan, incremental: bool = False) -> List[str]:
+        # Render the faces of the plan to card files and return the names of the files
+        # written.  With incremental, the files of the faces with the same digest as
+        # the last time are kept.
+        location = ""
+        previous = self.face_digests
+        self.face_digests = dict()
+        rendered = dict()  # the first card file of each digest
+        written = list()
+        faces = list()  # the faces to render
+        links = list()  # the faces linked to a rendered face, with the name of its file
+        counts = dict(total=len(plan.faces), rendered=0, linked=0, unchanged=0)
+        stats = cache_stats("card faces")
+        for face in plan.faces:
+            name = card_filename(face.face, face.number)
+            digest = face_digest(face)
+            self.face_digests[name] = digest
+            pathname = os.path.join(self.outdir, name)
+            if incremental and (previous.get(name) == digest) and os.path.exists(pathname):
+                rendered.setdefault(digest, name)
+                counts["unchanged"] += 1
+                stats.hit()
+                continue
+            written.append(name)
+            if face.face == "top":
+                if face.location and (face.location != location):
+                    logging.info("Rendering location {}".format(face.location))
+                location = face.location
+                logging.info("Rendering card number {}: {}".format(face.number, face.card))
+            if self.share_faces and (digest in rendered):
+                links.append((face, rendered[digest]))
+                counts["linked"] += 1
+                stats.hit()
+                continue
+            faces.append(face)
+            rendered[digest] = name
+            counts["rendered"] += 1
+            stats.miss()
+        self.render_faces(faces)
+        # the rendered files are written, link the faces sharing them
+        for face, source in links:
+            name = card_filename(face.face, face.number)
+            with profile_span(self.profiler, name, "face", card=face.card, number=face.number):
+                with profile_span(self.profiler, "link_file", "step"):
+                    link_file(os.path.join(self.outdir, source), os.path.join(self.outdir, name))
+        self.face_counts = counts
+        if incremental:
+            logging.info("Rendered {} changed faces of {}".format(len(written), len(plan.faces)))
+        elif len(rendered) < len(plan.faces):
+            logging.info("Rendered {} unique faces of {}".format(len(rendered), len(plan.faces)))
+        return written
+
+    def render_deck(self, target_card: int = None, incremental: bool = False) -> List[str]:
+        # Compile the cards (all or only target_card) and render them to images
         self.target_card = target_card
-        # Walk all cards, rendering them to images
-        # misc - the catacomb attackers, success/failure
-        # base, items, plan, misc, characters, reference, locations
-        self.deck.renumber_entities()
-        # deckcards
-        for card in self.deck.deckcards:
-            self.render_card_to_disk(card)
-        # base
-        for card in self.deck.base:
-            self.render_card_to_disk(card)
-        # items
-        for card in self.deck.items:
-            self.render_card_to_disk(card)
-        # plan
-        for card in self.deck.plan:
-            self.render_card_to_disk(card)
-        # misc
-        for card in self.deck.misc:
-            self.render_card_to_disk(card)
-        # characters
-        for card in self.deck.characters:
-            self.render_card_to_disk(card)
-        # reference card
-        self.render_card_to_disk(self.deck.icon_reference)
-        # locations
-        for location in self.deck.locations:
-            logging.info("Rendering location {}".format(location.name))
-            for card in location.cards:
-                self.render_card_to_disk(card)
+        plan = compile_deck(self.deck, target_card)
+        return self.render_plan(plan, incremental)
@@ -0,0 +1,194 @@
+#
+# T.I.M.E Stories card generator
+# Copyright (C) Randall Frank
+# See LICENSE for details
+#
+
+import glob
+import logging
+import os
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from PySide6 import QtCore
+from card_objects import Deck, File
+from card_render import Renderer
+
+# Keeps a deck loaded and its cards rendered while the .deck file and the media files
+# it refers to are edited.  A change to the .deck file re-parses it, reusing the
+# decoded images of unchanged files, and a change to a media file only reloads that
+# file.  Either way, only the faces whose render plans changed are rendered again.
+
+# wait for the writes to settle before updating, editors often save in several steps
+SETTLE_MSEC = 300
+
+
+def media_paths(deck: Deck) -> Dict[str, List[File]]:
+    # the real pathnames (symlinks resolved) of the files read from disk and the assets
+    # using them
+    paths = dict()
+    for f in deck.files:
+        if f.store_inline or (not f.filename) or f.filename.startswith(":"):
+            continue
+        path = os.path.realpath(f.get_full_pathname(deck))
+        paths.setdefault(path, list()).append(f)
+    return paths
+
+
+def remove_stale_cards(outdir: str, count: int) -> None:
+    # remove the card files numbered count or more, left by a larger deck
+    for pathname in glob.glob(os.path.join(outdir, "card_*_*.png")):
+        match = re.fullmatch(r"card_(top|bot)_(\d+)\.png", os.path.basename(pathname))
+        if match and (int(match.group(2)) >= count):
+            os.remove(pathname)
+
+
+def file_stamp(path: str) -> Optional[Tuple[int, int]]:
+    # the modification time and size of a file, None if it is missing
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return info.st_mtime_ns, info.st_size
+
+
+class LoadedDeck(object):
+    # A deck, its renderer and the files it was read from.  reload() brings the deck up
+    # to date with the files that changed.  The paths are real paths, the same deck
+    # reached through a symlink has the same filename.
+    def __init__(self, filename: str, render: Renderer, reduce_resolution: bool = True):
+        self.filename: str = os.path.realpath(filename)
+        self.render: Renderer = render
+        self.reduce_resolution: bool = reduce_resolution
+        self.media: Dict[str, List[File]] = media_paths(render.deck)
+        self.stamps: Dict[str, Optional[Tuple[int, int]]] = self.file_stamps()
+
+    @property
+    def deck(self) -> Deck:
+        return self.render.deck
+
+    def paths(self) -> List[str]:
+        return [self.filename] + list(self.media.keys())
+
+    def file_stamps(self) -> Dict[str, Optional[Tuple[int, int]]]:
+        return {path: file_stamp(path) for path in self.paths()}
+
+    def changed_files(self) -> Set[str]:
+        # the files changed since the deck was (re)loaded, for polling
+        return set(path for path, stamp in self.stamps.items() if file_stamp(path) != stamp)
+
+    def reload(self, paths: Iterable[str]) -> bool:
+        # Read the changed files again, returns True if the deck changed
+        paths = set(os.path.realpath(path) for path in paths)
+        # the stamps are recorded even if the deck can not be read, it is read again on
+        # its next change instead of on every poll
+        self.stamps = self.file_stamps()
+        if self.filename in paths:
+            logging.info("Reading {}...".format(self.filename))
+            if not self.reload_deck():
+                return False
+            self.stamps = self.file_stamps()
+        else:
+            files = [f for path in paths for f in self.media.get(path, list())]
+            if not files:
+                return False
+            self.reload_files(files)
+        return True
+
+    def reload_deck(self) -> bool:
+        deck = Deck()
+        if not deck.load(self.filename, self.reduce_resolution, previous=self.deck):
+            # likely saved half way through an edit, keep the last good deck
+            logging.error("Unable to read the file: {}".format(self.filename))
+            return False
+        render = self.render
+        if list(deck.get_card_size()) != list(render.card_size):
+            # a new card size needs a new renderer, all of the faces change
+            render.close()
+            self.render = Renderer(deck, render.outdir)
+            self.render.pad_size = render.pad_size
+            self.render.share_faces = render.share_faces
+            self.render.backend = render.backend
+            self.render.max_workers = render.max_workers
+            self.render.max_memory = render.max_memory
+        else:
+            render.deck = deck
+        self.media = media_paths(deck)
+        return True
+
+    def reload_files(self, files: List[File]):
+        for f in files:
+            logging.info("Reading {}...".format(f.filename))
+            f.load_file(self.deck, f.filename, decode=False)
+        if self.reduce_resolution:
+            self.deck.decode_files(self.deck.set_file_decode_hints())
+        else:
+            self.deck.decode_files(files)
+
+
+class DeckWatcher(QtCore.QObject):
+    def __init__(
+        self,
+        filename: str,
+        render: Renderer,
+        reduce_resolution: bool = True,
+        target_card: Optional[int] = None,
+        on_update: Optional[Callable[[Renderer], None]] = None,
+    ):
+        super().__init__()
+        self.loaded: LoadedDeck = LoadedDeck(filename, render, reduce_resolution)
+        self.target_card: Optional[int] = target_card
+        # called after card files were written, to refresh the pdf and Tabletop outputs
+        self.on_update: Optional[Callable[[Renderer], None]] = on_update
+        self.changed: Set[str] = set()
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(SETTLE_MSEC)
+        self.timer.timeout.connect(self.on_timeout)
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        self.watcher.fileChanged.connect(self.on_file_changed)
+        self.watch_files()
+
+    @property
+    def deck(self) -> Deck:
+        return self.loaded.deck
+
+    @property
+    def render(self) -> Renderer:
+        return self.loaded.render
+
+    def watch_files(self):
+        # (re)start watching the deck and media files.  Files replaced by a rename
+        # are dropped by QFileSystemWatcher and added again here.
+        watched = set(self.watcher.files())
+        paths = self.loaded.paths()
+        stale = [path for path in watched if path not in paths]
+        if stale:
+            self.watcher.removePaths(stale)
+        missing = [path for path in paths if (path not in watched) and os.path.exists(path)]
+        if missing:
+            self.watcher.addPaths(missing)
+
+    def on_file_changed(self, path: str):
+        self.changed.add(path)
+        self.timer.start()
+
+    def on_timeout(self):
+        changed = self.changed
+        self.changed = set()
+        self.refresh(changed)
+
+    def refresh(self, paths: Iterable[str]) -> List[str]:
+        # Bring the deck up to date with the changed files and render the faces that
+        # changed.  Returns the names of the card files written.
+        if not self.loaded.reload(paths):
+            self.watch_files()
+            return list()
+        written = self.render.render_deck(self.target_card, incremental=True)
+        if self.target_card is None:
+            count = len(self.render.face_digests) // 2
+            remove_stale_cards(self.render.outdir, count)
+        if written and (self.on_update is not None):
+            self.on_update(self.render)
+        self.watch_files()
+        return written
@@ -0,0 +1,253 @@
+#
+# T.I.M.E Stories card editor
+# Copyright (C) Randall Frank
+# See LICENSE for details
+#
+
+import hashlib
+import io
+import logging
+import os
+import re
+import shutil
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+from PySide6 import QtCore
+
+# git clone on a worker thread.  dulwich writes the progress of the server and of the
+# pack transfer to its error stream as "<stage>: 45% (45/100)\r" or "<stage>: 45/100\r"
+# lines, CloneProgress turns them into an overall percentage by giving each of the
+# stages a slice of the total.  A clone is cancelled by raising from the stream on
+# the next progress line, the partial checkout is then removed (as is a checkout that
+# completed before the cancel was seen).
+#
+# build_deck keeps the decks it builds from git in a clone cache, one checkout per url.
+# The checkouts are shallow (depth commits) and later builds fetch into the existing
+# checkout instead of cloning again.  A ref (branch, tag or commit) pins the checkout,
+# the default is the HEAD of the remote.
+
+STAGES = (
+    (("enumerating objects", "counting objects"), 0, 10),
+    (("compressing objects",), 10, 20),
+    (("receiving objects", "writing pack data"), 20, 90),
+    (("resolving deltas",), 90, 100),
+)
+PROGRESS_LINE = re.compile(r"^(?P<stage>[A-Za-z ]+):\s*(?:\d+%\s*\()?(?P<done>\d+)/(?P<total>\d+)")
+
+DEPTH = 1
+COMMIT_ID = re.compile(r"^[0-9a-f]{40}$")
+
+ProgressCallback = Callable[[int, str], None]
+
+
+class CloneCancelled(Exception):
+    pass
+
+
+def stage_percent(stage: str, done: int, total: int) -> Optional[int]:
+    # the overall percentage at done/total of a stage, None for an unknown stage
+    stage = stage.strip().lower()
+    for names, start, end in STAGES:
+        if stage in names:
+            fraction = min(done / total, 1.0) if total > 0 else 1.0
+            return start + int((end - start) * fraction)
+    return None
+
+
+class CloneProgress(io.RawIOBase):
+    # The errstream given to porcelain.clone().  progress is called with the overall
+    # percentage and the text of every complete progress line.
+    def __init__(self, progress: Optional[ProgressCallback] = None):
+        super().__init__()
+        self.progress: Optional[ProgressCallback] = progress
+        self.percent: int = 0
+        self.cancelled = threading.Event()
+        self.text: str = ""
+        self._partial: str = ""
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self.cancelled.is_set():
+            raise CloneCancelled("The clone was cancelled")
+        text = bytes(data).decode("utf-8", errors="replace")
+        self.text += text
+        lines = re.split(r"[\r\n]", self._partial + text)
+        self._partial = lines.pop()
+        for line in lines:
+            self.parse_line(line.strip())
+        return len(data)
+
+    def parse_line(self, line: str):
+        if not line:
+            return
+        match = PROGRESS_LINE.match(line)
+        if match:
+            percent = stage_percent(
+                match.group("stage"), int(match.group("done")), int(match.group("total"))
+            )
+            if percent is not None:
+                # the stages do not go backwards
+                self.percent = max(self.percent, percent)
+        if self.progress is not None:
+            self.progress(self.percent, line)
+
+
+def clear_directory(path: str):
+    # remove the contents of path, but not the directory itself
+    for name in os.listdir(path):
+        target = os.path.join(path, name)
+        if os.path.isdir(target) and not os.path.islink(target):
+            shutil.rmtree(target, ignore_errors=True)
+        else:
+            os.remove(target)
+
+
+def clone_repo(url: str, destination: str, stream: Optional[CloneProgress] = None) -> str:
+    # Clone url into the (empty) destination directory.  The error text is returned,
+    # an empty string on success.  destination is emptied on failure.
+    from dulwich import porcelain
+
+    if stream is None:
+        stream = CloneProgress()
+    error = ""
+    try:
+        repo = porcelain.clone(url, destination, errstream=stream)
+        repo.close()
+    except CloneCancelled as e:
+        error = str(e)
+    except Exception as e:
+        error = str(e) or e.__class__.__name__
+        logging.debug(f"git clone of {url} failed: {error}\n{stream.text}")
+    if error and os.path.isdir(destination):
+        clear_directory(destination)
+    return error
+
+
+def default_cache_dir() -> str:
+    location = QtCore.QStandardPaths.writableLocation(QtCore.QStandardPaths.GenericCacheLocation)
+    return os.path.join(location, "heresycardbuilder", "git")
+
+
+def cache_path(cache_dir: str, url: str) -> str:
+    # the checkout of url in the cache, the repo name keeps it readable
+    name = url.rstrip("/").split("/")[-1]
+    if name.endswith(".git"):
+        name = name[:-4]
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(cache_dir, f"{name}-{key}" if name else key)
+
+
+def resolve_ref(refs: Dict[bytes, bytes], ref: Optional[str]) -> Optional[bytes]:
+    # the commit id of ref in the fetched refs (a peeled tag is preferred)
+    if ref is None:
+        return refs.get(b"HEAD")
+    name = ref.encode("utf-8")
+    for candidate in (b"refs/tags/" + name, b"refs/heads/" + name, name):
+        sha = refs.get(candidate + b"^{}", refs.get(candidate))
+        if sha is not None:
+            return sha
+    return None
+
+
+def fetch_checkout(
+    path: str,
+    url: str,
+    ref: Optional[str] = None,
+    depth: Optional[int] = DEPTH,
+    stream: Optional[CloneProgress] = None,
+) -> str:
+    # Fetch url into the repo at path (created when missing) and check out ref.  The
+    # commit id is returned.  A commit that is not in the shallow history fetches the
+    # full history.
+    from dulwich import porcelain
+    from dulwich.objects import Tag
+
+    if stream is None:
+        stream = CloneProgress()
+    if not os.path.isdir(os.path.join(path, ".git")):
+        os.makedirs(path, exist_ok=True)
+        porcelain.init(path).close()
+    with porcelain.open_repo_closing(path) as repo:
+        result = porcelain.fetch(repo, url, errstream=stream, depth=depth)
+        sha = resolve_ref(result.refs, ref)
+        if (sha is None) and (ref is not None) and COMMIT_ID.match(ref.lower()):
+            sha = ref.lower().encode("ascii")
+            if (sha not in repo.object_store) and (depth is not None):
+                porcelain.fetch(repo, url, errstream=stream, unshallow=True)
+            if sha not in repo.object_store:
+                raise ValueError(f"No commit {ref} in {url}")
+        if sha is None:
+            raise ValueError(f"No ref {ref} in {url}" if ref else f"No HEAD in {url}")
+        target = repo[sha]
+        while isinstance(target, Tag):
+            target = repo[target.object[1]]
+        porcelain.reset(repo, "hard", target.id)
+        return target.id.decode("ascii")
+
+
+def cached_clone(
+    url: str,
+    cache_dir: Optional[str] = None,
+    ref: Optional[str] = None,
+    depth: Optional[int] = DEPTH,
+    stream: Optional[CloneProgress] = None,
+) -> Tuple[str, str]:
+    # The checkout of ref of url in the clone cache and its commit id.  A cached
+    # checkout that can no longer be updated is cloned again.
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    path = cache_path(cache_dir, url)
+    if os.path.isdir(path):
+        try:
+            return path, fetch_checkout(path, url, ref, depth, stream)
+        except ValueError:
+            raise
+        except Exception as e:
+            logging.info(f"Unable to update the cached clone {path}, cloning again: {str(e)}")
+            shutil.rmtree(path, ignore_errors=True)
+    try:
+        return path, fetch_checkout(path, url, ref, depth, stream)
+    except Exception:
+        shutil.rmtree(path, ignore_errors=True)
+        raise
+
+
+class CloneWorker(QtCore.QObject):
+    # Runs clone_repo() on a worker thread.  progress is emitted with the percentage
+    # and the current progress line, finished with the error text ("" on success).
+    # Both are delivered on the thread of the worker object.
+    progress = QtCore.Signal(int, str)
+    finished = QtCore.Signal(str)
+
+    def __init__(self, url: str, destination: str, parent: Optional[QtCore.QObject] = None):
+        super().__init__(parent)
+        self.url: str = url
+        self.destination: str = destination
+        self.stream = CloneProgress(self.progress.emit)
+        self._worker_thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._worker_thread = threading.Thread(target=self.run, daemon=True)
+        self._worker_thread.start()
+
+    def cancel(self):
+        self.stream.cancelled.set()
+
+    def is_cancelled(self) -> bool:
+        return self.stream.cancelled.is_set()
+
+    def run(self):
+        self.finished.emit(self.result(clone_repo(self.url, self.destination, self.stream)))
+
+    def result(self, error: str) -> str:
+        # The stream only sees a cancel on the next progress line of dulwich.  A clone
+        # cancelled after the last one finishes, it is removed here so that a cancelled
+        # clone always leaves the destination empty.
+        if self.is_cancelled() and not error:
+            if os.path.isdir(self.destination):
+                clear_directory(self.destination)
+            error = "The clone was cancelled"
+        return error
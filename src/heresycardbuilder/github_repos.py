@@ -0,0 +1,114 @@
+#
+# T.I.M.E Stories card editor
+# Copyright (C) Randall Frank
+# See LICENSE for details
+#
+
+import json
+import logging
+import os
+import threading
+from typing import List, Optional, Tuple
+
+from PySide6 import QtCore
+
+# The GitHub repos with the "heresycarddeck" topic, listed in the editor Download menu.
+# The search runs on a worker thread with a timeout and the answer is cached on disk
+# with its ETag, so later queries are revalidated (a 304 does not count against the
+# rate limit) and the last list is still shown when GitHub cannot be reached.
+
+SEARCH_URL = "https://api.github.com/search/repositories?q=topic:heresycarddeck"
+TIMEOUT = 10.0
+
+Repo = Tuple[str, str]  # the full name and the clone url
+
+
+def default_cache_file() -> str:
+    location = QtCore.QStandardPaths.writableLocation(QtCore.QStandardPaths.GenericCacheLocation)
+    return os.path.join(location, "heresycardbuilder", "github_repos.json")
+
+
+def read_cache(cache_file: str, url: str) -> Optional[dict]:
+    try:
+        with open(cache_file, "r") as fp:
+            cache = json.load(fp)
+    except (OSError, ValueError):
+        return None
+    if (not isinstance(cache, dict)) or (cache.get("url") != url):
+        return None
+    return cache
+
+
+def write_cache(cache_file: str, cache: dict):
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp = cache_file + ".tmp"
+        with open(tmp, "w") as fp:
+            json.dump(cache, fp)
+        os.replace(tmp, cache_file)
+    except OSError as e:
+        logging.debug(f"Unable to cache the GitHub repos: {str(e)}")
+
+
+def parse_repos(info: dict) -> List[Repo]:
+    repos = list()
+    for item in info.get("items", []):
+        target = item.get("clone_url", "")
+        if target:
+            repos.append((item.get("full_name", "Unknown name"), target))
+    return repos
+
+
+def fetch_repos(
+    url: str = SEARCH_URL, cache_file: Optional[str] = None, timeout: float = TIMEOUT
+) -> List[Repo]:
+    # The repos found by the search url.  The cached answer is used when GitHub says it
+    # is still current or when the query fails.
+    import requests
+
+    if cache_file is None:
+        cache_file = default_cache_file()
+    cache = read_cache(cache_file, url)
+    headers = {"Accept": "application/vnd.github+json"}
+    if (cache is not None) and cache.get("etag"):
+        headers["If-None-Match"] = cache["etag"]
+    try:
+        r = requests.get(url, headers=headers, timeout=timeout)
+        if (r.status_code == 304) and (cache is not None):
+            return parse_repos(cache)
+        r.raise_for_status()
+        info = r.json()
+    except (requests.RequestException, ValueError) as e:
+        logging.info(f"Unable to query GitHub for decks: {str(e)}")
+        return parse_repos(cache) if cache is not None else list()
+    write_cache(
+        cache_file, dict(url=url, etag=r.headers.get("ETag", ""), items=info.get("items", []))
+    )
+    return parse_repos(info)
+
+
+class GithubRepoQuery(QtCore.QObject):
+    # Runs fetch_repos() on a worker thread, finished is emitted (on the thread of the
+    # query object) with the list of repos
+    finished = QtCore.Signal(list)
+
+    def __init__(
+        self,
+        parent: Optional[QtCore.QObject] = None,
+        url: str = SEARCH_URL,
+        cache_file: Optional[str] = None,
+        timeout: float = TIMEOUT,
+    ):
+        super().__init__(parent)
+        self.url: str = url
+        self.cache_file: str = cache_file if cache_file is not None else default_cache_file()
+        self.timeout: float = timeout
+        self._worker_thread: Optional[threading.Thread] = None
+
+    def start(self):
+        # a daemon thread, so a slow query does not keep the editor from exiting
+        self._worker_thread = threading.Thread(target=self.run, daemon=True)
+        self._worker_thread.start()
+
+    def run(self):
+        self.finished.emit(fetch_repos(self.url, self.cache_file, self.timeout))
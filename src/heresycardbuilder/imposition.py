@@ -0,0 +1,120 @@
+#
+# T.I.M.E Stories card generator
+# Copyright (C) Randall Frank
+# See LICENSE for details
+#
+
+from typing import List, NamedTuple, Optional, Tuple
+
+# Placement of cards on printed sheets.  All of the sizes are in device pixels of
+# the output page (the pdf files are written at 300 dpi).
+
+DUPLEX_MODES = ["long", "short", "none"]
+
+
+class Slot(NamedTuple):
+    x: float
+    y: float
+
+
+class Imposition(object):
+    """A columns x rows grid of cards on a page, front and back.
+
+    With columns or rows of 0, as many as fit are used.  With a gutter of None, the
+    free space is spread evenly around the cards, otherwise the cards are spaced by
+    the gutter and the grid is centered.  The outer bleed pixels of the card images
+    are outside of the cut lines.  Backs are mirrored for printing on both sides:
+    "long" flips around the long (vertical) edge of the page, "short" around the
+    short edge and "none" puts the backs in the same place as the fronts.
+    """
+
+    def __init__(
+        self,
+        page_size: Tuple[float, float],
+        card_size: Tuple[float, float],
+        columns: int = 0,
+        rows: int = 0,
+        gutter: Optional[float] = None,
+        bleed: float = 0,
+        margin: float = 0,
+        duplex: str = "long",
+    ):
+        if duplex not in DUPLEX_MODES:
+            raise ValueError(f"Unknown duplex mode '{duplex}', use one of {DUPLEX_MODES}")
+        self.page_size = page_size
+        self.card_size = card_size
+        self.gutter = gutter
+        self.bleed = bleed
+        self.margin = margin
+        self.duplex = duplex
+        space = 0 if gutter is None else gutter
+        width = page_size[0] - 2 * margin
+        height = page_size[1] - 2 * margin
+        if columns <= 0:
+            columns = int((width + space) // (card_size[0] + space))
+        if rows <= 0:
+            rows = int((height + space) // (card_size[1] + space))
+        self.columns = columns
+        self.rows = rows
+        grid_width = columns * card_size[0] + (columns - 1) * space
+        grid_height = rows * card_size[1] + (rows - 1) * space
+        if (columns < 1) or (rows < 1) or (grid_width > width) or (grid_height > height):
+            raise ValueError(
+                "{}x{} cards of {}x{} do not fit on a {}x{} page".format(
+                    columns, rows, card_size[0], card_size[1], page_size[0], page_size[1]
+                )
+            )
+        if gutter is None:
+            xspace = (width - columns * card_size[0]) / (columns + 1)
+            yspace = (height - rows * card_size[1]) / (rows + 1)
+            self._x = [margin + xspace + c * (xspace + card_size[0]) for c in range(columns)]
+            self._y = [margin + yspace + r * (yspace + card_size[1]) for r in range(rows)]
+        else:
+            left = (page_size[0] - grid_width) / 2
+            top = (page_size[1] - grid_height) / 2
+            self._x = [left + c * (gutter + card_size[0]) for c in range(columns)]
+            self._y = [top + r * (gutter + card_size[1]) for r in range(rows)]
+
+    @property
+    def cards_per_page(self) -> int:
+        return self.columns * self.rows
+
+    def slots(self, back: bool = False) -> List[Slot]:
+        # the upper left corners of the cards, in the order of the cards on the sheet
+        w, h = self.card_size
+        result = list()
+        for y in self._y:
+            for x in self._x:
+                if back and (self.duplex == "long"):
+                    x = self.page_size[0] - x - w
+                elif back and (self.duplex == "short"):
+                    y = self.page_size[1] - y - h
+                result.append(Slot(x, y))
+        return result
+
+    def cut_marks(
+        self, back: bool = False, length: float = 36, offset: float = 12
+    ) -> List[Tuple[float, float, float, float]]:
+        # Lines (x0, y0, x1, y1) extending the cut lines outside of the grid, starting
+        # offset pixels from the card images and clipped to the page.
+        slots = self.slots(back)
+        w, h = self.card_size
+        xs = sorted(set(x for s in slots for x in (s.x + self.bleed, s.x + w - self.bleed)))
+        ys = sorted(set(y for s in slots for y in (s.y + self.bleed, s.y + h - self.bleed)))
+        left = min(s.x for s in slots) - offset
+        right = max(s.x for s in slots) + w + offset
+        top = min(s.y for s in slots) - offset
+        bottom = max(s.y for s in slots) + h + offset
+        page_width, page_height = self.page_size
+        lines = list()
+        for x in xs:
+            if top > 0:
+                lines.append((x, max(top - length, 0), x, top))
+            if bottom < page_height:
+                lines.append((x, bottom, x, min(bottom + length, page_height)))
+        for y in ys:
+            if left > 0:
+                lines.append((max(left - length, 0), y, left, y))
+            if right < page_width:
+                lines.append((right, y, min(right + length, page_width), y))
+        return lines
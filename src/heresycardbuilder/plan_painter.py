@@ -0,0 +1,367 @@
+#
+# T.I.M.E Stories card generator
+# Copyright (C) Randall Frank
+# See LICENSE for details
+#
+
+import enum
+import math
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+
+from PySide6 import QtCore, QtGui
+from card_objects import Deck, File
+from render_plan import (
+    BASE_STYLE,
+    FacePlan,
+    ImageOp,
+    InlineImage,
+    Op,
+    RectOp,
+    StyleSpec,
+    TextOp,
+    TextRun,
+)
+
+# Draws the operations of a render plan with a QPainter, without a QGraphicsScene.
+# The Renderer scene builds the same pictures out of graphics items (see
+# Renderer.make_op_items()) and PlanPainter paints what scene.render() paints for
+# them: for each operation, bottom to top, the backdrop rectangle, the 8 halo copies
+# of the text and the text, or the image.  The items are drawn with the transforms
+# the graphics items have, so the pixels match the scene.
+#
+# Only QImage, QTextDocument and QPainter are used (no QPixmap or QGraphicsItem), so
+# faces can be painted on worker threads into their own images, once
+# prepare_threads() has been called on the main thread.  PySide creates the Python
+# types of the Qt classes (and of their enums and nested classes) the first time they
+# are used, which crashes when threads race to do it.  prepare_qt_types() creates all
+# of those of QtCore and QtGui up front.
+
+# the halo copies of a text, in the order of the graphics items (top to bottom)
+HALO_OFFSETS = ((-1, -1), (-1, 1), (1, -1), (1, 1), (0, 1), (0, -1), (1, 0), (-1, 0))
+HALO_DISTANCE = 3
+
+
+_qt_types_lock = threading.Lock()
+_qt_types_ready = False
+
+
+def prepare_qt_types():
+    # create the Python types of every QtCore and QtGui class, enum and nested class
+    global _qt_types_ready
+    with _qt_types_lock:
+        if _qt_types_ready:
+            return
+        pending = [
+            getattr(module, name, None) for module in (QtCore, QtGui) for name in dir(module)
+        ]
+        seen = set()
+        while pending:
+            scope = pending.pop()
+            if (not isinstance(scope, type)) or (scope in seen):
+                continue
+            seen.add(scope)
+            if isinstance(scope, enum.EnumMeta):
+                list(scope)
+                continue
+            for name in dir(scope):
+                try:
+                    value = getattr(scope, name)
+                except Exception:
+                    continue
+                if isinstance(value, type):
+                    pending.append(value)
+        _qt_types_ready = True
+
+
+def qcolor(rgba: Tuple[int, int, int, int]) -> QtGui.QColor:
+    return QtGui.QColor(rgba[0], rgba[1], rgba[2], rgba[3])
+
+
+def rect_geometry(op: Union[RectOp, TextOp], height: int) -> Tuple[int, int, int, int]:
+    # The left, top, width and height of the backdrop of op.  height is the height of
+    # the text, used when the rectangle does not have one.  The rectangle is
+    # "outset" by the boundary offset of the style.
+    style = op.style
+    if op.rectangle[3] > 0:
+        height = op.rectangle[3]
+    left = op.rectangle[0] - style.boundary_offset
+    top = op.rectangle[1] - style.boundary_offset
+    width = op.rectangle[2] + 2 * style.boundary_offset
+    return left, top, width, height + 2 * style.boundary_offset
+
+
+def rect_pen(style: StyleSpec) -> QtGui.QPen:
+    pen = QtGui.QPen()
+    color = list(style.bordercolor)
+    if (style.borderthickness == 0) or (style.linestyle == "halo"):
+        color[3] = 0
+    pen.setColor(qcolor(color))
+    pen.setWidth(style.borderthickness)
+    if style.linestyle == "dash":
+        pen.setStyle(QtCore.Qt.DashLine)
+    elif style.linestyle == "dot":
+        pen.setStyle(QtCore.Qt.DotLine)
+    elif style.linestyle == "dashdot":
+        pen.setStyle(QtCore.Qt.DashDotLine)
+    return pen
+
+
+class PlanPainter(object):
+    def __init__(self, the_deck: Deck):
+        self.deck: Deck = the_deck
+        self.card_size = the_deck.get_card_size()
+        # art pixels kept per card pixel drawn, None keeps all of the decoded pixels
+        self.max_image_scale: Optional[float] = None
+        # a copy of the application palette for the text, see text_palette()
+        self._palette: Optional[QtGui.QPalette] = None
+
+    def plan_image(self, file: str, source) -> QtGui.QImage:
+        # the pixels of a file region referenced by the plan
+        f = self.deck.find_file(file)
+        if f is None:
+            image = QtGui.QImage()
+            image.load(":/default_files/Default")
+            return image
+        # the file may have been decoded at a reduced resolution
+        return f.get_region(source)
+
+    def plan_region(self, file: str, source) -> Tuple[QtGui.QImage, QtCore.QRect]:
+        # the decoded image of a file and its pixels of a region, without a copy
+        f = self.deck.find_file(file)
+        if f is None:
+            image = QtGui.QImage()
+            image.load(":/default_files/Default")
+            return image, image.rect()
+        return f.image, f.region_rect(source)
+
+    def op_image(self, op: ImageOp) -> QtGui.QImage:
+        # the pixels drawn for an image operation, reduced to max_image_scale
+        sub_image = self.plan_image(op.file, op.source)
+        if self.max_image_scale is not None:
+            width = max(math.ceil(op.size[0] * self.max_image_scale), 1)
+            height = max(math.ceil(op.size[1] * self.max_image_scale), 1)
+            if (sub_image.width() > width) or (sub_image.height() > height):
+                sub_image = sub_image.scaled(
+                    min(width, sub_image.width()),
+                    min(height, sub_image.height()),
+                    QtCore.Qt.IgnoreAspectRatio,
+                    QtCore.Qt.SmoothTransformation,
+                )
+        return sub_image
+
+    def op_images(self, face: FacePlan) -> Dict[ImageOp, QtGui.QImage]:
+        # the op_image() of each image operation of the face, for painting the face
+        # several times without reducing the images again
+        return {
+            op: self.op_image(op)
+            for op in face.ops
+            if isinstance(op, ImageOp) and (op.file is not None)
+        }
+
+    def build_text_document(self, runs, base_style: StyleSpec):
+        doc = QtGui.QTextDocument()
+        font = self.build_font(base_style)
+        doc.setDefaultFont(font)
+        text_option = QtGui.QTextOption()
+        if base_style.justification == "center":
+            text_option.setAlignment(QtCore.Qt.AlignCenter)
+        elif base_style.justification == "left":
+            text_option.setAlignment(QtCore.Qt.AlignLeft)
+        elif base_style.justification == "right":
+            text_option.setAlignment(QtCore.Qt.AlignRight)
+        else:
+            text_option.setAlignment(QtCore.Qt.AlignJustify)
+        text_option.setWrapMode(QtGui.QTextOption.WordWrap)
+        doc.setDefaultTextOption(text_option)
+        cursor = QtGui.QTextCursor(doc)
+        base_format = self.build_text_format(base_style)
+        for run in runs:
+            if isinstance(run, TextRun):
+                text_format = base_format
+                if run.style is not None:
+                    text_format = self.build_text_format(run.style)
+                cursor.insertText(run.text, text_format)
+            else:
+                # resize the image
+                image = self.plan_image(run.file, run.source)
+                final_image = image.scaled(
+                    run.size[0],
+                    run.size[1],
+                    QtCore.Qt.IgnoreAspectRatio,
+                    QtCore.Qt.SmoothTransformation,
+                )
+                cursor.insertImage(final_image)
+        return doc
+
+    def build_text_format(self, style: StyleSpec):
+        tf = QtGui.QTextCharFormat()
+        font = self.build_font(style)
+        tf.setFont(font)
+        tf.setForeground(QtGui.QBrush(qcolor(style.textcolor)))
+        return tf
+
+    def build_font(self, style: StyleSpec):
+        name = style.typeface
+        modifiers = ""
+        pos = name.find(":")
+        if pos > 0:
+            modifiers = name[pos + 1 :]
+            name = name[:pos]
+        font = QtGui.QFont(name)
+        # typeface and size, convert points to pixels
+        dpi = self.card_size[0] / 2.75  # the card is 2.75 inches wide
+        # base points on 72dpi
+        pixel_size = style.typesize * (dpi / 72.0)
+        font.setPixelSize(pixel_size)
+        font.setBold("bold" in modifiers)
+        font.setItalic("italic" in modifiers)
+        return font
+
+    def plan_files(self, faces: List[FacePlan]) -> List[File]:
+        # the deck files drawn by the image operations and inline images of the faces
+        names = set()
+        for face in faces:
+            for op in face.ops:
+                if isinstance(op, ImageOp):
+                    names.add(op.file)
+                elif isinstance(op, TextOp):
+                    names.update(run.file for run in op.runs if isinstance(run, InlineImage))
+        return [f for f in self.deck.files if f.name in names]
+
+    def text_palette(self) -> QtGui.QPalette:
+        # the application palette, read once (on the main thread, by prepare_threads())
+        if self._palette is None:
+            self._palette = QtGui.QPalette(QtGui.QGuiApplication.palette())
+        return self._palette
+
+    def prepare_threads(self, files: List[File]):
+        # Called on the main thread before painting on others: create the Qt types,
+        # read the palette and paint every kind of operation once, with one of the
+        # (decoded) files that the threads draw.
+        prepare_qt_types()
+        self.text_palette()
+        ops = list()
+        runs = [TextRun("a", None)]
+        if files:
+            name = files[0].name
+            ops.append(ImageOp(0.0, (0, 0), 90, (4.0, 4.0), name, None, (0, 0, 1, 1)))
+            runs.append(InlineImage(name, None, (0, 0, 1, 1), (4, 4)))
+        linestyles = ("solid", "dash", "dot", "dashdot", "halo")
+        for linestyle, justification in zip(linestyles, ("full", "center", "left", "right", "")):
+            style = BASE_STYLE._replace(linestyle=linestyle, justification=justification)
+            ops.append(RectOp(0.0, (0, 0, 4, 4), 90, style))
+            ops.append(TextOp(0.0, (0, 0, 16, -1), 90, style, tuple(runs + [TextRun("b", style)])))
+        image = QtGui.QImage(16, 16, QtGui.QImage.Format_RGBA8888)
+        image.fill(0)
+        painter = QtGui.QPainter(image)
+        try:
+            self.paint_face(painter, FacePlan(0, "top", "", "", tuple(ops)))
+        finally:
+            painter.end()
+
+    def paint_face(
+        self,
+        painter: QtGui.QPainter,
+        face: FacePlan,
+        images: Optional[Dict[ImageOp, QtGui.QImage]] = None,
+    ):
+        # images are the op_images() of the face, if they have been prepared
+        for op in face.ops:
+            self.paint_op(painter, op, images)
+
+    def paint_op(
+        self,
+        painter: QtGui.QPainter,
+        op: Op,
+        images: Optional[Dict[ImageOp, QtGui.QImage]] = None,
+    ):
+        if isinstance(op, ImageOp):
+            if op.file is not None:
+                self.paint_image(painter, op, None if images is None else images.get(op))
+            return
+        height = op.rectangle[3]
+        doc = None
+        if isinstance(op, TextOp):
+            doc = self.build_text_document(op.runs, op.style)
+            doc.setTextWidth(op.rectangle[2])
+            height = int(doc.size().height())
+        self.paint_rect(painter, op, height)
+        if doc is None:
+            return
+        x, y = op.rectangle[0], op.rectangle[1]
+        if op.style.linestyle == "halo":
+            style = op.style._replace(textcolor=op.style.bordercolor)
+            halo_doc = self.build_text_document(op.runs, style)
+            halo_doc.setTextWidth(op.rectangle[2])
+            for dx, dy in reversed(HALO_OFFSETS):
+                self.paint_text(
+                    painter,
+                    halo_doc,
+                    x + dx * HALO_DISTANCE,
+                    y + dy * HALO_DISTANCE,
+                    op.rotation,
+                    qcolor(style.textcolor),
+                )
+        self.paint_text(painter, doc, x, y, op.rotation, qcolor(op.style.textcolor))
+
+    def paint_rect(self, painter: QtGui.QPainter, op: Union[RectOp, TextOp], height: int):
+        # a QGraphicsRectItem rotated around its top left corner
+        left, top, width, height = rect_geometry(op, height)
+        transform = QtGui.QTransform.fromTranslate(left, top)
+        transform.rotate(op.rotation)
+        transform.translate(-left, -top)
+        painter.save()
+        painter.setTransform(transform, True)
+        painter.setPen(rect_pen(op.style))
+        painter.setBrush(QtGui.QBrush(qcolor(op.style.fillcolor)))
+        painter.drawRect(QtCore.QRectF(left, top, width, height))
+        painter.restore()
+
+    def paint_text(
+        self,
+        painter: QtGui.QPainter,
+        doc: QtGui.QTextDocument,
+        x: float,
+        y: float,
+        rotation: float,
+        color: QtGui.QColor,
+    ):
+        # a QGraphicsTextItem at x, y rotated around that point, clipped to the document
+        transform = QtGui.QTransform.fromTranslate(x, y)
+        transform.rotate(rotation)
+        painter.save()
+        painter.setTransform(transform, True)
+        rect = QtCore.QRectF(QtCore.QPointF(0, 0), doc.size())
+        painter.setClipRect(rect, QtCore.Qt.IntersectClip)
+        context = QtGui.QAbstractTextDocumentLayout.PaintContext()
+        palette = QtGui.QPalette(self.text_palette())
+        palette.setColor(QtGui.QPalette.Text, color)
+        context.palette = palette
+        context.clip = rect
+        doc.documentLayout().draw(painter, context)
+        painter.restore()
+
+    def paint_image(
+        self, painter: QtGui.QPainter, op: ImageOp, image: Optional[QtGui.QImage] = None
+    ):
+        # a QGraphicsPixmapItem at the position, rotated and then scaled to the size
+        # (in source pixels) from the decoded pixels.  The region is drawn out of the
+        # decoded image, unless it is reduced to max_image_scale (or image is the
+        # prepared op_image()).
+        if image is not None:
+            region = image.rect()
+        elif self.max_image_scale is None:
+            image, region = self.plan_region(op.file, op.source)
+        else:
+            image = self.op_image(op)
+            region = image.rect()
+        transform = QtGui.QTransform.fromTranslate(op.position[0], op.position[1])
+        transform.rotate(op.rotation)
+        transform.scale(float(op.size[0]) / region.width(), float(op.size[1]) / region.height())
+        painter.save()
+        painter.setTransform(transform, True)
+        # the pixmap items draw with the fast transformation
+        painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform, False)
+        painter.drawImage(QtCore.QPointF(0, 0), image, QtCore.QRectF(region))
+        painter.restore()
@@ -0,0 +1,90 @@
+#
+# T.I.M.E Stories card generator
+# Copyright (C) Randall Frank
+# See LICENSE for details
+#
+
+import contextlib
+import json
+import os
+import threading
+import time
+from typing import List, Optional, Tuple
+
+# Wall and CPU time of the build, recorded as spans: the stages of build_deck (cat
+# "stage"), the card faces (cat "face"), the steps of rendering a face (cat "step")
+# and the renderables of a face (cat "renderable").  The spans are written as Chrome
+# trace events ("X" events, timestamps in microseconds), which chrome://tracing and
+# https://ui.perfetto.dev can open.  The CPU time is stored in the event args, it is
+# the time of the whole process for the stages (which use thread pools) and the time
+# of the recording thread for the others.
+
+
+class Profiler(object):
+    def __init__(self):
+        self.origin: float = time.perf_counter()
+        self.pid: int = os.getpid()
+        self.events: List[dict] = list()
+
+    @contextlib.contextmanager
+    def span(self, name: str, cat: str, **args):
+        clock = time.process_time if cat == "stage" else time.thread_time
+        wall = time.perf_counter()
+        cpu = clock()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            args["cpu_ms"] = round((clock() - cpu) * 1000.0, 3)
+            # list.append is atomic, spans can be recorded by worker threads
+            self.events.append(
+                dict(
+                    name=name,
+                    cat=cat,
+                    ph="X",
+                    ts=round((wall - self.origin) * 1e6, 1),
+                    dur=round((end - wall) * 1e6, 1),
+                    pid=self.pid,
+                    tid=threading.get_ident(),
+                    args=args,
+                )
+            )
+
+    def spans(self, cat: str) -> List[dict]:
+        return [e for e in self.events if e["cat"] == cat]
+
+    def totals(self, cat: str) -> List[Tuple[str, float, float, int]]:
+        # (name, wall ms, cpu ms, count) of the spans of cat, by name in order of use
+        totals = dict()
+        for e in self.spans(cat):
+            wall, cpu, count = totals.get(e["name"], (0.0, 0.0, 0))
+            totals[e["name"]] = (wall + e["dur"] / 1000.0, cpu + e["args"]["cpu_ms"], count + 1)
+        return [(name, *values) for name, values in totals.items()]
+
+    def write(self, filename: str):
+        meta = dict(name="process_name", ph="M", pid=self.pid, args=dict(name="build_deck"))
+        with open(filename, "w") as fp:
+            json.dump(dict(traceEvents=[meta] + self.events, displayTimeUnit="ms"), fp)
+
+    def summary(self, top: int = 10) -> List[str]:
+        # the stage, step and renderable times and the slowest card faces
+        lines = list()
+        for cat in ("stage", "step", "renderable"):
+            for name, wall, cpu, count in self.totals(cat):
+                lines.append(f"{cat} {name}: {wall:.1f}ms wall, {cpu:.1f}ms cpu ({count}x)")
+        faces = sorted(self.spans("face"), key=lambda e: -e["dur"])[:top]
+        if faces:
+            lines.append(f"The {len(faces)} slowest card faces:")
+        for e in faces:
+            lines.append(
+                f"  {e['name']} ({e['args'].get('card', '')}): {e['dur'] / 1000.0:.1f}ms wall, "
+                f"{e['args']['cpu_ms']:.1f}ms cpu"
+            )
+        return lines
+
+
+def profile_span(profiler: Optional[Profiler], name: str, cat: str, **args):
+    # a span of profiler, nothing without one
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.span(name, cat, **args)
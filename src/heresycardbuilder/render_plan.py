@@ -0,0 +1,315 @@
+#
+# T.I.M.E Stories card generator
+# Copyright (C) Randall Frank
+# See LICENSE for details
+#
+
+import hashlib
+import logging
+from typing import Iterator, NamedTuple, Optional, Tuple, Union
+
+from card_objects import (
+    Card,
+    Deck,
+    Image,
+    ImageRender,
+    Location,
+    RectRender,
+    Renderable,
+    Style,
+    TextRender,
+    scaled_size,
+)
+
+# A render plan is a deck compiled down to what gets drawn: for each card face, the
+# draw operations in their final z order, with the styles resolved to values, the
+# macros expanded and the image assets resolved to regions of file assets.  The plan
+# is built from named tuples, so it can be pickled, compared and hashed, and it only
+# refers back to the deck for the file pixels (by file asset name and content hash).
+
+
+class StyleSpec(NamedTuple):
+    typeface: str
+    typesize: int
+    fillcolor: Tuple[int, int, int, int]
+    borderthickness: int
+    bordercolor: Tuple[int, int, int, int]
+    textcolor: Tuple[int, int, int, int]
+    linestyle: str
+    justification: str
+    boundary_offset: int
+
+    @classmethod
+    def from_style(cls, style: Style) -> "StyleSpec":
+        return cls(*(getattr(style, name) for name in cls._fields))
+
+
+class TextRun(NamedTuple):
+    text: str
+    style: Optional[StyleSpec]  # None for the style of the text operation
+
+
+class InlineImage(NamedTuple):
+    file: str  # the file asset name
+    digest: Optional[str]  # the file content hash
+    source: Tuple[int, int, int, int]  # the region of the file, in source pixels
+    size: Tuple[int, int]  # the size drawn
+
+
+class RectOp(NamedTuple):
+    z: float
+    rectangle: Tuple[int, int, int, int]
+    rotation: int
+    style: StyleSpec
+
+
+class TextOp(NamedTuple):
+    z: float
+    rectangle: Tuple[int, int, int, int]
+    rotation: int
+    style: StyleSpec
+    runs: Tuple[Union[TextRun, InlineImage], ...]
+
+
+class ImageOp(NamedTuple):
+    z: float
+    position: Tuple[int, int]
+    rotation: int
+    size: Tuple[float, float]  # the size drawn
+    file: Optional[str]  # the file asset name, None if the image asset is missing
+    digest: Optional[str]
+    source: Tuple[int, int, int, int]
+
+
+Op = Union[RectOp, TextOp, ImageOp]
+
+
+class FacePlan(NamedTuple):
+    number: int  # the output card number
+    face: str  # "top" or "bot"
+    card: str
+    location: str  # the name of the location of the card, if any
+    ops: Tuple[Op, ...]  # bottom to top
+
+
+class DeckPlan(NamedTuple):
+    card_size: Tuple[int, int]
+    faces: Tuple[FacePlan, ...]
+
+
+# the light blue card background, with the default 1 pixel black outline
+BASE_STYLE = StyleSpec(
+    "Arial", 12, (224, 224, 255, 255), 1, (0, 0, 0, 255), (0, 0, 0, 255), "solid", "full", 0
+)
+
+
+def card_base_op(card_size) -> RectOp:
+    return RectOp(-1000.0, (0, 0, card_size[0], card_size[1]), 0, BASE_STYLE)
+
+
+def replace_macros(deck: Deck, cur_card: Card, text: str) -> str:
+    # {XY:name} - ':name' is optional and defaults to 'current'
+    # X - c=card, i=item, l=location
+    # Y - N=global number, n=local number, s=string name,  A=global letter, a=local letter
+    # {n} - new line
+    for key in "ciln":
+        while True:
+            start = text.find("{" + key)
+            if start == -1:
+                break
+            end = text[start:].find("}")
+            if end == -1:
+                break
+            macro = text[start : start + end + 1]
+            replacement = "{err}"
+            if key == "n":
+                replacement = "\n"
+            else:
+                current = cur_card
+                opt = macro[2]
+                if opt in "NnsAa":
+                    # get the referenced object
+                    offset = macro.find(":")
+                    # the "current" object
+                    if offset == -1:
+                        current = cur_card
+                        if key == "l":
+                            try:
+                                current = cur_card.location
+                            except AttributeError:
+                                current = None
+                    # by name lookup
+                    else:
+                        name = macro[offset + 1 : -1]
+                        if len(name):
+                            if key == "l":
+                                current = deck.find_location(name, default=cur_card)
+                            elif key == "i":
+                                current = deck.find_item(name, default=cur_card)
+                            else:
+                                current = deck.find_card(name, default=cur_card)
+                    if current is not None:
+                        # we have a target card
+                        if opt == "N":
+                            replacement = str(current.card_number)
+                        elif opt == "n":
+                            replacement = str(current.local_card_number)
+                        elif opt == "s":
+                            replacement = current.name
+                        elif opt == "A":
+                            replacement = chr(ord("A") + current.card_number - 1)
+                        elif opt == "a":
+                            replacement = chr(ord("A") + current.local_card_number - 1)
+            text = text[:start] + replacement + text[start + end + 1 :]
+    return text
+
+
+def resolve_image(deck: Deck, image: Image) -> Tuple[str, Optional[str], Tuple[int, int, int, int]]:
+    # the file asset name, content hash and source region of an image asset
+    f = image.get_file(deck)
+    if f is None:
+        # drawn with the default image, see Image.get_image()
+        return image.file, None, (0, 0, *image.get_size(deck))
+    return f.name, f.content_hash(), image.get_source_rect(f)
+
+
+def compile_text(deck: Deck, the_card: Card, text: str) -> Tuple[Union[TextRun, InlineImage], ...]:
+    text = replace_macros(deck, the_card, text)
+    # Break the text into runs as styles change
+    # {s:style_name} - pick another style
+    # {I:image_name:dx:dy} - an inline image
+    runs = list()
+    style = None
+    while True:
+        # find the next style change or image
+        start_style = text.find("{s:")
+        start_image = text.find("{I:")
+        # if no more, done looping...
+        if (start_style == -1) and (start_image == -1):
+            break
+        # a style or an image on the left?
+        if (start_style > -1) and (start_image > -1):
+            if start_style < start_image:
+                start_image = -1
+            else:
+                start_style = -1
+        # we should only have one or the other
+        is_style = start_style > -1
+        start = start_style if is_style else start_image
+        # terminator
+        end = text[start:].find("}")
+        if end == -1:
+            break
+        # send text up to the format
+        if start > 0:
+            runs.append(TextRun(text[:start], style))
+        if is_style:
+            # update the style, unknown styles select the base style
+            found = deck.find_style(text[start + 3 : start + end], default=None)
+            style = None if found is None else StyleSpec.from_style(found)
+        else:
+            # parse image:dx:dy
+            info = text[start + 3 : start + end].split(":")
+            if len(info) == 3:
+                image_asset = deck.find_image(info[0], default=None)
+                if image_asset is not None:
+                    # sizes are in source pixels
+                    width, height = image_asset.get_size(deck)
+                    try:
+                        dx = int(info[1])
+                        dy = int(info[2])
+                    except ValueError:
+                        dx = width
+                        dy = height
+                    dx, dy = scaled_size(dx, dy, width, height)
+                    runs.append(InlineImage(*resolve_image(deck, image_asset), (int(dx), int(dy))))
+            else:
+                logging.error("Invalid image token: {}".format(text[start + 3 : start + end]))
+        # remove the {} clause
+        text = text[start + end + 1 :]
+    # send the remaining text in the last format
+    if len(text):
+        runs.append(TextRun(text, style))
+    return tuple(runs)
+
+
+def compile_renderable(deck: Deck, the_card: Card, r: Renderable, z: float) -> Op:
+    if isinstance(r, TextRender):
+        style = StyleSpec.from_style(deck.find_style(r.style))
+        return TextOp(z, r.rectangle, r.rotation, style, compile_text(deck, the_card, r.text))
+    if isinstance(r, RectRender):
+        return RectOp(z, r.rectangle, r.rotation, StyleSpec.from_style(deck.find_style(r.style)))
+    if isinstance(r, ImageRender):
+        position = (r.rectangle[0], r.rectangle[1])
+        image = deck.find_image(r.image)
+        if image is None:
+            logging.error("Unable to find the reference image {}".format(r.image))
+            return ImageOp(z, position, r.rotation, (0.0, 0.0), None, None, (0, 0, 0, 0))
+        size = scaled_size(r.rectangle[2], r.rectangle[3], *image.get_size(deck))
+        return ImageOp(z, position, r.rotation, size, *resolve_image(deck, image))
+    raise TypeError(f"Unknown renderable: {r}")
+
+
+def compile_face(
+    deck: Deck, the_card: Card, top_bottom: str, number: int = 0, location: str = ""
+) -> FacePlan:
+    # The card face on top of its background card face.  The orders match the ones
+    # Face.recompute_renderable_order() assigns, but the deck is not changed.
+    ops = [card_base_op(deck.card_size)]
+    face = the_card.top_face if top_bottom == "top" else the_card.bot_face
+    for order, r in face.render_order(background=the_card.is_background()):
+        ops.append(compile_renderable(deck, the_card, r, order))
+    the_background = the_card.background_card
+    if the_background is not None:
+        if top_bottom == "top":
+            background_face = the_background.top_face
+        else:
+            background_face = the_background.bot_face
+        for order, r in background_face.render_order(background=True):
+            ops.append(compile_renderable(deck, the_card, r, order))
+    # stable, so equal orders keep the scene insertion order
+    ops.sort(key=lambda op: op.z)
+    return FacePlan(number, top_bottom, the_card.name, location, tuple(ops))
+
+
+def output_cards(deck: Deck) -> Iterator[Tuple[Card, Optional[Location]]]:
+    # The cards in the output (card number) order:
+    # deckcards, base, items, plan, misc, characters, reference card, locations
+    for chunk in [deck.deckcards, deck.base, deck.items, deck.plan, deck.misc, deck.characters]:
+        for card in chunk:
+            yield card, None
+    yield deck.icon_reference, None
+    for location in deck.locations:
+        for card in location.cards:
+            yield card, location
+
+
+def compile_deck(deck: Deck, target_card: Optional[int] = None) -> DeckPlan:
+    # Compile all of the cards, or only the card numbered target_card
+    deck.renumber_entities()
+    faces = list()
+    for number, (card, location) in enumerate(output_cards(deck)):
+        if (target_card is not None) and (target_card != number):
+            continue
+        name = "" if location is None else location.name
+        for top_bottom in ("top", "bot"):
+            faces.append(compile_face(deck, card, top_bottom, number, name))
+    return DeckPlan(tuple(deck.card_size), tuple(faces))
+
+
+def face_digest(face: FacePlan) -> str:
+    # The hash of what is drawn on a card face.  Faces with the same digest render to
+    # the same pixels, whatever their card, number or side.
+    return hashlib.sha256(repr(face.ops).encode()).hexdigest()
+
+
+def plan_to_json(value):
+    # JSON friendly form of a plan (or any part of one), tagged with the tuple types
+    if hasattr(value, "_asdict"):
+        data = dict(type=type(value).__name__)
+        for key, item in value._asdict().items():
+            data[key] = plan_to_json(item)
+        return data
+    if isinstance(value, (tuple, list)):
+        return [plan_to_json(item) for item in value]
+    return value
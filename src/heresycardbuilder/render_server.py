@@ -0,0 +1,196 @@
+#
+# T.I.M.E Stories card generator
+# Copyright (C) Randall Frank
+# See LICENSE for details
+#
+
+import collections
+import http.server
+import logging
+import os
+from typing import Optional, Tuple
+import urllib.parse
+
+from PySide6 import QtCore, QtGui
+from card_objects import Deck
+from card_render import Renderer
+from deck_watcher import LoadedDeck
+from render_plan import compile_deck
+
+# A local HTTP service rendering single card faces from decks kept loaded between
+# requests.  A request is
+#
+#   GET /render?deck=<path>&card=<number>&face=top|bot&format=png|jpg&scale=<scale>
+#
+# and the response is the encoded card image.  The deck defaults to the deck the
+# server was started with, face to top, format to png and scale to 1 (825x1425 plus
+# any padding).  Only the decks in the directory (or below) of the deck the server
+# was started with are served, a relative path is taken from that directory.  The
+# decks are checked for changed files on every request and the least recently used
+# deck is dropped when more than max_decks are loaded.  Requests are handled one at a
+# time, on the thread that runs the server (the Qt thread).
+
+IMAGE_FORMATS = {"png": "image/png", "jpg": "image/jpeg", "jpeg": "image/jpeg"}
+
+
+class RequestError(ValueError):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class DeckCache(object):
+    def __init__(
+        self,
+        max_decks: int = 4,
+        reduce_resolution: bool = True,
+        pad_size: int = 0,
+        backend: str = "painter",
+    ):
+        self.max_decks: int = max_decks
+        self.reduce_resolution: bool = reduce_resolution
+        self.pad_size: int = pad_size
+        self.backend: str = backend
+        self.decks: "collections.OrderedDict[str, LoadedDeck]" = collections.OrderedDict()
+
+    def add(self, filename: str, deck: Deck) -> LoadedDeck:
+        # a deck that is already loaded
+        render = Renderer(deck)
+        render.pad_size = self.pad_size
+        render.backend = self.backend
+        loaded = LoadedDeck(filename, render, self.reduce_resolution)
+        self.decks[loaded.filename] = loaded
+        self.decks.move_to_end(loaded.filename)
+        while len(self.decks) > self.max_decks:
+            name, dropped = self.decks.popitem(last=False)
+            logging.info("Dropping {}".format(name))
+            dropped.render.close()
+        return loaded
+
+    def get(self, filename: str) -> LoadedDeck:
+        # the loaded deck, up to date with its files
+        filename = os.path.realpath(filename)
+        loaded = self.decks.get(filename)
+        if loaded is None:
+            if not os.path.isfile(filename):
+                raise RequestError("No such deck: {}".format(filename), 404)
+            logging.info("Reading {}...".format(filename))
+            deck = Deck()
+            if not deck.load(filename, reduce_resolution=self.reduce_resolution):
+                raise RequestError("Unable to read the deck: {}".format(filename), 422)
+            return self.add(filename, deck)
+        self.decks.move_to_end(filename)
+        changed = loaded.changed_files()
+        if changed:
+            loaded.reload(changed)
+        return loaded
+
+    def close(self):
+        for loaded in self.decks.values():
+            loaded.render.close()
+        self.decks.clear()
+
+
+def render_card(loaded: LoadedDeck, number: int, face: str, scale: float) -> QtGui.QImage:
+    plan = compile_deck(loaded.deck, number)
+    faces = [f for f in plan.faces if f.face == face]
+    if not faces:
+        raise RequestError("No such card: {}".format(number), 404)
+    img = loaded.render.render_face_image(faces[0])
+    if scale != 1.0:
+        w = max(round(img.width() * scale), 1)
+        h = max(round(img.height() * scale), 1)
+        img = img.scaled(w, h, QtCore.Qt.IgnoreAspectRatio, QtCore.Qt.SmoothTransformation)
+    return img
+
+
+def encode_image(img: QtGui.QImage, fmt: str) -> bytes:
+    buffer = QtCore.QBuffer()
+    buffer.open(QtCore.QIODevice.WriteOnly)
+    if fmt != "png":
+        # no alpha channel in jpeg
+        img = img.convertToFormat(QtGui.QImage.Format_RGB32)
+    if not img.save(buffer, fmt):
+        raise RequestError("Unable to encode the image as {}".format(fmt), 500)
+    return bytes(buffer.data())
+
+
+def deck_path(deck: str, deck_dir: str) -> str:
+    # the deck of a request, which must be in deck_dir
+    path = os.path.realpath(os.path.join(deck_dir, deck))
+    if os.path.commonpath([path, deck_dir]) != deck_dir:
+        raise RequestError("The deck is not in {}: {}".format(deck_dir, deck), 403)
+    return path
+
+
+def parse_request(query: str, default_deck: Optional[str]) -> Tuple[str, int, str, str, float]:
+    params = urllib.parse.parse_qs(query)
+
+    def param(name: str, default: Optional[str] = None) -> Optional[str]:
+        values = params.get(name)
+        return values[-1] if values else default
+
+    deck = param("deck", default_deck)
+    if deck is None:
+        raise RequestError("No deck given")
+    try:
+        number = int(param("card", ""))
+        scale = float(param("scale", "1"))
+    except ValueError:
+        raise RequestError("Invalid card number or scale")
+    face = param("face", "top")
+    if face not in ("top", "bot"):
+        raise RequestError("Invalid face: {}".format(face))
+    fmt = param("format", "png").lower()
+    if fmt not in IMAGE_FORMATS:
+        raise RequestError("Invalid format: {}".format(fmt))
+    if not (0.0 < scale <= 4.0):
+        raise RequestError("Invalid scale: {}".format(scale))
+    return deck, number, face, fmt, scale
+
+
+class RenderRequestHandler(http.server.BaseHTTPRequestHandler):
+    server_version = "build_deck"
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        try:
+            if url.path != "/render":
+                raise RequestError("Unknown request: {}".format(url.path), 404)
+            deck, number, face, fmt, scale = parse_request(url.query, self.server.default_deck)
+            loaded = self.server.decks.get(deck_path(deck, self.server.deck_dir))
+            data = encode_image(render_card(loaded, number, face, scale), fmt)
+        except RequestError as e:
+            self.send_error(e.status, str(e))
+            return
+        except Exception as e:
+            # a deck or render failure, the server keeps running
+            logging.exception("Unable to render {}".format(self.path))
+            self.send_error(500, str(e) or e.__class__.__name__)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", IMAGE_FORMATS[fmt])
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        logging.info("%s " + format, self.address_string(), *args)
+
+
+class RenderServer(http.server.HTTPServer):
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        decks: DeckCache,
+        default_deck: Optional[str] = None,
+        deck_dir: Optional[str] = None,
+    ):
+        super().__init__(address, RenderRequestHandler)
+        self.decks: DeckCache = decks
+        self.default_deck: Optional[str] = default_deck
+        # the directory of the decks that can be requested, that of the default deck
+        # (or the current directory) if not given
+        if deck_dir is None:
+            deck_dir = os.path.dirname(os.path.abspath(default_deck)) if default_deck else "."
+        self.deck_dir: str = os.path.realpath(deck_dir)
@@ -0,0 +1,131 @@
+#
+# T.I.M.E Stories card generator
+# Copyright (C) Randall Frank
+# See LICENSE for details
+#
+
+import os
+import random
+from typing import Optional
+
+from PySide6 import QtGui
+from card_objects import Card, Deck, File, Image, ImageRender, RectRender, Style, TextRender
+
+# Builds decks with a known shape for benchmarks and tests.  The content is
+# random, but seeded so that repeated runs produce identical decks.
+#
+# The text renderables hold up to text_density phrases, macro_density of the
+# phrases end in a macro and every text has icon_density inline images.  The
+# first halo_styles styles draw their text with a halo.  The file assets are
+# stored inline, or written to external_dir as png files.
+
+MACROS = ("{cN:}", "{cs:}", "{ca:}", "{n}")
+
+
+def make_text(deck: Deck, density: int, macro_density: float, icons: int, rng: random.Random):
+    phrases = list()
+    for j in range(rng.randrange(1, density + 1)):
+        # spread the macros evenly over the phrases
+        macro = int((j + 1) * macro_density) > int(j * macro_density)
+        phrases.append("Synthetic text " + (MACROS[j % len(MACROS)] + " " if macro else ""))
+    for _ in range(icons):
+        image = rng.choice(deck.images).name
+        phrases.insert(rng.randrange(len(phrases) + 1), f"{{I:{image}:32:32}} ")
+    return "".join(phrases)
+
+
+def make_file(name: str, size: int, rng: random.Random) -> File:
+    f = File(name)
+    img = QtGui.QImage(size, size, QtGui.QImage.Format_RGBA8888)
+    img.fill(QtGui.QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    f.image = img
+    f.filename = name + ".png"
+    f.store_inline = True
+    return f
+
+
+def write_file(f: File, dirname: str):
+    # make f an external file asset
+    f.filename = os.path.join(dirname, f.name + ".png")
+    f.image.save(f.filename, "png")
+    f.store_inline = False
+
+
+def make_style(name: str, rng: random.Random) -> Style:
+    s = Style(name)
+    s.typesize = rng.choice([8, 10, 12, 14, 18])
+    s.fillcolor = [rng.randrange(256) for _ in range(3)] + [rng.choice([0, 128, 255])]
+    s.textcolor = [rng.randrange(256) for _ in range(3)] + [255]
+    s.justification = rng.choice(["full", "left", "right", "center"])
+    s.boundary_offset = rng.randrange(4)
+    return s
+
+
+def fill_face(
+    face,
+    deck: Deck,
+    count: int,
+    rng: random.Random,
+    text_density: int = 5,
+    macro_density: float = 1.0,
+    icon_density: int = 0,
+):
+    for i in range(count):
+        kind = i % 3
+        x, y = rng.randrange(deck.card_size[0] - 200), rng.randrange(deck.card_size[1] - 200)
+        if kind == 0:
+            r = TextRender()
+            r.style = rng.choice(deck.styles).name
+            r.text = make_text(deck, text_density, macro_density, icon_density, rng)
+            r.rectangle = [x, y, 200, -1]
+        elif kind == 1:
+            r = RectRender()
+            r.style = rng.choice(deck.styles).name
+            r.rectangle = [x, y, rng.randrange(20, 200), rng.randrange(20, 200)]
+        else:
+            r = ImageRender()
+            r.image = rng.choice(deck.images).name
+            r.rectangle = [x, y, rng.randrange(20, 200), -2]
+        r.rotation = rng.choice([0, 0, 0, 90])
+        r.order = float(i)
+        face.renderables.append(r)
+
+
+def build_synthetic_deck(
+    num_cards: int = 100,
+    renderables_per_face: int = 6,
+    num_styles: int = 8,
+    num_images: int = 16,
+    num_files: int = 4,
+    file_size: int = 64,
+    seed: int = 0,
+    text_density: int = 5,
+    macro_density: float = 1.0,
+    icon_density: int = 0,
+    halo_styles: int = 0,
+    external_dir: Optional[str] = None,
+) -> Deck:
+    rng = random.Random(seed)
+    deck = Deck("synthetic")
+    for i in range(num_files):
+        deck.files.append(make_file(f"file_{i}", file_size, rng))
+        if external_dir is not None:
+            write_file(deck.files[-1], external_dir)
+    deck.styles.append(Style("default"))
+    for i in range(num_styles):
+        deck.styles.append(make_style(f"style_{i}", rng))
+        if i < halo_styles:
+            deck.styles[-1].linestyle = "halo"
+    for i in range(num_images):
+        img = Image(f"image_{i}")
+        img.file = deck.files[i % num_files].name
+        img.rectangle = [0, 0, rng.randrange(1, file_size), -1]
+        deck.images.append(img)
+    for i in range(num_cards):
+        card = Card(f"card_{i}")
+        for face in (card.top_face, card.bot_face):
+            fill_face(
+                face, deck, renderables_per_face, rng, text_density, macro_density, icon_density
+            )
+        deck.base.append(card)
+    return deck
@@ -0,0 +1,176 @@
+#
+# T.I.M.E Stories card generator
+# Copyright (C) Randall Frank
+# See LICENSE for details
+#
+
+import math
+from typing import List, NamedTuple, Optional, Tuple
+
+# Layout of cards on Tabletop Simulator deck sheets (textures).  A custom deck
+# sheet is a grid of at most 10x7 cards and Tabletop Simulator finds the cards by
+# dividing the texture evenly by the grid, so the cards fill the cells of the grid.
+
+MAX_COLUMNS = 10
+MAX_ROWS = 7
+# the fewest cells of a sheet grid, Tabletop Simulator handles 1x1 custom decks badly
+MIN_CELLS = 2
+# each sheet is another texture to load, a packing with an extra sheet has to save
+# more than the texels of this many cards (at scale)
+SHEET_CARDS = 4
+
+
+class SheetLayout(NamedTuple):
+    columns: int
+    rows: int
+    cell: Tuple[float, float]  # the size of a card on the sheet
+    size: Tuple[int, int]  # the texture size
+
+    @property
+    def capacity(self) -> int:
+        return self.columns * self.rows
+
+    @property
+    def texels(self) -> int:
+        return self.size[0] * self.size[1]
+
+    def scale(self, card_size: Tuple[float, float]) -> float:
+        # the resolution of the cards, relative to card_size
+        return min(self.cell[0] / card_size[0], self.cell[1] / card_size[1])
+
+    def slot(self, index: int) -> Tuple[int, int, int, int]:
+        # The pixels (x, y, w, h) of card index.  The texture is divided evenly by the
+        # grid, as Tabletop Simulator does, with the cell edges rounded to pixels, so
+        # the cells cover the texture without gaps.
+        column = index % self.columns
+        row = index // self.columns
+        x = round(column * self.size[0] / self.columns)
+        y = round(row * self.size[1] / self.rows)
+        w = round((column + 1) * self.size[0] / self.columns) - x
+        h = round((row + 1) * self.size[1] / self.rows) - y
+        return x, y, w, h
+
+    @property
+    def area(self) -> float:
+        # the texels of the grid, without the rounding of the texture size
+        return self.capacity * self.cell[0] * self.cell[1]
+
+    def wasted_texels(self, count: int) -> int:
+        # the texels not covered by count cards
+        return self.texels - sum(w * h for _, _, w, h in map(self.slot, range(count)))
+
+
+def pow2_floor(value: float) -> int:
+    return 1 << max(int(math.floor(math.log2(max(value, 1)))), 0)
+
+
+def pow2_ceil(value: float) -> int:
+    return 1 << max(int(math.ceil(math.log2(max(value, 1)))), 0)
+
+
+def grid_layouts(
+    card_size: Tuple[float, float],
+    columns: int,
+    rows: int,
+    max_texture: int,
+    scale: float,
+    min_scale: float,
+    power_of_two: bool,
+) -> List[SheetLayout]:
+    # The layouts of a columns x rows grid with cards of at least min_scale.  Cards are
+    # only reduced below scale to fit in max_texture.  Power of two textures are
+    # rounded up or down from the size at scale, the cards are stretched to fill them.
+    w = columns * card_size[0]
+    h = rows * card_size[1]
+    if not power_of_two:
+        s = min(scale, max_texture / w, max_texture / h)
+        if s < min_scale:
+            return list()
+        cell = (card_size[0] * s, card_size[1] * s)
+        return [SheetLayout(columns, rows, cell, (int(w * s), int(h * s)))]
+    largest = pow2_floor(max_texture)
+    layouts = list()
+    widths = {min(pow2_floor(w * scale), largest), min(pow2_ceil(w * scale), largest)}
+    heights = {min(pow2_floor(h * scale), largest), min(pow2_ceil(h * scale), largest)}
+    for tw in sorted(widths):
+        for th in sorted(heights):
+            layout = SheetLayout(columns, rows, (tw / columns, th / rows), (tw, th))
+            if layout.scale(card_size) >= min_scale:
+                layouts.append(layout)
+    return layouts
+
+
+def all_layouts(
+    card_size: Tuple[float, float],
+    max_texture: int,
+    scale: float,
+    min_scale: float,
+    power_of_two: bool,
+    min_cells: int = MIN_CELLS,
+) -> List[SheetLayout]:
+    layouts = list()
+    for columns in range(1, MAX_COLUMNS + 1):
+        for rows in range(1, MAX_ROWS + 1):
+            if columns * rows < min_cells:
+                continue
+            layouts.extend(
+                grid_layouts(card_size, columns, rows, max_texture, scale, min_scale, power_of_two)
+            )
+    if not layouts:
+        # the smallest grids do not fit, reduce the cards to fit
+        largest = pow2_floor(max_texture) if power_of_two else max_texture
+        for columns, rows in ((1, 1),) if min_cells < 2 else ((2, 1), (1, 2)):
+            s = min(largest / (columns * card_size[0]), largest / (rows * card_size[1]))
+            layouts.extend(
+                grid_layouts(card_size, columns, rows, max_texture, s, 0.0, power_of_two)
+            )
+    return layouts
+
+
+def layout_cost(layout: SheetLayout, card_size, scale: float) -> Tuple[int, float, int]:
+    # prefer fewer texels, then sharper cards (up to scale), then squarer textures
+    return round(layout.area), -min(layout.scale(card_size), scale), max(layout.size)
+
+
+def pack_cards(
+    num: int,
+    card_size: Tuple[float, float],
+    max_texture: int = 5000,
+    scale: float = 0.5,
+    min_scale: Optional[float] = None,
+    power_of_two: bool = False,
+    min_cells: int = MIN_CELLS,
+) -> List[SheetLayout]:
+    """The layouts of the sheets for num cards.
+
+    The packing with the fewest texels is used, counting each sheet as the texels of
+    SHEET_CARDS cards, then the one with the fewest sheets and the sharpest cards.
+    The cards are at most scale times card_size and can be reduced down to min_scale
+    (by default scale) to save texels.  All but the last sheet have the same layout,
+    the last one can be smaller.  The grids have at least min_cells cells.
+    """
+    if num < 1:
+        return list()
+    if min_scale is None:
+        min_scale = scale
+    layouts = all_layouts(card_size, max_texture, scale, min_scale, power_of_two, min_cells)
+    sheet_cost = SHEET_CARDS * card_size[0] * card_size[1] * scale * scale
+    best = None
+    best_cost = None
+    for layout in layouts:
+        sheets = math.ceil(num / layout.capacity)
+        remainder = num - (sheets - 1) * layout.capacity
+        last = min(
+            (tmp for tmp in layouts if tmp.capacity >= remainder),
+            key=lambda tmp: layout_cost(tmp, card_size, scale),
+        )
+        cost = (
+            round((sheets - 1) * layout.area + last.area + sheets * sheet_cost),
+            sheets,
+            -min(layout.scale(card_size), last.scale(card_size), scale),
+            max(max(layout.size), max(last.size)),
+        )
+        if (best_cost is None) or (cost < best_cost):
+            best = [layout] * (sheets - 1) + [last]
+            best_cost = cost
+    return best
@@ -0,0 +1,51 @@
+import pytest
+
+
+def test_vector_pdf(qapp, tmp_path) -> None:
+    QtPdf = pytest.importorskip("PySide6.QtPdf")
+    from build_pdf import PRINT_IMAGES, SCREEN_IMAGES, PdfSettings, generate_pdf
+    from card_render import Renderer
+    from render_plan import ImageOp, compile_deck
+    from synthetic_deck import build_synthetic_deck
+
+    deck = build_synthetic_deck(num_cards=5)
+    renderer = Renderer(deck, str(tmp_path))
+    reduced = list()
+    op_image = renderer.op_image
+    renderer.op_image = lambda op: reduced.append(op) or op_image(op)
+    settings = PdfSettings()
+    settings.page_sizes = ["Letter"]
+    settings.vector = True
+    settings.images = [
+        PRINT_IMAGES._replace(lossless=True),
+        PRINT_IMAGES._replace(suffix="_print"),
+        SCREEN_IMAGES,
+    ]
+    generate_pdf(renderer, settings)
+    renderer.close()
+    assert renderer.max_image_scale is None
+    # the art of each face is reduced once per image resolution, not per pdf file
+    faces = compile_deck(deck).faces
+    ops = [op for face in faces for op in face.ops if isinstance(op, ImageOp) and op.file]
+    assert ops and len(reduced) == 2 * len(ops)
+
+    # five cards and the reference card on two sheets, front and back
+    doc = QtPdf.QPdfDocument()
+    doc.load(str(tmp_path / "deck_Letter.pdf"))
+    assert doc.pageCount() == 4
+    # the text is text, not pixels
+    assert "Synthetic" in doc.getAllText(0).text()
+    screen = QtPdf.QPdfDocument()
+    screen.load(str(tmp_path / "deck_Letter_screen.pdf"))
+    assert screen.pageCount() == 4
+
+
+def test_downsample_card(qapp) -> None:
+    from PySide6 import QtGui
+    from build_pdf import downsample_card
+
+    face = QtGui.QImage(825, 1425, QtGui.QImage.Format_RGB32)
+    assert downsample_card(face, 945, None) is face
+    assert downsample_card(face, 945, 300) is face
+    small = downsample_card(face, 945, 100)
+    assert (small.width(), small.height()) == (315, 544)
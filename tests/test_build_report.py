@@ -0,0 +1,64 @@
+import pytest
+
+
+def test_parse_memory() -> None:
+    from build_report import budget_workers, current_rss, parse_memory
+
+    assert parse_memory("512") == 512
+    assert parse_memory("1.5G") == 3 << 29
+    assert parse_memory("64mb") == 64 << 20
+    with pytest.raises(ValueError):
+        parse_memory("lots")
+    assert budget_workers("test", 4, None, 1 << 20) == 4
+    # no room for more than one worker
+    assert budget_workers("test", 4, current_rss(), 1 << 20) == 1
+    assert budget_workers("test", 4, current_rss() + (2 << 30), 1 << 20) == 4
+
+
+def test_build_report(qapp, tmp_path) -> None:
+    from build_pdf import PdfSettings, generate_pdf
+    from build_report import build_report, reset_cache_stats
+    from build_tts import generate_tts
+    from card_render import Renderer
+    from profiling import Profiler, profile_span
+    from synthetic_deck import build_synthetic_deck
+
+    reset_cache_stats()
+    # three cards with an empty back
+    deck = build_synthetic_deck(num_cards=4)
+    for card in deck.base[:3]:
+        card.bot_face.renderables = list()
+    render = Renderer(deck, str(tmp_path))
+    profiler = Profiler()
+    settings = PdfSettings()
+    settings.page_sizes = ["A4"]
+    settings.max_memory = 4 << 30
+    try:
+        with profile_span(profiler, "render_deck", "stage"):
+            render.render_deck()
+        first = dict(render.face_counts)
+        generate_pdf(render, settings)
+        generate_tts(render)
+        # nothing changed
+        render.render_deck(incremental=True)
+        generate_tts(render)
+        report = build_report(deck, render, profiler)
+    finally:
+        render.close()
+
+    # the synthetic deck adds the reference card
+    assert report["cards"] == 5
+    assert report["faces"] == dict(total=10, rendered=0, linked=0, unchanged=10)
+    assert report["outputs"]["cards"]["files"] == 10
+    assert report["outputs"]["pdf"]["files"] == 1
+    assert report["outputs"]["tts"]["bytes"] > 0
+    assert list(report["stages"]) == ["render_deck"]
+    caches = report["caches"]
+    # the identical backs are linked, then all of the faces are unchanged
+    assert first["linked"] >= 2
+    assert caches["card faces"]["hits"] == first["linked"] + 10
+    assert caches["card faces"]["misses"] == first["rendered"]
+    assert caches["pdf card reads"]["hits"] == first["linked"]
+    assert caches["tts sheets"]["hits"] == caches["tts sheets"]["misses"]
+    assert report["memory"]["peak_rss"] > 0
+    assert report["largest_assets"][0]["bytes"] >= report["largest_assets"][-1]["bytes"]
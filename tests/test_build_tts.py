@@ -0,0 +1,120 @@
+import json
+import os
+import types
+
+
+def test_half_size() -> None:
+    from build_tts import half_size
+    import numpy
+
+    pixels = numpy.random.default_rng(1).integers(0, 256, (7, 9, 4), dtype=numpy.uint8)
+    expected = pixels[:6, :8].astype(float).reshape(3, 2, 4, 2, 4).mean(axis=(1, 3))
+    result = half_size(pixels)
+    assert result.shape == (3, 4, 4)
+    assert numpy.abs(result - expected).max() <= 0.5
+
+
+def test_generate_tts(qapp, tmp_path) -> None:
+    from PySide6 import QtGui
+    from build_tts import TtsSettings, generate_tts
+
+    # cards with one color per card and face, at twice the sheet resolution
+    def save_card(num, pp, blue=50):
+        face = QtGui.QImage(825, 1425, QtGui.QImage.Format_ARGB32)
+        face.fill(QtGui.QColor(num * 20, 100 if pp == "top" else 200, blue))
+        face.save(str(tmp_path / "card_{}_{:03}.png".format(pp, num)))
+
+    for num in range(12):
+        for pp in ("top", "bot"):
+            save_card(num, pp)
+    render = types.SimpleNamespace(outdir=str(tmp_path), card_size=[825, 1425])
+    settings = TtsSettings()
+    settings.max_workers = 2
+    generate_tts(render, settings)
+
+    # 4 x 3 cards of 412.5 x 712.5
+    for pp in ("top", "bot"):
+        sheet = QtGui.QImage(str(tmp_path / "deck_{}_0.png".format(pp)))
+        assert (sheet.width(), sheet.height()) == (1650, 2137)
+        assert QtGui.QColor(sheet.pixel(412 + 200, 712 + 300)).red() == 5 * 20
+        assert QtGui.QColor(sheet.pixel(1237 + 200, 1425 + 300)).red() == 11 * 20
+    assert (tmp_path / "deck_top_0.png").exists() and not (tmp_path / "deck_top_1.png").exists()
+    sheet = QtGui.QImage(str(tmp_path / "deck_bot_0.png"))
+    assert QtGui.QColor(sheet.pixel(100, 100)).green() == 200
+
+    # the saved object refers to the sheets
+    with open(tmp_path / "deck_tts.json") as fp:
+        saved = json.load(fp)
+    deck = saved["ObjectStates"][0]
+    assert len(deck["ContainedObjects"]) == 12 and deck["DeckIDs"][11] == 111
+    assert deck["CustomDeck"]["1"]["FaceURL"].endswith("deck_top_0.png")
+    assert deck["CustomDeck"]["1"]["NumWidth"] == 4
+
+    # only the sheets with changed cards are rebuilt
+    mtimes = {pp: os.stat(tmp_path / f"deck_{pp}_0.png").st_mtime_ns for pp in ("top", "bot")}
+    hashes = saved["SheetHashes"]
+    save_card(3, "bot", blue=60)
+    generate_tts(render, settings)
+    with open(tmp_path / "deck_tts.json") as fp:
+        saved = json.load(fp)
+    assert saved["SheetHashes"]["deck_top_0.png"] == hashes["deck_top_0.png"]
+    assert saved["SheetHashes"]["deck_bot_0.png"] != hashes["deck_bot_0.png"]
+    assert os.stat(tmp_path / "deck_top_0.png").st_mtime_ns == mtimes["top"]
+    assert os.stat(tmp_path / "deck_bot_0.png").st_mtime_ns != mtimes["bot"]
+    sheet = QtGui.QImage(str(tmp_path / "deck_bot_0.png"))
+    assert QtGui.QColor(sheet.pixel(1237 + 100, 100)).blue() == 60
+
+
+def test_shared_backs(qapp, tmp_path) -> None:
+    from PySide6 import QtGui
+    from build_tts import TtsSettings, generate_tts
+
+    # cards 0, 2 and 4 have the same back
+    for num in range(5):
+        for pp in ("top", "bot"):
+            face = QtGui.QImage(825, 1425, QtGui.QImage.Format_ARGB32)
+            face.fill(QtGui.QColor(num * 20 if (pp == "top") or (num % 2) else 0, 0, 0))
+            face.save(str(tmp_path / "card_{}_{:03}.png".format(pp, num)))
+    render = types.SimpleNamespace(outdir=str(tmp_path), card_size=[825, 1425])
+    settings = TtsSettings()
+    settings.shared_backs = True
+    settings.power_of_two = True
+    generate_tts(render, settings)
+
+    with open(tmp_path / "deck_tts.json") as fp:
+        deck = json.load(fp)["ObjectStates"][0]
+    unique, shared = deck["CustomDeck"]["1"], deck["CustomDeck"]["2"]
+    assert unique["UniqueBack"] and not shared["UniqueBack"]
+    assert unique["NumWidth"] * unique["NumHeight"] >= 2
+    assert shared["BackURL"].endswith("deck_bot_1.png")
+    back = QtGui.QImage(str(tmp_path / "deck_bot_1.png"))
+    assert (back.width(), back.height()) == (512, 1024)
+    # the deck is in card order
+    assert [card["Nickname"] for card in deck["ContainedObjects"]] == [
+        "Card {}".format(num) for num in range(5)
+    ]
+    assert [card_id // 100 > 1 for card_id in deck["DeckIDs"]] == [True, False] * 2 + [True]
+    for key, custom in deck["CustomDeck"].items():
+        if key != "1":
+            assert custom["BackURL"] == shared["BackURL"]
+
+
+def test_full_sheet_covered(qapp, tmp_path) -> None:
+    from PySide6 import QtGui
+    from build_tts import generate_tts, image_array
+    import numpy
+
+    # 70 cards of half of 165x285 pixels on one sheet, the cells are 82.5x142.5
+    for num in range(70):
+        for pp in ("top", "bot"):
+            face = QtGui.QImage(165, 285, QtGui.QImage.Format_ARGB32)
+            face.fill(QtGui.QColor(num, 100, 50))
+            face.save(str(tmp_path / "card_{}_{:03}.png".format(pp, num)))
+    render = types.SimpleNamespace(outdir=str(tmp_path), card_size=[165, 285])
+    generate_tts(render)
+    sheet = QtGui.QImage(str(tmp_path / "deck_top_0.png")).convertToFormat(
+        QtGui.QImage.Format_ARGB32
+    )
+    assert (sheet.width(), sheet.height()) == (825, 997)
+    # every pixel is a card pixel, the last column and row too
+    assert numpy.all(image_array(sheet)[:, :, 3] == 255)
@@ -0,0 +1,232 @@
+import os
+
+import pytest
+
+
+def test_round_trip(qapp, tmp_path) -> None:
+    from card_objects import Card, Deck, Location
+    from synthetic_deck import build_synthetic_deck
+
+    deck = build_synthetic_deck(num_cards=5)
+    deck.card_size = [945, 1535]
+    location = Location("location")
+    location.cards.append(Card("location card"))
+    deck.locations.append(location)
+    filename = str(tmp_path / "round_trip.deck")
+    assert deck.save(filename)
+    loaded = Deck()
+    assert loaded.load(filename)
+    assert loaded.card_size == [945, 1535]
+    assert [s.fillcolor for s in loaded.styles] == [s.fillcolor for s in deck.styles]
+    assert [i.rectangle for i in loaded.images] == [i.rectangle for i in deck.images]
+    assert [c.name for c in loaded.locations[0].cards] == ["location card"]
+    for card, loaded_card in zip(deck.base, loaded.base):
+        src = sorted(r.rectangle for r in card.top_face.renderables)
+        dst = sorted(r.rectangle for r in loaded_card.top_face.renderables)
+        assert src == dst
+
+
+def test_int_list_field() -> None:
+    from card_objects import DeckFormatError, IntListField
+
+    field = IntListField("rectangle", 4)
+    assert field.parse(" [1, 2,-3, 4] ") == [1, 2, -3, 4]
+    assert field.parse("(1, 2, 3, 4,)") == [1, 2, 3, 4]
+    assert field.format([1, 2, -3, 4]) == "[1, 2, -3, 4]"
+    with pytest.raises(DeckFormatError):
+        field.parse("[1, 2, 3]")
+    with pytest.raises(DeckFormatError):
+        field.parse("__import__('os').getcwd()")
+
+
+def test_format_error_line(qapp, tmp_path, capsys) -> None:
+    import warnings
+
+    from card_objects import Deck
+
+    xml = """<deck>
+<decksize>[825, 1425]</decksize>
+<assets>
+<style name="bad">
+<fillcolor>[255, 255, 255]</fillcolor>
+</style>
+</assets>
+</deck>
+"""
+    filename = tmp_path / "bad.deck"
+    filename.write_text(xml)
+    deck = Deck()
+    assert not deck.load(str(filename))
+    assert "line 5" in capsys.readouterr().out
+
+    # xml errors too, without the deprecated QDomDocument api
+    filename.write_text(xml.replace("</style>", ""))
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        assert not deck.load(str(filename))
+    assert "Parsing error on line 7" in capsys.readouterr().out
+
+
+def test_slots_and_copies(qapp) -> None:
+    import copy
+
+    from synthetic_deck import build_synthetic_deck
+
+    deck = build_synthetic_deck(num_cards=1)
+    card = deck.base[0]
+    renderable = card.top_face.renderables[0]
+    assert not hasattr(renderable, "__dict__")
+    renderable.rectangle = [1, 2, 3, 4]
+    assert renderable.rectangle == (1, 2, 3, 4)
+    dup = copy.deepcopy(card)
+    assert dup.top_face is not card.top_face
+    assert dup.top_face.renderables[0].rectangle == (1, 2, 3, 4)
+    dup.top_face.renderables[0].rectangle = [5, 6, 7, 8]
+    assert renderable.rectangle == (1, 2, 3, 4)
+    style = copy.copy(deck.styles[1])
+    style.textcolor = (1, 2, 3, 4)
+    assert deck.styles[1].textcolor != (1, 2, 3, 4)
+    assert style.fillcolor == deck.styles[1].fillcolor
+
+
+def test_deferred_decode(qapp, tmp_path) -> None:
+    from PySide6 import QtGui
+    from card_objects import Deck, build_empty_deck
+
+    media = tmp_path / "media"
+    media.mkdir()
+    for i in range(5):
+        img = QtGui.QImage(40 + i, 30, QtGui.QImage.Format_RGB32)
+        img.fill(QtGui.QColor(i * 40, 0, 0))
+        img.save(str(media / f"art_{i}.png"))
+    deck = build_empty_deck(media_dirs=[str(media)])
+    assert [f.name for f in deck.files] == [f"art_{i}" for i in range(5)]
+    # only the headers have been read
+    assert not any(f.is_decoded() for f in deck.files)
+    assert deck.files[3].size() == [43, 30]
+    filename = str(tmp_path / "media.deck")
+    assert deck.save(filename)
+    loaded = Deck()
+    assert loaded.load(filename)
+    assert all(f.is_decoded() for f in loaded.files)
+    assert [f.image.width() for f in loaded.files] == [40, 41, 42, 43, 44]
+
+
+def test_reduced_resolution(qapp, tmp_path) -> None:
+    from PySide6 import QtGui
+    from card_objects import Card, Deck, File, Image, ImageRender
+
+    src = QtGui.QImage(400, 400, QtGui.QImage.Format_RGB32)
+    src.fill(QtGui.QColor(0, 0, 255))
+    src.setPixelColor(150, 150, QtGui.QColor(255, 0, 0))
+    src.save(str(tmp_path / "art.png"))
+    deck = Deck()
+    deck.deck_dirname = str(tmp_path)
+    f = File("art")
+    f.load_file(deck, "art.png", decode=False)
+    deck.files.append(f)
+    img = Image("crop")
+    img.file = "art"
+    img.rectangle = (100, 100, 200, 200)
+    deck.images.append(img)
+    card = Card("card")
+    r = ImageRender()
+    r.image = "crop"
+    r.rectangle = (0, 0, 50, -2)
+    card.top_face.renderables.append(r)
+    deck.base.append(card)
+    filename = str(tmp_path / "art.deck")
+    assert deck.save(filename)
+
+    loaded = Deck()
+    assert loaded.load(filename, reduce_resolution=True)
+    f = loaded.files[0]
+    assert f.is_reduced()
+    assert f.size() == [400, 400]
+    assert f.image.width() == 50
+    crop = loaded.images[0]
+    assert crop.get_size(loaded) == (200, 200)
+    assert crop.get_image(loaded).width() == 50
+    # the editor crop UI gets the full source back
+    assert f.get_image(full_resolution=True).width() == 400
+    assert not f.is_reduced()
+    assert crop.get_image(loaded).width() == 200
+
+
+def test_shared_assets(qapp, tmp_path) -> None:
+    from PySide6 import QtGui
+    from build_report import CacheStats
+    from card_objects import Deck, File
+
+    src = QtGui.QImage(32, 32, QtGui.QImage.Format_RGB32)
+    src.fill(QtGui.QColor(0, 255, 0))
+    src.save(str(tmp_path / "art.png"))
+    deck = Deck()
+    deck.deck_dirname = str(tmp_path)
+    for name in ("a", "b"):
+        f = File(name)
+        f.load_file(deck, "art.png", decode=False)
+        f.store_inline = True
+        deck.files.append(f)
+    f = File("c")
+    f.load_file(deck, "art.png", decode=False)
+    deck.files.append(f)
+    filename = str(tmp_path / "shared.deck")
+    assert deck.save(filename)
+    with open(filename) as fp:
+        text = fp.read()
+    # the inline copies are stored in full, as earlier versions read them
+    assert 'sha256="' not in text
+    assert text.count("</file>") == 2
+
+    loaded = Deck()
+    stats = CacheStats("file decodes")
+    assert loaded.load(filename, stats=stats)
+    assert (stats.hits, stats.misses) == (2, 1)
+    assert [f.store_inline for f in loaded.files] == [True, True, False]
+    assert len(set(f.content_hash() for f in loaded.files)) == 1
+    # one decode is shared by all three
+    assert len(set(f.image.cacheKey() for f in loaded.files)) == 1
+    assert [[f.name for f in group] for group in loaded.duplicate_files()] == [["a", "b", "c"]]
+    assert loaded.files[1].image.pixelColor(0, 0) == QtGui.QColor(0, 255, 0)
+
+    # a copy referring to the data of an earlier file by its hash is still read
+    start = text.index('<file filename="art.png" name="b"')
+    end = text.index("</file>", start) + len("</file>")
+    digest = loaded.files[0].content_hash()
+    with open(filename, "w") as fp:
+        fp.write(
+            text[:start] + f'<file name="b" filename="art.png" sha256="{digest}"/>' + text[end:]
+        )
+    loaded = Deck()
+    assert loaded.load(filename)
+    assert loaded.files[1].store_inline
+    assert loaded.files[1].image.pixelColor(0, 0) == QtGui.QColor(0, 255, 0)
+
+
+def test_synthetic_deck_shape(qapp, tmp_path) -> None:
+    from card_objects import Deck, TextRender
+    from synthetic_deck import build_synthetic_deck
+
+    media = tmp_path / "media"
+    media.mkdir()
+    deck = build_synthetic_deck(
+        num_cards=4,
+        text_density=3,
+        macro_density=0.0,
+        icon_density=2,
+        halo_styles=2,
+        external_dir=str(media),
+    )
+    texts = [
+        r.text for card in deck.base for r in card.top_face.renderables if isinstance(r, TextRender)
+    ]
+    assert texts and all(t.count("{I:") == 2 and ("{c" not in t) for t in texts)
+    assert [s.linestyle for s in deck.styles[1:4]] == ["halo", "halo", "solid"]
+    assert sorted(os.listdir(str(media))) == [f"file_{i}.png" for i in range(4)]
+    filename = str(tmp_path / "external.deck")
+    assert deck.save(filename)
+    loaded = Deck()
+    assert loaded.load(filename)
+    assert not any(f.store_inline for f in loaded.files)
+    assert loaded.files[0].image.width() == 64
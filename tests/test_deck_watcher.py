@@ -0,0 +1,51 @@
+def test_deck_watcher(qapp, tmp_path) -> None:
+    from PySide6 import QtGui
+    from card_objects import Deck
+    from card_render import Renderer
+    from deck_watcher import DeckWatcher
+    from synthetic_deck import build_synthetic_deck
+
+    # a deck with one media file on disk, the others inline
+    deck = build_synthetic_deck(num_cards=4)
+    art = deck.files[0]
+    art.image.save(str(tmp_path / "file_0.png"))
+    art.store_inline = False
+    filename = str(tmp_path / "test.deck")
+    assert deck.save(filename)
+
+    deck = Deck()
+    assert deck.load(filename, reduce_resolution=True)
+    outdir = tmp_path / "generated_cards"
+    outdir.mkdir()
+    render = Renderer(deck, str(outdir))
+    render.render_deck()
+    updates = list()
+    watcher = DeckWatcher(filename, render, on_update=updates.append)
+    assert str(tmp_path / "file_0.png") in watcher.watcher.files()
+
+    # a media file change renders the faces using the file
+    users = list(render.face_digests)
+    img = QtGui.QImage(64, 64, QtGui.QImage.Format_RGBA8888)
+    img.fill(QtGui.QColor(1, 2, 3))
+    img.save(str(tmp_path / "file_0.png"))
+    written = watcher.refresh([str(tmp_path / "file_0.png")])
+    assert 0 < len(written) < len(users)
+    assert updates == [render]
+
+    # a deck change renders the changed face and reuses the decoded files
+    edit = Deck()
+    assert edit.load(filename)
+    edit.base[2].top_face.renderables[0].text = "Changed"
+    assert edit.save(filename)
+    image = deck.files[1].image
+    assert watcher.refresh([filename]) == ["card_top_002.png"]
+    assert watcher.deck is not deck
+    assert watcher.deck.files[1].image.cacheKey() == image.cacheKey()
+
+    # the files of removed cards are removed
+    edit.base.pop()
+    assert edit.save(filename)
+    watcher.refresh([filename])
+    assert not (outdir / "card_top_004.png").exists()
+    assert (outdir / "card_top_003.png").exists()
+    watcher.render.close()
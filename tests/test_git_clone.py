@@ -0,0 +1,111 @@
+import os
+
+
+def make_repo(path: str) -> str:
+    from dulwich import porcelain
+
+    porcelain.init(path)
+    names = list()
+    for i in range(4):
+        name = os.path.join(path, f"card{i}.txt")
+        with open(name, "w") as fp:
+            fp.write("card " * (100 * i + 1))
+        names.append(name)
+    porcelain.add(path, names)
+    porcelain.commit(path, message=b"deck", author=b"a <a@b.c>", committer=b"a <a@b.c>")
+    return path
+
+
+def test_clone_progress() -> None:
+    from git_clone import CloneProgress
+
+    seen = list()
+    stream = CloneProgress(lambda percent, text: seen.append((percent, text)))
+    # lines can be split across writes
+    stream.write(b"Counting objects: 100% (10/10), done.\nCompressing obj")
+    stream.write(b"ects:  50% (2/4)\rReceiving objects:  50% (5/10)\r")
+    stream.write(b"remote: Total 10 (delta 1)\nResolving deltas: 100% (1/1), done.\n")
+    assert [s[0] for s in seen] == [10, 15, 55, 55, 100]
+    assert seen[2][1] == "Receiving objects:  50% (5/10)"
+
+
+def test_clone_worker(qapp, tmp_path, monkeypatch) -> None:
+    from PySide6 import QtCore
+    import git_clone
+    from git_clone import CloneWorker, clone_repo
+
+    source = make_repo(str(tmp_path / "source"))
+
+    def clone(destination: str, cancel: bool):
+        os.makedirs(destination)
+        worker = CloneWorker(source, destination)
+        progress, results = list(), list()
+        worker.progress.connect(lambda percent, text: progress.append(percent))
+        worker.finished.connect(results.append)
+        loop = QtCore.QEventLoop()
+        worker.finished.connect(loop.quit)
+        QtCore.QTimer.singleShot(10000, loop.quit)
+        if cancel:
+            worker.cancel()
+        worker.start()
+        loop.exec()
+        return progress, results
+
+    progress, results = clone(str(tmp_path / "clone"), False)
+    assert results == [""]
+    assert progress and (progress == sorted(progress))
+    assert os.path.isfile(str(tmp_path / "clone" / "card3.txt"))
+
+    # a cancelled clone leaves the destination empty
+    progress, results = clone(str(tmp_path / "cancelled"), True)
+    assert results == ["The clone was cancelled"]
+    assert os.listdir(str(tmp_path / "cancelled")) == []
+
+    # cancelled after the last progress line, the finished clone is removed
+    def clone_then_cancel(url, destination, stream):
+        error = clone_repo(url, destination, stream)
+        stream.cancelled.set()
+        return error
+
+    monkeypatch.setattr(git_clone, "clone_repo", clone_then_cancel)
+    progress, results = clone(str(tmp_path / "late"), False)
+    assert progress
+    assert results == ["The clone was cancelled"]
+    assert os.listdir(str(tmp_path / "late")) == []
+
+
+def test_cached_clone(tmp_path) -> None:
+    from dulwich import porcelain
+    from git_clone import cache_path, cached_clone
+
+    work = make_repo(str(tmp_path / "work"))
+    first = porcelain.open_repo(work).head().decode()
+    porcelain.tag_create(work, b"v1")
+    bare = str(tmp_path / "deck.git")
+    porcelain.clone(work, bare, bare=True, errstream=open(os.devnull, "wb")).close()
+    url = "file://" + bare
+    cache = str(tmp_path / "cache")
+
+    # a shallow checkout of the remote HEAD
+    path, commit = cached_clone(url, cache)
+    assert (path, commit) == (cache_path(cache, url), first)
+    assert porcelain.open_repo(path).get_shallow() == {first.encode()}
+
+    # a new commit is fetched into the same checkout
+    with open(os.path.join(work, "card0.txt"), "w") as fp:
+        fp.write("changed")
+    porcelain.add(work, [os.path.join(work, "card0.txt")])
+    porcelain.commit(work, message=b"edit", author=b"a <a@b.c>", committer=b"a <a@b.c>")
+    porcelain.push(work, bare, "refs/heads/master", errstream=open(os.devnull, "wb"))
+    path, second = cached_clone(url, cache)
+    assert second != first
+    with open(os.path.join(path, "card0.txt")) as fp:
+        assert fp.read() == "changed"
+
+    # pinned to a branch, a tag and a commit outside of the shallow history
+    assert cached_clone(url, cache, ref="master")[1] == second
+    assert cached_clone(url, cache, ref="v1")[1] == first
+    assert cached_clone(url, cache, ref=first)[1] == first
+    with open(os.path.join(path, "card0.txt")) as fp:
+        assert fp.read() == "card "
+    assert os.listdir(cache) == [os.path.basename(path)]
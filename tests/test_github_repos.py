@@ -0,0 +1,61 @@
+import http.server
+import json
+import threading
+
+
+class SearchHandler(http.server.BaseHTTPRequestHandler):
+    # a stand-in for the GitHub search API, with an ETag
+    etag = '"v1"'
+    requests = list()
+
+    def do_GET(self):
+        self.requests.append(self.headers.get("If-None-Match"))
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        items = [dict(full_name="someone/deck", clone_url="https://example.com/deck.git")]
+        data = json.dumps(dict(items=items)).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_fetch_repos(qapp, tmp_path) -> None:
+    from PySide6 import QtCore
+    from github_repos import GithubRepoQuery, fetch_repos
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), SearchHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}/search"
+    cache = str(tmp_path / "cache" / "repos.json")
+    expected = [("someone/deck", "https://example.com/deck.git")]
+
+    # the first query is cached, the second one is revalidated
+    assert fetch_repos(url, cache, timeout=5) == expected
+    assert fetch_repos(url, cache, timeout=5) == expected
+    assert SearchHandler.requests == [None, '"v1"']
+
+    # the query runs on a worker thread and reports back on the Qt thread
+    query = GithubRepoQuery(url=url, cache_file=cache, timeout=5)
+    results = list()
+    loop = QtCore.QEventLoop()
+    query.finished.connect(results.append)
+    query.finished.connect(loop.quit)
+    QtCore.QTimer.singleShot(10000, loop.quit)
+    query.start()
+    loop.exec()
+    assert results == [expected]
+
+    # the cached list is used when the server is gone
+    server.shutdown()
+    server.server_close()
+    assert fetch_repos(url, cache, timeout=1) == expected
+    assert fetch_repos(url, str(tmp_path / "none.json"), timeout=1) == []
@@ -0,0 +1,44 @@
+import pytest
+
+
+def test_imposition() -> None:
+    from imposition import Imposition
+
+    # the 2x2 layout of a letter page at 300 dpi spreads the free space evenly
+    page = (2466, 3216)
+    card = (945, 1535)
+    grid = Imposition(page, card, columns=2, rows=2)
+    xspace = (page[0] - 2 * card[0]) / 3
+    yspace = (page[1] - 2 * card[1]) / 3
+    assert grid.slots()[3] == pytest.approx((2 * xspace + card[0], 2 * yspace + card[1]))
+
+    # backs are mirrored around the long or short edge
+    for duplex in ("long", "short", "none"):
+        grid = Imposition(page, card, columns=2, rows=1, gutter=10, duplex=duplex)
+        front = grid.slots()
+        back = grid.slots(back=True)
+        if duplex == "long":
+            assert back[0].x == front[1].x and back[0].y == front[0].y
+        elif duplex == "short":
+            assert back[0].x == front[0].x and back[0].y == page[1] - front[0].y - card[1]
+        else:
+            assert back == front
+
+    # fit as many cards as possible, the grid is centered
+    grid = Imposition((100, 100), (30, 40), gutter=5)
+    assert (grid.columns, grid.rows) == (3, 2)
+    assert grid.slots()[0] == (0, 7.5)
+    assert grid.slots()[-1] == (70, 52.5)
+
+    with pytest.raises(ValueError):
+        Imposition((100, 100), (30, 40), columns=4, rows=1, gutter=0)
+    with pytest.raises(ValueError):
+        Imposition(page, card, duplex="sideways")
+
+    # the cut marks are outside of the cards and inside of the page
+    grid = Imposition((100, 100), (30, 40), columns=2, rows=1, gutter=10, bleed=2)
+    marks = grid.cut_marks(length=5, offset=1)
+    assert (17, 24, 17, 29) in marks and (17, 71, 17, 76) in marks
+    assert (9, 32, 14, 32) in marks and (86, 68, 91, 68) in marks
+    for x0, y0, x1, y1 in marks:
+        assert not (14 < (x0 + x1) / 2 < 86 and 29 < (y0 + y1) / 2 < 71)
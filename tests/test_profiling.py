@@ -0,0 +1,37 @@
+import json
+
+
+def test_profile_render(qapp, tmp_path) -> None:
+    from card_render import Renderer
+    from profiling import Profiler, profile_span
+    from synthetic_deck import build_synthetic_deck
+
+    deck = build_synthetic_deck(num_cards=3, renderables_per_face=3)
+    render = Renderer(deck, str(tmp_path))
+    render.pad_size = 8
+    render.profiler = Profiler()
+    try:
+        with profile_span(render.profiler, "render_deck", "stage"):
+            render.render_deck()
+    finally:
+        render.close()
+
+    profiler = render.profiler
+    faces = profiler.spans("face")
+    # the synthetic deck adds the reference card
+    assert sorted(e["name"] for e in faces) == sorted(render.face_digests)
+    steps = {name: count for name, _, _, count in profiler.totals("step")}
+    for step in ("paint_face", "pad_image", "img.save"):
+        assert steps[step] + steps.get("link_file", 0) == len(faces)
+    assert profiler.spans("renderable")
+    # the steps are within the faces, and the faces within the stage
+    stage = profiler.spans("stage")[0]
+    assert all(stage["ts"] <= e["ts"] <= stage["ts"] + stage["dur"] for e in faces)
+    assert profiler.summary(top=2)[-1].startswith("  card_")
+
+    filename = str(tmp_path / "profile.json")
+    profiler.write(filename)
+    with open(filename) as fp:
+        trace = json.load(fp)
+    assert {e["ph"] for e in trace["traceEvents"]} == {"M", "X"}
+    assert all("cpu_ms" in e["args"] for e in trace["traceEvents"] if e["ph"] == "X")
@@ -0,0 +1,156 @@
+import json
+import pickle
+
+
+def test_render_plan(qapp, tmp_path) -> None:
+    from PySide6 import QtGui
+    from card_objects import TextRender
+    from card_render import Renderer
+    from render_plan import InlineImage, StyleSpec, TextOp, TextRun, compile_deck, plan_to_json
+    from synthetic_deck import build_synthetic_deck
+
+    deck = build_synthetic_deck(num_cards=3)
+    text = TextRender()
+    text.text = "{cN}{s:style_1}a{I:image_0:20:-2}"
+    deck.base[1].top_face.renderables.append(text)
+    plan = compile_deck(deck)
+    assert len(plan.faces) == 2 * 4  # and the reference card
+    assert pickle.loads(pickle.dumps(plan)) == plan
+    json.dumps(plan_to_json(plan))
+    # the deck is not renumbered by compiling
+    assert [r.order for r in deck.base[0].top_face.renderables][:2] == [0.0, 1.0]
+
+    face = plan.faces[2]
+    # the text box added last is on top
+    op = [op for op in face.ops if isinstance(op, TextOp)][-1]
+    assert op.runs[0] == TextRun("2", None)
+    assert op.runs[1].text == "a" and op.runs[1].style == StyleSpec.from_style(deck.styles[2])
+    assert isinstance(op.runs[2], InlineImage) and op.runs[2].size[0] == 20
+    assert [o.z for o in face.ops] == sorted(o.z for o in face.ops)
+
+    # the editor scene and the plan draw the same pixels
+    renderer = Renderer(deck, str(tmp_path))
+    card = deck.base[1]
+    renderer.build_card_face_scene(card, "top")
+    renderer.render("top", 0)
+    renderer.build_plan_scene(face)
+    renderer.render("top", 1)
+    renderer.close()
+    editor = QtGui.QImage(str(tmp_path / "card_top_000.png"))
+    compiled = QtGui.QImage(str(tmp_path / "card_top_001.png"))
+    assert editor == compiled
+
+
+def test_shared_faces(qapp, tmp_path) -> None:
+
+    from card_objects import RectRender
+    from card_render import Renderer
+    from synthetic_deck import build_synthetic_deck
+
+    # three cards with an empty back
+    deck = build_synthetic_deck(num_cards=4)
+    for card in deck.base[:3]:
+        card.bot_face.renderables = list()
+    renderer = Renderer(deck, str(tmp_path))
+    renderer.render_deck()
+    digests = renderer.face_digests
+    assert digests["card_bot_000.png"] == digests["card_bot_002.png"]
+    assert digests["card_bot_000.png"] != digests["card_bot_003.png"]
+    backs = [(tmp_path / "card_bot_{:03}.png".format(n)).read_bytes() for n in range(4)]
+    assert backs[0] == backs[1] == backs[2] != backs[3]
+
+    # rendering one card again does not change the cards it was shared with
+    deck.base[1].bot_face.renderables.append(RectRender())
+    renderer.render_deck(1)
+    renderer.close()
+    assert (tmp_path / "card_bot_000.png").read_bytes() == backs[0]
+    assert (tmp_path / "card_bot_001.png").read_bytes() != backs[0]
+
+
+def test_painter_backend(qapp, tmp_path) -> None:
+    from PySide6 import QtGui
+    from card_render import Renderer
+    import numpy
+    from render_plan import compile_deck
+    from synthetic_deck import build_synthetic_deck
+
+    def pixels(img):
+        img = img.convertToFormat(QtGui.QImage.Format_RGBA8888)
+        data = numpy.frombuffer(img.constBits(), numpy.uint8, img.sizeInBytes())
+        return data.reshape(img.height(), img.bytesPerLine()).astype(int)
+
+    # halos, inline images, rotations and art drawn at reduced resolution
+    deck = build_synthetic_deck(num_cards=6, halo_styles=2, icon_density=2)
+    plan = compile_deck(deck)
+    renderer = Renderer(deck, str(tmp_path))
+    try:
+        assert renderer.backend == "painter"
+        for max_image_scale in (None, 0.25):
+            renderer.max_image_scale = max_image_scale
+            for face in plan.faces:
+                renderer.backend = "scene"
+                scene = pixels(renderer.render_face_image(face))
+                renderer.backend = "painter"
+                painter = pixels(renderer.render_face_image(face))
+                assert numpy.abs(scene - painter).max() <= 2
+    finally:
+        renderer.close()
+    # the headless renderer only makes a scene when one is used
+    renderer = Renderer(deck, str(tmp_path))
+    renderer.render_deck()
+    renderer.close()
+    assert renderer._scene is None
+
+
+def test_threaded_render(qapp, tmp_path) -> None:
+    from card_render import Renderer
+    from synthetic_deck import build_synthetic_deck
+
+    deck = build_synthetic_deck(num_cards=8, halo_styles=2, icon_density=2)
+    files = dict()
+    for workers in (1, 3):
+        outdir = tmp_path / str(workers)
+        outdir.mkdir()
+        renderer = Renderer(deck, str(outdir))
+        renderer.pad_size = 8
+        renderer.max_workers = workers
+        try:
+            assert renderer.render_workers(20) == workers
+            renderer.render_deck()
+        finally:
+            renderer.close()
+        files[workers] = {p.name: p.read_bytes() for p in outdir.iterdir()}
+    # the same card files, shared faces are linked once their file is written
+    assert files[1] == files[3]
+    assert renderer.face_counts["linked"] > 0
+
+
+def test_threaded_render_decodes_used_files(qapp, tmp_path) -> None:
+    from PySide6 import QtGui
+    from card_objects import Deck, File
+    from card_render import Renderer
+    from render_plan import compile_deck
+    from synthetic_deck import build_synthetic_deck
+
+    deck = build_synthetic_deck(num_cards=4, num_files=2, file_size=256)
+    unused = File("unused")
+    unused.image = QtGui.QImage(256, 256, QtGui.QImage.Format_RGB32)
+    unused.image.fill(QtGui.QColor(0, 0, 255))
+    unused.store_inline = True
+    deck.files.append(unused)
+    filename = str(tmp_path / "synthetic.deck")
+    assert deck.save(filename)
+
+    loaded = Deck()
+    assert loaded.load(filename, reduce_resolution=True)
+    plan = compile_deck(loaded)
+    renderer = Renderer(loaded, str(tmp_path))
+    renderer.max_workers = 2
+    try:
+        renderer.render_faces(list(plan.faces))
+    finally:
+        renderer.close()
+    # the art of the faces keeps its reduced decode, the unused file is not decoded
+    assert all(f.is_decoded() for f in loaded.files[:2])
+    assert any(f.is_reduced() for f in loaded.files[:2])
+    assert not loaded.find_file("unused").is_decoded()
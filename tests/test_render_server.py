@@ -0,0 +1,87 @@
+import os
+import threading
+import urllib.error
+import urllib.request
+
+
+def test_render_server(qapp, tmp_path, monkeypatch) -> None:
+    from PySide6 import QtGui
+    from card_objects import Deck
+    import render_server
+    from render_server import DeckCache, RenderServer
+    from synthetic_deck import build_synthetic_deck
+
+    for name in ("a", "b"):
+        assert build_synthetic_deck(num_cards=3).save(str(tmp_path / f"{name}.deck"))
+    decks = DeckCache(max_decks=1)
+    server = RenderServer(("127.0.0.1", 0), decks, default_deck=str(tmp_path / "a.deck"))
+
+    def get(query: str):
+        # the request is sent from a thread, the server renders on this one
+        result = dict()
+
+        def fetch():
+            url = f"http://127.0.0.1:{server.server_port}{query}"
+            try:
+                with urllib.request.urlopen(url, timeout=30) as response:
+                    result["type"] = response.headers["Content-Type"]
+                    result["data"] = response.read()
+            except urllib.error.HTTPError as e:
+                result["status"] = e.code
+
+        thread = threading.Thread(target=fetch)
+        thread.start()
+        server.handle_request()
+        thread.join()
+        return result
+
+    result = get("/render?card=1&face=bot&scale=0.5")
+    assert result["type"] == "image/png"
+    img = QtGui.QImage.fromData(result["data"])
+    assert (img.width(), img.height()) == (412, 712)
+    assert get("/render?card=1&format=jpg")["type"] == "image/jpeg"
+    assert get("/render?card=9")["status"] == 404
+    assert get("/render?card=1&face=side")["status"] == 400
+    assert get("/render?card=1&deck=" + str(tmp_path / "c.deck"))["status"] == 404
+    # only the decks next to the served deck
+    assert get("/render?card=1&deck=../a.deck")["status"] == 403
+    assert get("/render?card=1&deck=" + str(tmp_path.parent / "a.deck"))["status"] == 403
+
+    # the deck is read again when it changes
+    first = get("/render?card=1")["data"]
+    deck = Deck()
+    assert deck.load(str(tmp_path / "a.deck"))
+    deck.base[1].top_face.renderables = list()
+    assert deck.save(str(tmp_path / "a.deck"))
+    assert get("/render?card=1")["data"] != first
+
+    # a deck that can not be read again keeps the last good deck and is not re-read
+    # on every request
+    with open(str(tmp_path / "a.deck"), "w") as fp:
+        fp.write("<deck>")
+    assert "data" in get("/render?card=1")
+    loaded = decks.decks[str(tmp_path / "a.deck")]
+    assert not loaded.changed_files()
+
+    # other failures are server errors
+    def fail(*args):
+        raise RuntimeError("render failure")
+
+    monkeypatch.setattr(render_server, "render_card", fail)
+    assert get("/render?card=1")["status"] == 500
+    monkeypatch.undo()
+
+    # only one deck is kept, a deck preloaded through a symlinked directory is the
+    # deck of the requests
+    link = tmp_path / "link"
+    link.symlink_to(tmp_path, target_is_directory=True)
+    deck = Deck()
+    assert deck.load(str(link / "b.deck"))
+    loaded = decks.add(str(link / "b.deck"), deck)
+    assert list(decks.decks) == [os.path.realpath(tmp_path / "b.deck")]
+    assert "data" in get("/render?card=0&deck=" + str(tmp_path / "b.deck"))
+    assert "data" in get("/render?card=0&deck=link/b.deck")
+    assert list(decks.decks) == [os.path.realpath(tmp_path / "b.deck")]
+    assert decks.decks[os.path.realpath(tmp_path / "b.deck")] is loaded
+    server.server_close()
+    decks.close()
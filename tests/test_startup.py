@@ -0,0 +1,48 @@
+import json
+import subprocess
+import sys
+from typing import List
+
+import pytest
+
+# The entry points do not import the modules they only need later, see
+# benchmarks/bench_startup.py for their import times.
+DEFERRED = ("PySide6", "dulwich", "numpy", "requests", "http.server")
+
+
+def imported(code: str, names: tuple) -> List[str]:
+    # the modules of names that are imported after running code in a new interpreter
+    code += "\nimport json, sys\n"
+    code += f"print(json.dumps([n for n in {names!r} if n in sys.modules]))\n"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def test_build_deck_version() -> None:
+    startup = imported("pass", DEFERRED)
+    modules = imported(
+        "import sys\n"
+        "sys.argv = ['build_deck', '--version']\n"
+        "from heresycardbuilder.build_deck import run\n"
+        "try:\n"
+        "    run()\n"
+        "except SystemExit:\n"
+        "    pass\n",
+        DEFERRED,
+    )
+    assert modules == startup
+
+
+def test_editor_imports() -> None:
+    # the editor ui module is generated by the package build
+    pytest.importorskip("ui_card_editor_main")
+    names = ("dulwich", "requests")
+    startup = imported("pass", names)
+    modules = imported(
+        "import os, sys\n"
+        "import heresycardbuilder\n"
+        "sys.path.append(os.path.dirname(heresycardbuilder.__file__))\n"
+        "import card_editor\n",
+        names,
+    )
+    assert modules == startup
@@ -0,0 +1,48 @@
+def test_pack_cards() -> None:
+    from tts_packer import MAX_COLUMNS, MAX_ROWS, SheetLayout, pack_cards, pow2_ceil, pow2_floor
+
+    card = (825, 1425)
+    # a full sheet is the largest grid
+    (layout,) = pack_cards(70, card)
+    assert (layout.columns, layout.rows, layout.size) == (MAX_COLUMNS, MAX_ROWS, (4125, 4987))
+    assert layout.scale(card) == 0.5
+    # the last sheet is no larger than its cards need
+    layouts = pack_cards(141, card)
+    assert len(layouts) == 3
+    assert sum(layout.capacity for layout in layouts) == 141
+    assert layouts[-1].wasted_texels(141 - 2 * layouts[0].capacity) < layouts[-1].texels // 10
+
+    # power of two textures, several smaller sheets use fewer texels than one 8192x8192
+    layouts = pack_cards(70, card, max_texture=8192, power_of_two=True)
+    assert sum(layout.texels for layout in layouts) < 8192 * 8192
+    for layout in layouts:
+        assert layout.scale(card) >= 0.5
+        assert layout.size[0] == pow2_ceil(layout.size[0]) <= 8192
+        assert layout.size[1] == pow2_ceil(layout.size[1]) <= 8192
+    # reduce the cards to save more texels
+    smaller = pack_cards(70, card, max_texture=4096, min_scale=0.4, power_of_two=True)
+    assert sum(layout.texels for layout in smaller) < sum(layout.texels for layout in layouts)
+    assert all(0.4 <= layout.scale(card) < 0.5 for layout in smaller)
+    # the cells fill the texture
+    layout = SheetLayout(10, 7, (409.6, 4096 / 7), (4096, 4096))
+    assert layout.slot(69) == (3686, 3511, 410, 585)
+    # the cells cover the texture
+    layout = pack_cards(70, card)[0]
+    assert layout.cell[0] != int(layout.cell[0])
+    assert layout.wasted_texels(70) == 0
+
+    # an extra sheet is not worth a single cell
+    (layout,) = pack_cards(13, card)
+    assert (layout.columns, layout.rows) == (7, 2)
+    # no 1x1 sheets, except for a single (shared back) image
+    for num in (1, 2, 71, 141):
+        assert all(layout.capacity >= 2 for layout in pack_cards(num, card))
+    (layout,) = pack_cards(1, card, min_cells=1)
+    assert layout.capacity == 1
+
+    # a card larger than the texture is reduced
+    (layout,) = pack_cards(1, (20000, 30000), max_texture=4096)
+    assert layout.size[1] == 4096
+    assert layout.capacity == 2
+
+    assert (pow2_floor(5000), pow2_ceil(5000), pow2_ceil(4096)) == (4096, 8192, 4096)